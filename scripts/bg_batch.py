@@ -0,0 +1,103 @@
+"""Batch mode shared by remove_bg.py and remove_bg_advanced.py.
+
+A directory or glob of images is spread across a process pool, so hundreds
+of supplier logos pay the Python + PIL startup once per worker instead of once
+per image. Outputs that are already newer than their input are skipped.
+Every output is ``<stem>.png``, so inputs that differ only in extension
+(``a.png`` and ``a.jpg``) are refused before anything runs.
+"""
+
+import contextlib
+import glob
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".bmp", ".gif", ".tif", ".tiff")
+
+
+def is_batch_input(path):
+    return os.path.isdir(path) or glob.has_magic(path)
+
+
+def collect_inputs(path):
+    if os.path.isdir(path):
+        path = os.path.join(path, "*")
+    return sorted(
+        p for p in glob.glob(path)
+        if os.path.isfile(p) and os.path.splitext(p)[1].lower() in IMAGE_EXTENSIONS
+    )
+
+
+def output_path_for(input_path, output_dir):
+    name = os.path.splitext(os.path.basename(input_path))[0]
+    return os.path.join(output_dir, name + ".png")
+
+
+def find_output_conflicts(inputs, output_dir):
+    """{output path: [inputs]} for outputs that more than one input would write."""
+    sources = {}
+    for input_path in inputs:
+        sources.setdefault(os.path.normcase(output_path_for(input_path, output_dir)), []).append(input_path)
+    return {path: paths for path, paths in sources.items() if len(paths) > 1}
+
+
+def is_up_to_date(input_path, output_path):
+    try:
+        return os.path.getmtime(output_path) >= os.path.getmtime(input_path)
+    except OSError:
+        return False
+
+
+def _process_one(func, input_path, output_path, param):
+    # Keep worker chatter out of the summary; it is shown for failed images.
+    log = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(log):
+        ok = func(input_path, output_path, param)
+    return ok, time.perf_counter() - start, log.getvalue().strip()
+
+
+def run_batch(func, input_pattern, output_dir, param, workers=None):
+    """Run func(input, output, param) for every image. Returns True if none failed."""
+    inputs = collect_inputs(input_pattern)
+    if not inputs:
+        print(f"No images found in {input_pattern}")
+        return False
+
+    conflicts = find_output_conflicts(inputs, output_dir)
+    if conflicts:
+        for output_path, sources in conflicts.items():
+            print(f"{', '.join(os.path.basename(p) for p in sources)} would all be written to {output_path}")
+        print("Rename the inputs so their names differ without the extension.")
+        return False
+
+    os.makedirs(output_dir, exist_ok=True)
+    todo = []
+    skipped = 0
+    for input_path in inputs:
+        output_path = output_path_for(input_path, output_dir)
+        if is_up_to_date(input_path, output_path):
+            skipped += 1
+        else:
+            todo.append((input_path, output_path))
+
+    start = time.perf_counter()
+    failed = 0
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_process_one, func, src, dst, param) for src, dst in todo]
+            for (src, _), future in zip(todo, futures):
+                ok, seconds, log = future.result()
+                print(f"{seconds:7.2f}s  {'ok' if ok else 'FAILED':6}  {os.path.basename(src)}")
+                if not ok:
+                    failed += 1
+                    print(f"          {log}")
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"Processed {len(todo) - failed}, skipped {skipped} (up to date), failed {failed} "
+        f"in {elapsed:.2f}s -> {output_dir}"
+    )
+    return failed == 0
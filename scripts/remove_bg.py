@@ -1,7 +1,37 @@
+import argparse
 import sys
+
+import numpy as np
 from PIL import Image
 
+from bg_batch import is_batch_input, run_batch
+
 def remove_background(input_path, output_path, threshold=50):
+    try:
+        img = Image.open(input_path).convert("RGBA")
+        pixels = np.asarray(img)
+
+        # The background is dark, let's look at the corners to get average background color
+        corners = pixels[[0, 0, -1, -1], [0, -1, 0, -1], :3].astype(np.int64)
+        avg_bg = (corners.sum(axis=0) // 4).tolist()
+        print(f"Detected average background color: {avg_bg}")
+
+        # Distance from background color, for the whole image at once
+        diff = pixels[..., :3].astype(np.int64) - avg_bg
+        dist = np.sqrt((diff * diff).sum(axis=2))
+
+        result = pixels.copy()
+        result[dist < threshold] = 0  # Fully transparent
+
+        Image.fromarray(result, "RGBA").save(output_path, "PNG")
+        print(f"Successfully saved transparent logo to {output_path}")
+        return True
+    except Exception as e:
+        print(f"Error: {e}")
+        return False
+
+def remove_background_reference(input_path, output_path, threshold=50):
+    """Per-pixel implementation that remove_background() must match."""
     try:
         img = Image.open(input_path).convert("RGBA")
         datas = img.getdata()
@@ -38,10 +68,16 @@ def remove_background(input_path, output_path, threshold=50):
         return False
 
 if __name__ == "__main__":
-    if len(sys.argv) < 3:
-        print("Usage: python remove_bg.py <input> <output> [threshold]")
-    else:
-        in_path = sys.argv[1]
-        out_path = sys.argv[2]
-        thresh = int(sys.argv[3]) if len(sys.argv) > 3 else 50
-        remove_background(in_path, out_path, thresh)
+    parser = argparse.ArgumentParser(
+        usage="python remove_bg.py <input> <output> [threshold] [--workers N]",
+        description="<input> may also be a directory or glob; <output> is then a directory.",
+    )
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument("threshold", nargs="?", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=None, help="processes for batch mode (default: CPU count)")
+    args = parser.parse_args()
+
+    if is_batch_input(args.input):
+        sys.exit(0 if run_batch(remove_background, args.input, args.output, args.threshold, args.workers) else 1)
+    remove_background(args.input, args.output, args.threshold)
@@ -1,14 +1,106 @@
+import argparse
 import sys
+
+import numpy as np
 from PIL import Image, ImageFilter, ImageOps
 
+from bg_batch import is_batch_input, run_batch
+
+# BG is approximately [15, 23, 37]
+BG_R, BG_G, BG_B = 15, 23, 37
+
+# Alpha Clipping table for the refinement pass
+ALPHA_LOOKUP = [
+    0 if i < 150 else min(255, int(i * 1.2))  # Aggressive clipping of semi-transparent pixels, boost high alpha
+    for i in range(256)
+]
+
+_dist_table = None
+
+def _distance_table():
+    """Distance for every possible squared RGB distance.
+
+    Built with the same float pow as the per-pixel code; np.sqrt differs from
+    it in the last bit for a few values, which can flip a truncated alpha.
+    """
+    global _dist_table
+    if _dist_table is None:
+        _dist_table = np.array([d ** 0.5 for d in range(3 * 255 * 255 + 1)])
+    return _dist_table
+
+def _refine_and_save(img, output_path):
+    """Alpha refinement, crop and save shared by both implementations."""
+    # Refine Alpha Channel
+    alpha = img.getchannel('A')
+    # Median filter to remove specks
+    alpha = alpha.filter(ImageFilter.MedianFilter(3))
+    # MaxFilter (Dilation) to heal gaps
+    alpha = alpha.filter(ImageFilter.MaxFilter(3))
+    
+    # Alpha Clipping: Push low-alpha pixels to 0 and high-alpha to 255
+    # This eliminates the "halo" of semi-transparent dark pixels
+    alpha = alpha.point(ALPHA_LOOKUP)
+    
+    # Gaussian blur for subtle anti-aliasing
+    alpha = alpha.filter(ImageFilter.GaussianBlur(radius=0.5))
+    
+    img.putalpha(alpha)
+    
+    # Final Edge Clean: Remove any pixel at the edge that isn't gold
+    # (Already handled by decision logic, but this is a final pass)
+    
+    # Crop to contents
+    bbox = img.getbbox()
+    if bbox:
+        img = img.crop(bbox)
+        
+    img.save(output_path, "PNG")
+    print(f"Successfully saved pristine logo to {output_path}")
+    return True
+
 def remove_background_advanced(input_path, output_path, sensitivity=0.4):
+    try:
+        img = Image.open(input_path).convert("RGBA")
+        pixels = np.asarray(img)
+        result = pixels.copy()
+        result[..., 3] = 255  # Logo part
+
+        # Only dark pixels (brightness < 100) can be background or a faded edge.
+        # brightness < x is compared as r + g + b < 3x, exact for integer x.
+        rgb = pixels[..., :3].reshape(-1, 3)
+        total = rgb.sum(axis=1, dtype=np.int32)
+        dark = np.flatnonzero(total < 300)
+        r, g, b = (rgb[dark, i].astype(np.int32) for i in range(3))
+        total = total[dark]
+
+        # Distance to background color
+        dist = _distance_table()[(r - BG_R) ** 2 + (g - BG_G) ** 2 + (b - BG_B) ** 2]
+
+        # Chroma check: Gold/Orange has R > B and G > B
+        is_gold = (r > b + 15) & (g > b - 5)
+
+        # Main decision logic, same precedence as the per-pixel branches
+        clear = (dist < (60 * sensitivity)) & (total < 240)
+        edge = ~clear & ~is_gold
+
+        flat = result.reshape(-1, 4)
+        # Likely a dark edge or background shadow: fade out dark pixels that aren't gold
+        brightness = total[edge] / 3
+        alpha = np.clip((dist[edge] / (120 * sensitivity)) * 255, 0, 255).astype(np.int64)
+        flat[dark[edge], 3] = (alpha * (brightness / 255)).astype(np.int64)
+        flat[dark[clear]] = 0  # Clear background
+
+        return _refine_and_save(Image.fromarray(result, "RGBA"), output_path)
+    except Exception as e:
+        print(f"Error: {e}")
+        return False
+
+def remove_background_advanced_reference(input_path, output_path, sensitivity=0.4):
+    """Per-pixel implementation that remove_background_advanced() must match."""
     try:
         img = Image.open(input_path).convert("RGBA")
         width, height = img.size
         
-        # BG is approximately [15, 23, 37]
-        BG_R, BG_G, BG_B = 15, 23, 37
-        
         pixels = img.load()
         newData = []
         
@@ -41,48 +133,22 @@ def remove_background_advanced(input_path, output_path, sensitivity=0.4):
 
         img.putdata(newData)
         
-        # Refine Alpha Channel
-        alpha = img.getchannel('A')
-        # Median filter to remove specks
-        alpha = alpha.filter(ImageFilter.MedianFilter(3))
-        # MaxFilter (Dilation) to heal gaps
-        alpha = alpha.filter(ImageFilter.MaxFilter(3))
-        
-        # Alpha Clipping: Push low-alpha pixels to 0 and high-alpha to 255
-        # This eliminates the "halo" of semi-transparent dark pixels
-        lookup = []
-        for i in range(256):
-            if i < 150: # More aggressive clipping of semi-transparent pixels
-                lookup.append(0)
-            else:
-                lookup.append(min(255, int(i * 1.2))) # Boost high alpha
-        alpha = alpha.point(lookup)
-        
-        # Gaussian blur for subtle anti-aliasing
-        alpha = alpha.filter(ImageFilter.GaussianBlur(radius=0.5))
-        
-        img.putalpha(alpha)
-        
-        # Final Edge Clean: Remove any pixel at the edge that isn't gold
-        # (Already handled by decision logic, but this is a final pass)
-        
-        # Crop to contents
-        bbox = img.getbbox()
-        if bbox:
-            img = img.crop(bbox)
-            
-        img.save(output_path, "PNG")
-        print(f"Successfully saved pristine logo to {output_path}")
-        return True
+        return _refine_and_save(img, output_path)
     except Exception as e:
         print(f"Error: {e}")
         return False
 
 if __name__ == "__main__":
-    if len(sys.argv) < 3:
-        print("Usage: python remove_bg_advanced.py <input> <output> [sensitivity]")
-    else:
-        in_path = sys.argv[1]
-        out_path = sys.argv[2]
-        sens = float(sys.argv[3]) if len(sys.argv) > 3 else 0.4
-        remove_background_advanced(in_path, out_path, sens)
+    parser = argparse.ArgumentParser(
+        usage="python remove_bg_advanced.py <input> <output> [sensitivity] [--workers N]",
+        description="<input> may also be a directory or glob; <output> is then a directory.",
+    )
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument("sensitivity", nargs="?", type=float, default=0.4)
+    parser.add_argument("--workers", type=int, default=None, help="processes for batch mode (default: CPU count)")
+    args = parser.parse_args()
+
+    if is_batch_input(args.input):
+        sys.exit(0 if run_batch(remove_background_advanced, args.input, args.output, args.sensitivity, args.workers) else 1)
+    remove_background_advanced(args.input, args.output, args.sensitivity)
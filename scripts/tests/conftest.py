@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The scripts import each other by plain name (see remove_bg.py).
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+if SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIR)
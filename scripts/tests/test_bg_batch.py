@@ -0,0 +1,37 @@
+"""Batch mode refuses inputs whose outputs would overwrite each other."""
+
+import numpy as np
+from PIL import Image
+
+from bg_batch import find_output_conflicts, run_batch
+from remove_bg import remove_background
+
+
+def _image(path):
+    Image.fromarray(np.zeros((4, 4, 3), dtype=np.uint8)).save(path)
+
+
+def test_inputs_differing_only_in_extension_are_refused(tmp_path, capsys):
+    inputs = tmp_path / "in"
+    inputs.mkdir()
+    for name in ("a.png", "a.jpg", "b.png"):
+        _image(inputs / name)
+    out = tmp_path / "out"
+
+    assert find_output_conflicts(sorted(map(str, inputs.iterdir())), str(out)) == {
+        str(out / "a.png"): [str(inputs / "a.jpg"), str(inputs / "a.png")]
+    }
+    assert not run_batch(remove_background, str(inputs), str(out), 50, workers=1)
+    assert "a.jpg, a.png would all be written to" in capsys.readouterr().out
+    assert not out.exists()  # nothing ran
+
+
+def test_distinct_names_are_processed(tmp_path):
+    inputs = tmp_path / "in"
+    inputs.mkdir()
+    for name in ("a.png", "b.jpg"):
+        _image(inputs / name)
+    out = tmp_path / "out"
+
+    assert run_batch(remove_background, str(inputs), str(out), 50, workers=1)
+    assert sorted(p.name for p in out.iterdir()) == ["a.png", "b.png"]
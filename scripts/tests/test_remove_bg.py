@@ -0,0 +1,47 @@
+"""The vectorized remove_background gives the same image as the per-pixel reference."""
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from remove_bg import remove_background, remove_background_reference
+
+
+def _save(tmp_path, pixels, name="input.png"):
+    path = tmp_path / name
+    Image.fromarray(pixels, "RGBA").save(path)
+    return path
+
+
+def _run(func, input_path, output_path, threshold):
+    assert func(input_path, output_path, threshold)
+    return np.asarray(Image.open(output_path))
+
+
+def _noisy_logo(seed=8):
+    """Random RGBA noise with a dark, slightly noisy background around it."""
+    rng = np.random.default_rng(seed)
+    pixels = rng.integers(0, 256, size=(48, 64, 4), dtype=np.uint8)
+    background = np.array([15, 23, 37]) + rng.integers(-30, 31, size=(48, 64, 3))
+    border = np.ones((48, 64), dtype=bool)
+    border[12:36, 16:48] = False
+    pixels[border, :3] = np.clip(background[border], 0, 255)
+    return pixels
+
+
+@pytest.mark.parametrize("threshold", [0, 50, 120])
+def test_matches_reference(tmp_path, threshold):
+    source = _save(tmp_path, _noisy_logo())
+    fast = _run(remove_background, source, tmp_path / "fast.png", threshold)
+    reference = _run(remove_background_reference, source, tmp_path / "reference.png", threshold)
+    np.testing.assert_array_equal(fast, reference)
+    if threshold:
+        assert (fast[..., 3] == 0).any() and (fast[..., 3] != 0).any()
+
+
+def test_matches_reference_on_plain_noise(tmp_path):
+    pixels = np.random.default_rng(0).integers(0, 256, size=(31, 17, 4), dtype=np.uint8)
+    source = _save(tmp_path, pixels)
+    fast = _run(remove_background, source, tmp_path / "fast.png", 200)
+    reference = _run(remove_background_reference, source, tmp_path / "reference.png", 200)
+    np.testing.assert_array_equal(fast, reference)
@@ -0,0 +1,51 @@
+"""The vectorized remove_background_advanced gives the same image as the per-pixel reference."""
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from remove_bg_advanced import BG_B, BG_G, BG_R, remove_background_advanced, remove_background_advanced_reference
+from test_remove_bg import _noisy_logo, _run, _save
+
+
+def _filled(rgb, alpha=255, size=(20, 30)):
+    pixels = np.empty(size + (4,), dtype=np.uint8)
+    pixels[..., :3] = rgb
+    pixels[..., 3] = alpha
+    return pixels
+
+
+def _gold_noise(seed=9):
+    """Bright gold pixels only, so nothing is background or a dark edge."""
+    rng = np.random.default_rng(seed)
+    pixels = _filled((0, 0, 0), size=(24, 40))
+    pixels[..., 0] = rng.integers(180, 256, size=(24, 40))
+    pixels[..., 1] = rng.integers(120, 200, size=(24, 40))
+    pixels[..., 2] = rng.integers(0, 60, size=(24, 40))
+    return pixels
+
+
+IMAGES = {
+    "noisy_logo": _noisy_logo(),
+    "random_noise": np.random.default_rng(1).integers(0, 256, size=(33, 21, 4), dtype=np.uint8),
+    "transparent_input": _filled((200, 150, 40), alpha=0),
+    "background_only": _filled((BG_R, BG_G, BG_B)),
+    "no_background": _gold_noise(),
+}
+
+
+@pytest.mark.parametrize("sensitivity", [0.4, 1.0])
+@pytest.mark.parametrize("name", IMAGES)
+def test_matches_reference(tmp_path, name, sensitivity):
+    source = _save(tmp_path, IMAGES[name])
+    fast = _run(remove_background_advanced, source, tmp_path / "fast.png", sensitivity)
+    reference = _run(remove_background_advanced_reference, source, tmp_path / "reference.png", sensitivity)
+    np.testing.assert_array_equal(fast, reference)
+
+
+def test_edge_cases_take_the_expected_branch(tmp_path):
+    cleared = _run(remove_background_advanced, _save(tmp_path, IMAGES["background_only"]), tmp_path / "bg.png", 0.4)
+    assert cleared.shape == (20, 30, 4) and not cleared[..., 3].any()  # nothing left to crop to
+
+    kept = _run(remove_background_advanced, _save(tmp_path, IMAGES["no_background"]), tmp_path / "gold.png", 0.4)
+    assert kept.shape == (24, 40, 4) and (kept[..., 3] == 255).all()
@@ -0,0 +1,252 @@
+"""Benchmarks of the unlock/merge engines on synthetic rozpočet workbooks.
+
+Every (workbook, operation, engine) case runs in a fresh interpreter so peak
+RSS belongs to that case alone. Results are written as JSON and can be
+compared with an earlier run::
+
+    python bench.py --profile small --profile medium -o baseline.json
+    python bench.py --profile small --profile medium --compare baseline.json
+
+``--compare`` exits with status 1 when a case got slower or bigger than the
+tolerance allows. ``--zip-level`` repeats the unlock and merge cases with
+that output compression level; ``save_s`` shows what it does to the save
+stage (``rewrite`` for the xml unlock)::
+
+    python bench.py --profile medium --zip-level 1 --zip-level 0
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+UNLOCK_API_DIR = os.path.join(HERE, os.pardir, "excel_unlock_api")
+MERGE_TOOL_DIR = os.path.join(HERE, os.pardir, "excel_merge_tool")
+for _path in (HERE, UNLOCK_API_DIR, MERGE_TOOL_DIR):
+    if _path not in sys.path:
+        sys.path.append(_path)
+
+from workbooks import PROFILES, WorkbookSpec, ensure_workbook  # noqa: E402
+
+# Compared metrics and whether a higher value is a regression.
+METRICS = ("wall_s", "peak_rss_mb", "output_bytes")
+
+
+def _peak_rss_mb(who: int) -> float:
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def list_cases(workers: list[int], zip_levels: list[int]) -> list[tuple[str, str, int, Optional[int]]]:
+    """(operation, engine, workers, zip level) for every engine the service and CLI offer."""
+    from processing import MERGE_ENGINES, UNLOCK_ENGINES, get_backend
+
+    single = [("unlock", engine) for engine in UNLOCK_ENGINES] + [("merge", engine) for engine in MERGE_ENGINES]
+    cases = [(operation, engine, 1, None) for operation, engine in single]
+    cases += [("merge", engine, n, None) for engine in MERGE_ENGINES if get_backend(engine).workers for n in workers if n > 1]
+    cases += [(operation, engine, 1, level) for level in zip_levels for operation, engine in single]
+    cases.append(("merge_final", "openpyxl", 1, None))
+    return cases
+
+
+def run_case(operation: str, engine: str, workers: int, zip_level: Optional[int], input_path: str, output_path: str) -> dict:
+    """Executed in the child interpreter."""
+    from processing import StageTimer, ZipOptions, merge_workbook, unlock_workbook
+
+    timer = StageTimer()
+    zip_options = ZipOptions(level=zip_level)
+    start = time.perf_counter()
+    if operation == "unlock":
+        unlock_workbook(input_path, output_path, engine, keep_vba=input_path.endswith(".xlsm"), timer=timer, zip_options=zip_options)
+    elif operation == "merge":
+        merge_workbook(input_path, output_path, engine, workers=workers, timer=timer, zip_options=zip_options)
+    else:
+        from merge_final import main
+
+        main([input_path, output_path, "--engine", engine])
+    wall = time.perf_counter() - start
+    save = timer.stages.get("save", timer.stages.get("rewrite"))
+
+    return {
+        "wall_s": round(wall, 3),
+        "save_s": round(save, 3) if save is not None else None,
+        "peak_rss_mb": round(_peak_rss_mb(resource.RUSAGE_SELF), 1),
+        "children_peak_rss_mb": round(_peak_rss_mb(resource.RUSAGE_CHILDREN), 1),
+        "output_bytes": os.path.getsize(output_path),
+    }
+
+
+def spawn_case(operation: str, engine: str, workers: int, zip_level: Optional[int], input_path: str, timeout: float) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        output_path = os.path.join(tmp, "out.xlsm" if operation == "unlock" else "out.xlsx")
+        level = "-" if zip_level is None else str(zip_level)
+        cmd = [sys.executable, os.path.abspath(__file__), "--run-case", operation, engine, str(workers), level, input_path, output_path]
+        try:
+            proc = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return {"error": f"timeout after {timeout:.0f}s"}
+        if proc.returncode != 0:
+            return {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit {proc.returncode}"}
+        # merge_final prints progress; the result is the last line.
+        return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def run_benchmarks(
+    specs: list[WorkbookSpec], workers: list[int], zip_levels: list[int], repeat: int, timeout: float, workdir: Optional[str]
+) -> dict:
+    import openpyxl
+
+    results = []
+    for spec in specs:
+        input_path = ensure_workbook(spec, workdir)
+        input_bytes = os.path.getsize(input_path)
+        for operation, engine, n, level in list_cases(workers, zip_levels):
+            runs = [spawn_case(operation, engine, n, level, input_path, timeout) for _ in range(repeat)]
+            ok = [r for r in runs if "error" not in r]
+            # Best of N: the least disturbed run is the most comparable one.
+            best = min(ok, key=lambda r: r["wall_s"]) if ok else runs[-1]
+            result = {
+                "workbook": spec.name,
+                "operation": operation,
+                "engine": engine,
+                "workers": n,
+                "zip_level": level,
+                "input_bytes": input_bytes,
+                **best,
+            }
+            results.append(result)
+            _print_result(result)
+
+    return {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "openpyxl": openpyxl.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "workbooks": {spec.name: spec.as_dict() for spec in specs},
+        "results": results,
+    }
+
+
+def _case_id(result: dict) -> tuple:
+    return result["workbook"], result["operation"], result["engine"], result.get("workers", 1), result.get("zip_level")
+
+
+def _label(result: dict) -> str:
+    workers = f" x{result['workers']}" if result.get("workers", 1) > 1 else ""
+    level = f" z{result['zip_level']}" if result.get("zip_level") is not None else ""
+    return f"{result['workbook']:>8}  {result['operation']:<11} {result['engine'] + workers + level:<13}"
+
+
+def _print_result(result: dict) -> None:
+    if "error" in result:
+        print(f"{_label(result)}  ERROR {result['error']}", flush=True)
+        return
+    save = f"{result['save_s']:7.2f}s" if result.get("save_s") is not None else " " * 8
+    print(
+        f"{_label(result)}  {result['wall_s']:8.2f}s  save {save}  {result['peak_rss_mb']:8.1f} MB  "
+        f"{result['output_bytes'] / 1024:10.0f} kB",
+        flush=True,
+    )
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> bool:
+    """Print per-case changes against ``baseline``. Returns False on a regression."""
+    before = {_case_id(r): r for r in baseline.get("results", [])}
+    ok = True
+    print(f"\nCompared with baseline from {baseline.get('created_at', '?')} (tolerance {tolerance:.0%}):")
+    for result in current["results"]:
+        old = before.get(_case_id(result))
+        if old is None or "error" in old or "error" in result:
+            print(f"{_label(result)}  (no comparable baseline)")
+            continue
+        parts = []
+        for metric in METRICS:
+            ratio = result[metric] / old[metric] if old[metric] else 1.0
+            flag = ""
+            if ratio > 1 + tolerance:
+                flag = " !"
+                ok = False
+            parts.append(f"{metric} {ratio - 1:+7.1%}{flag}")
+        print(f"{_label(result)}  " + "  ".join(parts))
+    return ok
+
+
+def main(argv: list[str] | None = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "--run-case":
+        operation, engine, workers, level, input_path, output_path = argv[1:7]
+        zip_level = None if level == "-" else int(level)
+        print(json.dumps(run_case(operation, engine, int(workers), zip_level, input_path, output_path)))
+        return 0
+
+    parser = argparse.ArgumentParser(description="Benchmark the Excel unlock/merge engines on synthetic workbooks.")
+    parser.add_argument("--profile", action="append", choices=sorted(PROFILES), help="predefined workbook size (repeatable, default: small)")
+    parser.add_argument("--so-sheets", type=int, help="custom workbook: number of SO sheets")
+    parser.add_argument("--rows", type=int, default=1000, help="custom workbook: item rows per SO sheet")
+    parser.add_argument("--merges", type=int, default=40, help="custom workbook: merged section rows per SO sheet")
+    parser.add_argument("--styles", type=int, default=30, help="custom workbook: distinct cell styles")
+    parser.add_argument("--hidden-sheets", type=int, default=1, help="custom workbook: hidden sheets")
+    parser.add_argument("--vba-kb", type=int, default=0, help="custom workbook: vbaProject.bin size, > 0 makes an .xlsm")
+    parser.add_argument("--workers", type=int, action="append", default=[], help="also run the streaming merge with N workers (repeatable)")
+    parser.add_argument(
+        "--zip-level",
+        dest="zip_levels",
+        type=int,
+        choices=range(10),
+        action="append",
+        default=[],
+        metavar="0-9",
+        help="also run unlock and merge with this output compression level (repeatable)",
+    )
+    parser.add_argument("--repeat", type=int, default=1, help="runs per case, the fastest is reported")
+    parser.add_argument("--timeout", type=float, default=600, help="seconds before a case is abandoned")
+    parser.add_argument("--workdir", help="where generated workbooks are kept (default: <tmp>/excel_benchmark)")
+    parser.add_argument("-o", "--output", help="write results as JSON")
+    parser.add_argument("--compare", metavar="BASELINE", help="compare with an earlier JSON result")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative increase before --compare fails")
+    args = parser.parse_args(argv)
+
+    specs = [PROFILES[name] for name in args.profile or ()]
+    if args.so_sheets:
+        specs.append(
+            WorkbookSpec(
+                name=f"custom-{args.so_sheets}x{args.rows}",
+                so_sheets=args.so_sheets,
+                rows=args.rows,
+                merges=args.merges,
+                styles=args.styles,
+                hidden_sheets=args.hidden_sheets,
+                vba_kb=args.vba_kb,
+            )
+        )
+    if not specs:
+        specs = [PROFILES["small"]]
+
+    report = run_benchmarks(specs, args.workers, args.zip_levels, max(args.repeat, 1), args.timeout, args.workdir)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2, ensure_ascii=False)
+        print(f"\nResults: {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fh:
+            baseline = json.load(fh)
+        if not compare(report, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
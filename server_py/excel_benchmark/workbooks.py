@@ -0,0 +1,213 @@
+"""Synthetic rozpočet workbooks for the benchmarks.
+
+The layout follows the budgets the service sees in production: a
+"Rekapitulace stavby" summary, a "Pokyny pro vyplnění" sheet, one sheet per
+SO (stavební objekt) with a merged title block and item rows in columns
+A..J, section rows merged across the description, and optionally hidden
+helper sheets and a VBA project.
+
+Workbooks are written in write-only mode so generating a large one stays fast
+and does not skew the machine before the measured runs.
+"""
+
+from __future__ import annotations
+
+import os
+import random
+import shutil
+import tempfile
+import zipfile
+from dataclasses import asdict, dataclass
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+from openpyxl.worksheet.cell_range import CellRange, MultiCellRange
+
+ITEM_COLUMNS = ("Výběrové řízení", "PČ", "Typ", "Kód", "Popis", "MJ", "Množství", "J.cena [CZK]", "Cena celkem [CZK]", "Cenová soustava")
+UNITS = ("m", "m2", "m3", "kus", "t", "kpl", "hod")
+DESCRIPTIONS = (
+    "Hloubení rýh šířky do 800 mm v hornině třídy těžitelnosti I",
+    "Zásyp sypaninou z jakékoliv horniny strojně s uložením výkopku",
+    "Základové pasy z betonu tř. C 16/20",
+    "Zdivo nosné z cihel děrovaných tl 300 mm",
+    "Omítka vápenocementová vnitřních ploch štuková",
+    "Montáž oken plastových s rámem do zdiva",
+    "Podlahy z dlaždic keramických lepených flexibilním lepidlem",
+    "Nátěr syntetický kovových konstrukcí dvojnásobný",
+)
+SECTIONS = ("Zemní práce", "Zakládání", "Svislé konstrukce", "Úpravy povrchů", "Výplně otvorů", "Podlahy")
+PRICE_SYSTEM = "CS ÚRS 2024 01"
+
+VBA_CONTENT_TYPE = "application/vnd.ms-office.vbaProject"
+XLSM_CONTENT_TYPE = "application/vnd.ms-excel.sheet.macroEnabled.main+xml"
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"
+VBA_RELATIONSHIP = "http://schemas.microsoft.com/office/2006/relationships/vbaProject"
+
+
+@dataclass(frozen=True)
+class WorkbookSpec:
+    name: str
+    so_sheets: int = 5
+    rows: int = 500  # item rows per SO sheet
+    merges: int = 20  # section rows (merged across the description) per SO sheet
+    styles: int = 24  # distinct cell styles used across the item rows
+    hidden_sheets: int = 1
+    vba_kb: int = 0  # size of the vbaProject.bin part; > 0 produces an .xlsm
+
+    @property
+    def filename(self) -> str:
+        return f"{self.name}.xlsm" if self.vba_kb else f"{self.name}.xlsx"
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+PROFILES = {
+    "small": WorkbookSpec("small", so_sheets=5, rows=500, merges=20, styles=24, hidden_sheets=1),
+    "medium": WorkbookSpec("medium", so_sheets=20, rows=5000, merges=100, styles=60, hidden_sheets=2),
+    "large": WorkbookSpec("large", so_sheets=40, rows=20000, merges=400, styles=120, hidden_sheets=3),
+    "macro": WorkbookSpec("macro", so_sheets=10, rows=2000, merges=50, styles=40, hidden_sheets=1, vba_kb=512),
+}
+
+
+def _style_palette(count: int) -> list[dict]:
+    rnd = random.Random(count)
+    thin = Side(style="thin")
+    formats = ("General", "#,##0.00", "#,##0.000", "0", "#,##0.00\\ \"Kč\"")
+    palette = []
+    for i in range(max(count, 1)):
+        palette.append(
+            {
+                "font": Font(name="Arial CE", size=rnd.choice((8, 9, 10)), bold=i % 7 == 0, italic=i % 5 == 0),
+                "fill": PatternFill("solid", start_color=f"FF{rnd.randrange(0xE0, 0x100):02X}{rnd.randrange(0xE0, 0x100):02X}{rnd.randrange(0xC0, 0x100):02X}")
+                if i % 3 == 0
+                else PatternFill(),
+                "border": Border(left=thin, right=thin, top=thin, bottom=thin) if i % 2 == 0 else Border(),
+                "alignment": Alignment(horizontal=("left", "right", "center")[i % 3], wrap_text=i % 4 == 0),
+                "number_format": formats[i % len(formats)],
+            }
+        )
+    return palette
+
+
+def _cell(sheet, value, style: dict | None = None) -> WriteOnlyCell:
+    cell = WriteOnlyCell(sheet, value=value)
+    if style is not None:
+        cell.font = style["font"]
+        cell.fill = style["fill"]
+        cell.border = style["border"]
+        cell.alignment = style["alignment"]
+        cell.number_format = style["number_format"]
+    return cell
+
+
+def _write_so_sheet(wb: Workbook, title: str, spec: WorkbookSpec, palette: list[dict], rnd: random.Random) -> None:
+    ws = wb.create_sheet(title)
+    for col, width in zip("ABCDEFGHIJ", (14, 6, 5, 12, 60, 6, 12, 12, 14, 16)):
+        ws.column_dimensions[col].width = width
+
+    merged = [CellRange("A1:J1"), CellRange("A2:J2")]
+    bold = {"font": Font(name="Arial CE", size=12, bold=True), "fill": PatternFill(), "border": Border(),
+            "alignment": Alignment(horizontal="center"), "number_format": "General"}
+    ws.row_dimensions[1].height = 24
+    ws.append([_cell(ws, f"Soupis prací - {title}", bold)])
+    ws.append([_cell(ws, "Stavba: Rekonstrukce objektu, Brno")])
+    ws.append([])
+    ws.append([_cell(ws, label, bold) for label in ITEM_COLUMNS])
+
+    section_every = max(spec.rows // max(spec.merges, 1), 1)
+    row = 5
+    sections = 0
+    for i in range(1, spec.rows + 1):
+        if sections < spec.merges and i % section_every == 1 % section_every:
+            ws.append([None, None, "D", None, _cell(ws, SECTIONS[sections % len(SECTIONS)], bold)])
+            merged.append(CellRange(min_col=5, min_row=row, max_col=9, max_row=row))
+            sections += 1
+            row += 1
+
+        style = palette[i % len(palette)]
+        qty = round(rnd.uniform(0.5, 500), 3)
+        price = round(rnd.uniform(10, 25000), 2)
+        ws.append(
+            [
+                _cell(ws, "VŘ-01", style),
+                _cell(ws, i, style),
+                _cell(ws, "K", style),
+                _cell(ws, f"{rnd.randrange(100000000, 999999999)}", style),
+                _cell(ws, rnd.choice(DESCRIPTIONS), style),
+                _cell(ws, rnd.choice(UNITS), style),
+                _cell(ws, qty, style),
+                _cell(ws, price, style),
+                _cell(ws, f"=G{row}*H{row}", style),
+                _cell(ws, PRICE_SYSTEM, style),
+            ]
+        )
+        row += 1
+
+    ws.merged_cells = MultiCellRange(merged)
+
+
+def _add_vba_part(path: str, size_kb: int) -> None:
+    """Turn a saved .xlsx into an .xlsm carrying an opaque vbaProject.bin part."""
+    tmp = path + ".tmp"
+    with zipfile.ZipFile(path) as src, zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as dst:
+        for info in src.infolist():
+            data = src.read(info.filename)
+            if info.filename == "[Content_Types].xml":
+                data = data.replace(XLSX_CONTENT_TYPE.encode(), XLSM_CONTENT_TYPE.encode()).replace(
+                    b"</Types>",
+                    f'<Default Extension="bin" ContentType="{VBA_CONTENT_TYPE}"/></Types>'.encode(),
+                )
+            elif info.filename == "xl/_rels/workbook.xml.rels":
+                data = data.replace(
+                    b"</Relationships>",
+                    f'<Relationship Id="rIdVba1" Type="{VBA_RELATIONSHIP}" Target="vbaProject.bin"/></Relationships>'.encode(),
+                )
+            dst.writestr(info, data)
+        dst.writestr("xl/vbaProject.bin", random.Random(size_kb).randbytes(size_kb * 1024))
+    os.replace(tmp, path)
+
+
+def generate_workbook(spec: WorkbookSpec, path: str, seed: int = 0) -> str:
+    rnd = random.Random(seed)
+    palette = _style_palette(spec.styles)
+
+    wb = Workbook(write_only=True)
+    recap = wb.create_sheet("Rekapitulace stavby")
+    recap.append(["Kód", "Objekt", "Cena bez DPH [CZK]"])
+    for i in range(1, spec.so_sheets + 1):
+        recap.append([f"SO {i:02d}", f"Stavební objekt {i}", f"='SO {i:02d}'!I{spec.rows + 4}"])
+    wb.create_sheet("Pokyny pro vyplnění").append(["Vyplňte žlutě podbarvené buňky."])
+
+    for i in range(1, spec.so_sheets + 1):
+        _write_so_sheet(wb, f"SO {i:02d}", spec, palette, rnd)
+    for i in range(1, spec.hidden_sheets + 1):
+        hidden = wb.create_sheet(f"Číselník {i}")
+        hidden.sheet_state = "hidden"
+        for unit in UNITS:
+            hidden.append([unit])
+
+    wb.save(path)
+    if spec.vba_kb:
+        _add_vba_part(path, spec.vba_kb)
+    return path
+
+
+def ensure_workbook(spec: WorkbookSpec, directory: str | None = None) -> str:
+    """Path of the workbook for ``spec``, generated on first use."""
+    directory = directory or os.path.join(tempfile.gettempdir(), "excel_benchmark")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, spec.filename)
+    marker = path + ".spec"
+    if os.path.exists(path) and os.path.exists(marker):
+        with open(marker, encoding="utf-8") as fh:
+            if fh.read() == repr(spec):
+                return path
+
+    tmp = path + ".part"
+    generate_workbook(spec, tmp)
+    shutil.move(tmp, path)
+    with open(marker, "w", encoding="utf-8") as fh:
+        fh.write(repr(spec))
+    return path
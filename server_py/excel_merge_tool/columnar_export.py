@@ -0,0 +1,262 @@
+"""Data-only export of the merged rows: CSV, JSON Lines or Parquet.
+
+The same sheets end up in the same order as in "Kombinovane", but only the
+copied source rows are written: no header styling, no separator or gap rows,
+no merged ranges. Every row carries the columns of ``HEADERS`` (plus
+"Soubor" when several workbooks are exported), typed by ``COLUMN_TYPES``:
+quantities and prices are numbers, everything else text. Formulas export
+their cached values.
+
+Source sheets mix items with titles, column headers and section rows, so
+every row also says what it is in "Druh řádku": an item has a number in one
+of the number columns. A number column value that is not a number (``cca
+100``) is exported as null and kept as text in ``<column> (text)``.
+
+Sources are parsed with ``SheetStream`` and rows are written as they are
+read, so memory stays flat. Parquet needs the optional ``pyarrow`` package
+and is written in row groups of ``PARQUET_BATCH_ROWS``.
+"""
+
+from __future__ import annotations
+
+import csv
+import datetime
+import io
+import json
+import os
+import re
+from contextlib import ExitStack
+from typing import Any, Iterator, Optional
+
+import openpyxl
+
+from instrumentation import StageTimer
+from merge_layout import HEADERS, MAX_SOURCE_COLS, combined_headers
+from sheet_selection import DEFAULT_SELECTION, SheetSelection
+from streaming_merge import PROGRESS_EVERY_ROWS, ProgressCallback, SheetStream, Source, source_name
+from used_range import scan_used_range
+
+FORMATS = ("csv", "jsonl", "parquet")
+MIMETYPES = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# Column name -> "number" or "text"; columns not listed are text.
+COLUMN_TYPES = {
+    "Množství": "number",
+    "J.cena [CZK]": "number",
+    "Cena celkem [CZK]": "number",
+}
+
+ROW_KIND_HEADER = "Druh řádku"
+ITEM_ROW = "položka"
+OTHER_ROW = "text"  # titles, column headers, sections, notes
+RAW_TEXT_SUFFIX = " (text)"
+
+# Source columns A..J holding numbers, as indexes into HEADERS[1:].
+NUMBER_COLUMN_INDEXES = [i for i, name in enumerate(HEADERS[1:]) if COLUMN_TYPES.get(name) == "number"]
+
+PARQUET_BATCH_ROWS = 10_000
+
+# Digit grouping in "1 234,50" as typed in Czech budgets (\s covers no-break spaces).
+_NUMBER_SPACES = re.compile(r"\s")
+
+
+class FormatUnavailable(Exception):
+    """The requested format needs an optional package that is not installed."""
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def to_number(value: Any) -> Optional[float]:
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        text = _NUMBER_SPACES.sub("", value).replace(",", ".")
+        try:
+            return float(text)
+        except ValueError:
+            return None
+    return None
+
+
+def to_text(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value)
+
+
+def _converters(columns: list[str]) -> list:
+    return [to_number if COLUMN_TYPES.get(name) == "number" else to_text for name in columns]
+
+
+def export_columns(with_source_file: bool) -> list[str]:
+    """Columns of the export: those of "Kombinovane", the row kind and the raw text of number columns."""
+    raw_text = [HEADERS[1 + i] + RAW_TEXT_SUFFIX for i in NUMBER_COLUMN_INDEXES]
+    return [*combined_headers(with_source_file), ROW_KIND_HEADER, *raw_text]
+
+
+def iter_data_rows(
+    input_files: list[Source],
+    source_names: Optional[list[str]] = None,
+    progress: Optional[ProgressCallback] = None,
+    timer: Optional[StageTimer] = None,
+    selection: SheetSelection = DEFAULT_SELECTION,
+) -> Iterator[list]:
+    """Yield the data rows of the selected sheets, one workbook at a time, as
+    values for ``export_columns``.
+
+    Rows without any value in the copied columns are dropped.
+    """
+    timer = timer if timer is not None else StageTimer()
+    names = list(source_names) if source_names else [source_name(f, i) for i, f in enumerate(input_files, start=1)]
+    with_source_file = len(input_files) > 1
+    convert = _converters(HEADERS[1:])  # source columns A..J
+
+    sheets_done = rows_done = rows_written = unparsed = 0
+    for input_file, name in zip(input_files, names):
+        # data_only: formulas export their last computed values.
+        source_wb = openpyxl.load_workbook(input_file, read_only=True, data_only=True)
+        try:
+            for sheet in source_wb.worksheets:
+                if not selection.selects(sheet.title, sheet.sheet_state):
+                    continue
+                prefix = [sheet.title] if not with_source_file else [name, sheet.title]
+                # Rows below the last value would be dropped anyway: stop parsing there.
+                used = scan_used_range(sheet, 0)
+                if used is not None and used.content_row < used.last_row:
+                    stream = SheetStream(source_wb, sheet, used.content_row, list(used.merged_ranges))
+                else:
+                    stream = SheetStream(source_wb, sheet)
+                for _, cells, _ in stream.rows():
+                    rows_done += 1
+                    values: list = [None] * MAX_SOURCE_COLS
+                    for column, value, _ in cells:
+                        if column <= MAX_SOURCE_COLS and value is not None:
+                            values[column - 1] = value
+                    if rows_done % PROGRESS_EVERY_ROWS == 0 and progress is not None:
+                        progress(sheets_done, rows_done)
+                    if all(v is None for v in values):
+                        continue
+                    rows_written += 1
+                    typed = [f(v) for f, v in zip(convert, values)]
+                    raw_text = [
+                        to_text(values[i]) if typed[i] is None and values[i] is not None else None
+                        for i in NUMBER_COLUMN_INDEXES
+                    ]
+                    if any(typed[i] is not None for i in NUMBER_COLUMN_INDEXES):
+                        kind = ITEM_ROW
+                        unparsed += sum(text is not None for text in raw_text)
+                    else:
+                        kind = OTHER_ROW
+                    yield prefix + typed + [kind] + raw_text
+                sheets_done += 1
+                if progress is not None:
+                    progress(sheets_done, rows_done)
+        finally:
+            source_wb.close()
+
+    timer.count("sheets", sheets_done)
+    timer.count("rows", rows_written)
+    # Text in the number columns of items; column headers do not count.
+    timer.count("values_not_numbers", unparsed)
+
+
+def export_rows(
+    input_files: list[Source],
+    output_file: Source,
+    fmt: str,
+    source_names: Optional[list[str]] = None,
+    progress: Optional[ProgressCallback] = None,
+    timer: Optional[StageTimer] = None,
+    selection: SheetSelection = DEFAULT_SELECTION,
+) -> int:
+    """Write the data rows of ``input_files`` to ``output_file`` in ``fmt``.
+
+    Returns the number of rows written. Raises ``FormatUnavailable`` for
+    Parquet without pyarrow, before any source is opened.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown export format: {fmt}")
+    if fmt == "parquet" and not parquet_available():
+        raise FormatUnavailable("parquet export needs the pyarrow package")
+
+    timer = timer if timer is not None else StageTimer()
+    columns = export_columns(len(input_files) > 1)
+    rows = iter_data_rows(input_files, source_names, progress, timer, selection)
+
+    # Parsing and writing interleave row by row, so both count as "copy".
+    with timer.stage("copy"):
+        if fmt == "parquet":
+            written = _write_parquet(rows, columns, output_file)
+        else:
+            with ExitStack() as stack:
+                if isinstance(output_file, (str, os.PathLike)):
+                    out = stack.enter_context(open(output_file, "w", encoding="utf-8", newline=""))
+                else:
+                    # Leave the caller's file open.
+                    out = io.TextIOWrapper(output_file, encoding="utf-8", newline="")
+                    stack.callback(out.detach)
+                    stack.callback(out.flush)
+                written = _write_csv(rows, columns, out) if fmt == "csv" else _write_jsonl(rows, columns, out)
+    return written
+
+
+def _write_csv(rows: Iterator[list], columns: list[str], out) -> int:
+    writer = csv.writer(out)
+    writer.writerow(columns)
+    written = 0
+    for row in rows:
+        writer.writerow(row)
+        written += 1
+    return written
+
+
+def _write_jsonl(rows: Iterator[list], columns: list[str], out) -> int:
+    written = 0
+    for row in rows:
+        out.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False))
+        out.write("\n")
+        written += 1
+    return written
+
+
+def _write_parquet(rows: Iterator[list], columns: list[str], output_file: Source) -> int:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema(
+        [(name, pa.float64() if COLUMN_TYPES.get(name) == "number" else pa.string()) for name in columns]
+    )
+    written = 0
+    with pq.ParquetWriter(output_file, schema) as writer:
+        batch: list[list] = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= PARQUET_BATCH_ROWS:
+                writer.write_table(_parquet_table(pa, schema, batch))
+                written += len(batch)
+                batch = []
+        if batch or written == 0:
+            writer.write_table(_parquet_table(pa, schema, batch))
+            written += len(batch)
+    return written
+
+
+def _parquet_table(pa, schema, batch: list[list]):
+    arrays = [pa.array([row[i] for row in batch], type=field.type) for i, field in enumerate(schema)]
+    return pa.Table.from_arrays(arrays, schema=schema)
@@ -0,0 +1,65 @@
+"""Per-stage timing for one unlock/merge run.
+
+Engines take an optional ``StageTimer`` and wrap their phases (loading the
+workbook, the cell-copy loop, merged-range replay, column widths, saving) in
+``timer.stage(name)``. Re-entering a stage adds to its time, so stages can be
+split across loops. Counters track rows and cells processed.
+
+The service turns a timer into Prometheus histograms and an optional
+``Server-Timing`` header; the CLI prints ``summary()`` and the peak memory.
+"""
+
+from __future__ import annotations
+
+import sys
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """Peak resident set size of this process so far, None where it is unknown.
+
+    ``resource`` is Unix-only; the desktop app runs merge_final.py on Windows too.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class StageTimer:
+    def __init__(self) -> None:
+        self.stages: dict[str, float] = {}
+        self.counters: dict[str, int] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def count(self, name: str, amount: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    @property
+    def total(self) -> float:
+        return sum(self.stages.values())
+
+    def summary(self) -> str:
+        text = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.stages.items())
+        if self.counters:
+            text += " | " + ", ".join(f"{name} {value}" for name, value in self.counters.items())
+        return text
+
+    def server_timing(self) -> str:
+        """Value of a ``Server-Timing`` header (durations in milliseconds)."""
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items())
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Hand a merge_final.py command line to a warm merge_server.py.
+
+Takes the same arguments as merge_final.py plus ``--server SOCKET``::
+
+    python merge_client.py --server /tmp/merge.sock rozpocet.xlsx --engine xml
+
+Only the standard library is imported here, so a run costs the interpreter
+start and the merge itself; openpyxl and the engines are already loaded in
+the server's workers. ``merge_final.py --server`` does the same after its
+own imports.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import socket
+import sys
+from typing import BinaryIO, Optional, TextIO
+
+
+def send(wfile: BinaryIO, message: dict) -> None:
+    """Write one protocol message (a JSON line) and flush it."""
+    wfile.write(json.dumps(message).encode("utf-8") + b"\n")
+    wfile.flush()
+
+
+def split_server_option(argv: list[str]) -> tuple[Optional[str], list[str]]:
+    """(``--server`` value, the other arguments) of a merge_final.py command line."""
+    parser = argparse.ArgumentParser(add_help=False, allow_abbrev=False)
+    parser.add_argument("--server")
+    options, rest = parser.parse_known_args(argv)
+    return options.server, rest
+
+
+def run_remote(
+    socket_path: str,
+    argv: list[str],
+    stdout: Optional[TextIO] = None,
+    stderr: Optional[TextIO] = None,
+) -> int:
+    """Run ``merge_final.py argv`` on the server at ``socket_path``; returns its exit status.
+
+    Paths in ``argv`` are relative to the current directory, as in a local
+    run. Raises ``OSError`` when the server cannot be reached and
+    ``ConnectionError`` when the worker goes away mid-job.
+    """
+    stdout = stdout if stdout is not None else sys.stdout
+    stderr = stderr if stderr is not None else sys.stderr
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.connect(socket_path)
+        with conn.makefile("rb") as rfile, conn.makefile("wb") as wfile:
+            send(wfile, {"argv": list(argv), "cwd": os.getcwd()})
+            for line in rfile:
+                message = json.loads(line)
+                if "exit" in message:
+                    return message["exit"]
+                if "out" in message:
+                    stdout.write(message["out"])
+                else:
+                    stderr.write(message["err"])
+    raise ConnectionError(f"merge server at {socket_path} closed the connection before the job finished")
+
+
+def main(argv: list[str] | None = None) -> int:
+    server, rest = split_server_option(sys.argv[1:] if argv is None else argv)
+    if not server:
+        print("usage: merge_client.py --server SOCKET [merge_final.py arguments]", file=sys.stderr)
+        return 2
+    try:
+        return run_remote(server, rest)
+    except OSError as exc:
+        print(f"merge server {server}: {exc}", file=sys.stderr)
+        return 2
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
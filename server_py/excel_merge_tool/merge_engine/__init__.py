@@ -0,0 +1,122 @@
+"""One entry point for every merge backend.
+
+``merge()`` builds the "Kombinovane" workbook with the backend it is given.
+The CLI (merge_final.py) and the service (excel_unlock_api/processing.py)
+both call it, so the layout lives in one place per backend and the entry
+points only pick one.
+
+Backends are registered in ``BACKENDS`` together with what they support:
+
+- ``openpyxl`` loads the source and builds the result in memory
+  (merge_engine/in_memory.py);
+- ``streaming`` reads the source in read-only mode and writes the result
+  through a write-only worksheet (streaming_merge.py);
+- ``xml`` shares the streaming pass but serializes the rows of
+  "Kombinovane" straight to XML (merge_engine/xml_direct.py).
+
+All backends produce the same workbook: values, styles, merged ranges, row
+heights, column widths, freeze pane and autofilter.
+tests/test_merge_equivalence.py holds them to that, so a faster backend can
+replace a slower one without anyone noticing in the output.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from instrumentation import StageTimer
+from sheet_cache import SheetCache
+from sheet_selection import DEFAULT_SELECTION, SheetSelection
+from streaming_merge import ProgressCallback, Source, merge_streaming_many
+from style_cache import StyleCache
+from used_range import DEFAULT_TRAILING_STYLED_ROWS
+from zip_output import ZipOptions
+
+from .in_memory import merge_in_memory
+from .xml_direct import merge_xml_direct
+
+
+@dataclass(frozen=True)
+class Backend:
+    """A merge backend and the options it understands.
+
+    ``run`` is called as ``run(input_files, output_file, **options)`` and
+    returns the number of source sheets merged. ``workers`` and
+    ``sheet_cache`` are only passed when the backend supports them.
+    """
+
+    name: str
+    run: Callable[..., int]
+    multi_file: bool = False  # several input workbooks (adds the "Soubor" column)
+    workers: bool = False  # parses sheets in worker processes
+    sheet_cache: bool = False  # reuses sheets parsed by earlier merges
+
+
+BACKENDS: dict[str, Backend] = {}
+
+
+def register(backend: Backend) -> None:
+    BACKENDS[backend.name] = backend
+
+
+def get_backend(name: str) -> Backend:
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"unknown merge backend {name!r}") from None
+
+
+def backend_names() -> tuple[str, ...]:
+    return tuple(BACKENDS)
+
+
+register(Backend("openpyxl", merge_in_memory))
+register(Backend("streaming", merge_streaming_many, multi_file=True, workers=True, sheet_cache=True))
+register(Backend("xml", merge_xml_direct, multi_file=True, workers=True, sheet_cache=True))
+
+
+def merge(
+    input_files: list[Source],
+    output_file: Source,
+    backend: str,
+    style_cache: Optional[StyleCache] = None,
+    progress: Optional[ProgressCallback] = None,
+    workers: int = 1,
+    timer: Optional[StageTimer] = None,
+    source_names: Optional[list[str]] = None,
+    selection: SheetSelection = DEFAULT_SELECTION,
+    sheet_cache: Optional[SheetCache] = None,
+    trailing_styled_rows: Optional[int] = DEFAULT_TRAILING_STYLED_ROWS,
+    zip_options: Optional[ZipOptions] = None,
+) -> int:
+    """Merge ``input_files`` into ``output_file`` with ``backend``.
+
+    Returns the number of source sheets merged. Several inputs need a
+    ``multi_file`` backend (ValueError otherwise). ``workers`` and
+    ``sheet_cache`` only change how fast the result comes, so backends
+    without them simply ignore them. ``zip_options`` set how the output
+    package is compressed (see zip_output.py).
+    """
+    spec = get_backend(backend)
+    if len(input_files) > 1 and not spec.multi_file:
+        raise ValueError(f"merge backend {backend!r} takes a single workbook")
+
+    options = {}
+    if spec.multi_file:
+        options["source_names"] = source_names
+    if spec.workers:
+        options["workers"] = workers
+    if spec.sheet_cache:
+        options["sheet_cache"] = sheet_cache
+    return spec.run(
+        input_files,
+        output_file,
+        style_cache=style_cache,
+        progress=progress,
+        timer=timer,
+        selection=selection,
+        trailing_styled_rows=trailing_styled_rows,
+        zip_options=zip_options,
+        **options,
+    )
@@ -0,0 +1,154 @@
+"""The ``openpyxl`` merge backend: source and result both live in memory.
+
+The original engine of the CLI and the service. Memory grows with the whole
+source workbook plus the result, but it copes with anything openpyxl can
+load and is the reference the other backends are compared against.
+"""
+
+from __future__ import annotations
+
+from typing import Optional
+
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+
+from instrumentation import StageTimer
+from merge_layout import (
+    HEADER_ALIGNMENT,
+    HEADER_FILL,
+    HEADER_FONT,
+    HEADER_ROW_HEIGHT,
+    HEADERS,
+    LIST_COLUMN_WIDTH,
+    MAX_SOURCE_COLS,
+    SEPARATOR_ROW_HEIGHT,
+    SHEET_HEADER_ALIGNMENT,
+    SHEET_HEADER_FONT,
+    TARGET_SHEET_TITLE,
+)
+from range_replay import RangeReplay
+from sheet_selection import DEFAULT_SELECTION, SheetSelection, load_selected_workbook
+from streaming_merge import ProgressCallback, Source
+from style_cache import StyleCache
+from used_range import DEFAULT_TRAILING_STYLED_ROWS, loaded_bounds
+from zip_output import ZipOptions, save_workbook
+
+
+def _style_separator(cell) -> None:
+    cell.font = SHEET_HEADER_FONT
+    cell.fill = HEADER_FILL
+    cell.alignment = SHEET_HEADER_ALIGNMENT
+
+
+def merge_in_memory(
+    input_files: list[Source],
+    output_file: Source,
+    style_cache: Optional[StyleCache] = None,
+    progress: Optional[ProgressCallback] = None,
+    timer: Optional[StageTimer] = None,
+    selection: SheetSelection = DEFAULT_SELECTION,
+    trailing_styled_rows: Optional[int] = DEFAULT_TRAILING_STYLED_ROWS,
+    zip_options: Optional[ZipOptions] = None,
+) -> int:
+    """Merge the sheets of the single workbook in ``input_files``. Returns the sheets merged."""
+    (source,) = input_files
+    styles = style_cache if style_cache is not None else StyleCache()
+    timer = timer if timer is not None else StageTimer()
+
+    # We always output .xlsx; macros are not preserved.
+    with timer.stage("load"):
+        # Only the selected sheets are parsed.
+        source_wb = load_selected_workbook(source, selection)
+
+    target_wb = Workbook()
+    target_wb.remove(target_wb.active)
+    combined = target_wb.create_sheet(TARGET_SHEET_TITLE)
+
+    # Header row (Row 1)
+    for idx, label in enumerate(HEADERS, start=1):
+        cell = combined.cell(row=1, column=idx, value=label)
+        cell.font = HEADER_FONT
+        cell.fill = HEADER_FILL
+        cell.alignment = HEADER_ALIGNMENT
+
+    combined.freeze_panes = "A2"
+    combined.row_dimensions[1].height = HEADER_ROW_HEIGHT
+    combined.column_dimensions["A"].width = LIST_COLUMN_WIDTH
+
+    col_widths: dict[str, float] = {}
+    row = 2
+    sheets_done = 0
+    rows_done = 0
+    # Merged ranges and row heights are written in bulk at the end.
+    replay = RangeReplay(combined)
+
+    for sheet in source_wb.worksheets:
+        if not selection.selects(sheet.title, sheet.sheet_state):
+            continue
+
+        # Empty styled rows past the content beyond the policy are not copied.
+        max_r, max_c = loaded_bounds(sheet, trailing_styled_rows)
+        max_c = min(max_c, MAX_SOURCE_COLS)
+        if max_r < (sheet.max_row or 0):
+            timer.count("rows_trimmed", sheet.max_row - max_r)
+
+        if max_r <= 1 and max_c <= 1 and sheet["A1"].value is None:
+            continue
+
+        # Blue separator row per sheet, styled across all columns
+        _style_separator(combined.cell(row=row, column=1, value=f"=== {sheet.title} ==="))
+        for col in range(2, len(HEADERS) + 1):
+            _style_separator(combined.cell(row=row, column=col))
+        replay.merge(row, 1, row, len(HEADERS))
+        combined.row_dimensions[row].height = SEPARATOR_ROW_HEIGHT
+        data_start_row = row + 1
+
+        # Column A is the source sheet name. Source columns map to B..K.
+        with timer.stage("copy"):
+            cells_done = 0
+            for r in range(1, max_r + 1):
+                target_r = data_start_row + r - 1
+                combined.cell(row=target_r, column=1, value=sheet.title)
+                for c in range(1, max_c + 1):
+                    src_cell = sheet.cell(row=r, column=c)
+                    if src_cell.value is None and not src_cell.has_style:
+                        continue
+                    tgt_cell = combined.cell(row=target_r, column=c + 1)
+                    tgt_cell.value = src_cell.value
+                    styles.copy_format(src_cell, tgt_cell)
+                    cells_done += 1
+            timer.count("cells", cells_done)
+
+        # Merged cells and row heights, shifted by one column and the rows above
+        with timer.stage("merges"):
+            replay.add_sheet(sheet, data_start_row - 1, 1, max_r)
+
+        # Column widths: keep the widest across sheets
+        with timer.stage("widths"):
+            for c in range(1, max_c + 1):
+                w = sheet.column_dimensions[get_column_letter(c)].width
+                if w is None:
+                    continue
+                tgt_col = get_column_letter(c + 1)
+                col_widths[tgt_col] = max(col_widths.get(tgt_col, 0), float(w))
+
+        # Gap row between sheets
+        row = data_start_row + max_r + 1
+
+        sheets_done += 1
+        rows_done += max_r
+        if progress is not None:
+            progress(sheets_done, rows_done)
+
+    with timer.stage("merges"):
+        replay.close()
+    for col, w in col_widths.items():
+        combined.column_dimensions[col].width = w
+
+    combined.auto_filter.ref = f"A1:{get_column_letter(len(HEADERS))}{combined.max_row}"
+
+    with timer.stage("save"):
+        save_workbook(target_wb, output_file, zip_options)
+    timer.count("sheets", sheets_done)
+    timer.count("rows", rows_done)
+    return sheets_done
@@ -0,0 +1,229 @@
+"""The ``xml`` merge backend: the streaming merge writing raw sheet XML.
+
+Parsing, trimming, parallel workers and the sheet cache are those of the
+``streaming`` backend (streaming_merge.py). What differs is the output: the
+write-only worksheet turns every copied value into a ``WriteOnlyCell``, has
+the style cache copy its style onto it and serializes it through an element
+tree. ``XmlSheetWriter`` renders plain strings and numbers as ``<c>`` markup
+directly and resolves each source style to a target style id once per
+source workbook.
+
+Everything else still goes through openpyxl: a write-only "Kombinovane"
+sheet without rows carries the columns, freeze pane, merged ranges and
+autofilter, and the package is saved as usual. While it is saved, its empty
+``<sheetData>`` is swapped for the rows collected in a temporary file.
+Values the fast path does not cover (formulas, dates, booleans, errors,
+very long strings) and the header and separator rows are serialized by
+openpyxl's own cell writer, so the sheet comes out as the ``streaming``
+backend writes it.
+"""
+
+from __future__ import annotations
+
+import re
+import shutil
+import tempfile
+from typing import Optional
+from xml.sax.saxutils import escape
+
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell._writer import etree_write_cell
+from openpyxl.cell.cell import ERROR_CODES, ILLEGAL_CHARACTERS_RE
+from openpyxl.cell.cell import Cell as SheetCell
+from openpyxl.cell.read_only import ReadOnlyCell
+from openpyxl.compat import safe_string
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet.dimensions import RowDimension
+from openpyxl.xml.functions import tostring
+
+from merge_layout import MAX_SOURCE_COLS
+from streaming_merge import Cell, CombinedWriter, Source, merge_streaming_many
+from style_cache import StyleCache
+from zip_output import OutputZipFile, ZipOptions, write_workbook
+
+CHUNK_SIZE = 1024 * 1024
+MAX_STRING_LENGTH = 32767  # longer strings are truncated by openpyxl
+
+_EMPTY_SHEET_DATA = re.compile(rb"<sheetData\s*/>|<sheetData>\s*</sheetData>")
+
+
+def _plain(value) -> bool:
+    """True for values ``_value_cell`` writes the way openpyxl would."""
+    kind = type(value)
+    if kind is str:
+        return not (
+            (len(value) > 1 and value[0] == "=")  # a formula to openpyxl
+            or value in ERROR_CODES
+            or len(value) > MAX_STRING_LENGTH
+            or ILLEGAL_CHARACTERS_RE.search(value)
+        )
+    return kind is int or kind is float or value is None
+
+
+def _value_cell(ref: str, value, style: str) -> str:
+    """``<c>`` of a plain string, number or empty styled cell (see ``_plain``)."""
+    if type(value) is str:
+        if not value:
+            return f'<c r="{ref}"{style} t="inlineStr" />'
+        stripped = value.strip()
+        space = ' xml:space="preserve"' if stripped and stripped != value else ""
+        return f'<c r="{ref}"{style} t="inlineStr"><is><t{space}>{escape(value)}</t></is></c>'
+    if value is None:
+        return f'<c r="{ref}"{style} t="n" />'
+    return f'<c r="{ref}"{style} t="n"><v>{safe_string(value)}</v></c>'
+
+
+class _Elements:
+    """Stands in for the xmlfile openpyxl's cell writer writes elements to."""
+
+    def __init__(self) -> None:
+        self.parts: list[str] = []
+
+    def write(self, element) -> None:
+        self.parts.append(tostring(element).decode("utf-8"))
+
+
+class _SheetDataZipFile(OutputZipFile):
+    """``OutputZipFile`` that fills the empty ``<sheetData>`` of ``sheet``.
+
+    openpyxl's ``ExcelWriter`` adds worksheets with ``write()`` from a
+    temporary file; the rows are streamed in from ``rows`` in the middle.
+    """
+
+    def __init__(self, file, sheet, rows, options: Optional[ZipOptions] = None):
+        super().__init__(file, options)
+        self.sheet = sheet
+        self.rows = rows
+
+    def write(self, filename, arcname=None, *args, **kwargs) -> None:
+        # The part name is only known once ExcelWriter has numbered the sheets.
+        if arcname != self.sheet.path[1:]:
+            super().write(filename, arcname, *args, **kwargs)
+            return
+
+        with open(filename, "rb") as fh:
+            part = fh.read()
+        match = _EMPTY_SHEET_DATA.search(part)
+        if match is None:
+            raise ValueError(f"{arcname} has no empty <sheetData> to fill")
+        self.rows.seek(0)
+        with self.open(arcname, "w", force_zip64=True) as dst:
+            dst.write(part[: match.start()])
+            dst.write(b"<sheetData>")
+            shutil.copyfileobj(self.rows, dst, CHUNK_SIZE)
+            dst.write(b"</sheetData>")
+            dst.write(part[match.end() :])
+
+
+class XmlSheetWriter(CombinedWriter):
+    """``CombinedWriter`` that serializes rows itself instead of appending them to the sheet."""
+
+    def __init__(self, sheet, columns: int):
+        super().__init__(sheet, columns)
+        self.rows = tempfile.TemporaryFile()
+        self._letters = [""] + [get_column_letter(c) for c in range(1, columns + 1)]
+        # (source workbook, source style id) -> ' s="N"', or "" when the copied style is the default.
+        self._style_attrs: dict = {}
+        # height -> attributes of a <row> with that height
+        self._row_attrs: dict[float, str] = {}
+
+    def _row(self, row_idx: int, height: Optional[float], cells: list[str]) -> None:
+        attrs = ""
+        if height is not None:
+            attrs = self._row_attrs.get(height)
+            if attrs is None:
+                attrs = "".join(f' {k}="{v}"' for k, v in RowDimension(self.sheet, ht=height))
+                self._row_attrs[height] = attrs
+        self.rows.write(f'<row r="{row_idx}"{attrs}>{"".join(cells)}</row>'.encode("utf-8"))
+        self.rows_written = row_idx
+
+    def _openpyxl_cell(self, cell: SheetCell, row_idx: int, col_idx: int) -> Optional[str]:
+        """``cell`` serialized the way the write-only worksheet does it."""
+        if cell._value is None and not cell.has_style:
+            return None
+        cell.row = row_idx
+        cell.column = col_idx
+        elements = _Elements()
+        etree_write_cell(elements, self.sheet, cell, cell.has_style)
+        return elements.parts[0]
+
+    def _style_attr(self, sheet, src_idx: int, c: int, value, style_id: int, styles: StyleCache) -> str:
+        key = (styles.source, style_id)
+        attr = self._style_attrs.get(key)
+        if attr is None:
+            probe = WriteOnlyCell(self.sheet)
+            styles.copy_format(ReadOnlyCell(sheet, src_idx, c, value, "n", style_id), probe)
+            attr = f' s="{probe.style_id}"' if probe.has_style else ""
+            self._style_attrs[key] = attr
+        elif style_id:
+            # What copy_format would have counted, so every backend reports the same hit rate.
+            styles.record_hit()
+        return attr
+
+    def append(self, cells: list, height: float | None = None) -> int:
+        row_idx = self.rows_written + 1
+        out = []
+        for col_idx, value in enumerate(cells, start=1):
+            if value is None:
+                continue
+            if not isinstance(value, SheetCell):
+                if _plain(value):
+                    out.append(_value_cell(f"{self._letters[col_idx]}{row_idx}", value, ""))
+                    continue
+                value = WriteOnlyCell(self.sheet, value=value)
+            xml = self._openpyxl_cell(value, row_idx, col_idx)
+            if xml is not None:
+                out.append(xml)
+        self._row(row_idx, height, out)
+        if any(c is not None for c in cells):
+            self.last_row_with_cells = row_idx
+        return row_idx
+
+    def append_source(
+        self, prefix: list, sheet, src_idx: int, cells: list[Cell], height: float | None, styles: StyleCache
+    ) -> int:
+        row_idx = self.rows_written + 1
+        letters = self._letters
+        out = []
+        for col_idx, value in enumerate(prefix, start=1):
+            if _plain(value):
+                out.append(_value_cell(f"{letters[col_idx]}{row_idx}", value, ""))
+                continue
+            xml = self._openpyxl_cell(WriteOnlyCell(self.sheet, value=value), row_idx, col_idx)
+            if xml is not None:
+                out.append(xml)
+
+        offset = len(prefix)  # target column of source column 1, minus one
+        copied = 0
+        for c, value, style_id in cells:
+            if c > MAX_SOURCE_COLS:
+                continue
+            if value is None and not style_id:
+                continue
+            copied += 1
+            if _plain(value):
+                style = self._style_attr(sheet, src_idx, c, value, style_id, styles) if style_id else ""
+                if value is not None or style:  # else a style that copies to the default: nothing to write
+                    out.append(_value_cell(f"{letters[offset + c]}{row_idx}", value, style))
+                continue
+            # Same steps as CombinedWriter.append_source, down to the order styles are registered in.
+            tgt_cell = WriteOnlyCell(self.sheet, value=value)
+            if style_id:
+                styles.copy_format(ReadOnlyCell(sheet, src_idx, c, value, "n", style_id), tgt_cell)
+            xml = self._openpyxl_cell(tgt_cell, row_idx, offset + c)
+            if xml is not None:
+                out.append(xml)
+        self._row(row_idx, height, out)
+        self.last_row_with_cells = row_idx
+        return copied
+
+    def save(self, workbook, output_file: Source, zip_options: Optional[ZipOptions] = None) -> None:
+        try:
+            write_workbook(workbook, _SheetDataZipFile(output_file, self.sheet, self.rows, zip_options))
+        finally:
+            self.rows.close()
+
+
+def merge_xml_direct(input_files: list[Source], output_file: Source, **options) -> int:
+    """``merge_streaming_many`` with rows written by ``XmlSheetWriter``; takes the same options."""
+    return merge_streaming_many(input_files, output_file, writer_class=XmlSheetWriter, **options)
@@ -1,188 +1,225 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 
+import argparse
 import os
+import re
 import sys
-from copy import copy
-from typing import Iterable
-
-import openpyxl
-from openpyxl.styles import Alignment, Font, PatternFill
-from openpyxl.utils import get_column_letter
-
-
-SKIP_SHEETS = ("Rekapitulace stavby", "Pokyny pro vyplnění")
-
-HEADERS = [
-    "List",
-    "Výběrové řízení",
-    "PČ",
-    "Typ",
-    "Kód",
-    "Popis",
-    "MJ",
-    "Množství",
-    "J.cena [CZK]",
-    "Cena celkem [CZK]",
-    "Cenová soustava",
-]
-
-HEADER_FILL = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-HEADER_FONT = Font(bold=True, size=11, color="FFFFFF")
-HEADER_ALIGNMENT = Alignment(horizontal="center", vertical="center")
-
-SHEET_HEADER_FONT = Font(bold=True, size=12, color="FFFFFF")
-SHEET_HEADER_ALIGNMENT = Alignment(horizontal="center", vertical="center")
-
-
-def _should_skip_sheet(sheet) -> bool:
-    title = (sheet.title or "").strip()
-    if not title:
-        return True
-    if any(s.lower() == title.lower() for s in SKIP_SHEETS):
-        return True
-    if sheet.sheet_state in ("hidden", "veryHidden"):
-        return True
-    return False
-
-
-def _iter_sheets_to_process(wb) -> Iterable:
-    for name in wb.sheetnames:
-        sheet = wb[name]
-        if _should_skip_sheet(sheet):
-            continue
-        yield sheet
-
-
-def copy_format(src, tgt) -> None:
-    if not src.has_style:
-        return
-    tgt._style = copy(src._style)
-    tgt.number_format = src.number_format
-    tgt.protection = copy(src.protection)
-    tgt.alignment = copy(src.alignment)
-
-
-def merge_final(input_file: str, output_file: str) -> None:
-    print(f"Loading: {input_file}")
-    source_wb = openpyxl.load_workbook(input_file)
-    sheets = list(_iter_sheets_to_process(source_wb))
-    print(f"Processing {len(sheets)} sheets")
-
-    target_wb = openpyxl.Workbook()
-    target_wb.remove(target_wb.active)
-    combined = target_wb.create_sheet("Kombinovane")
-
-    # Header row (Row 1)
-    for idx, label in enumerate(HEADERS, start=1):
-        cell = combined.cell(row=1, column=idx, value=label)
-        cell.font = HEADER_FONT
-        cell.fill = HEADER_FILL
-        cell.alignment = HEADER_ALIGNMENT
-
-    combined.freeze_panes = "A2"
-    combined.column_dimensions["A"].width = 25
-
-    row = 2
-    max_source_cols = len(HEADERS) - 1  # we insert "List" in col A
-    col_widths: dict[str, float] = {}
-
-    for sheet in sheets:
-        sheet_name = sheet.title
-        print(f"Processing: {sheet_name}")
-
-        max_r = sheet.max_row or 0
-        max_c = min(sheet.max_column or 0, max_source_cols)
-
-        if max_r <= 1 and max_c <= 1 and sheet["A1"].value is None:
-            continue
-
-        # Blue separator row per sheet
-        header_cell = combined.cell(row=row, column=1, value=f"=== {sheet_name} ===")
-        header_cell.font = SHEET_HEADER_FONT
-        header_cell.fill = HEADER_FILL
-        header_cell.alignment = SHEET_HEADER_ALIGNMENT
-        combined.merge_cells(start_row=row, start_column=1, end_row=row, end_column=len(HEADERS))
-        row += 1
-
-        # Copy data (row by row) while preserving formatting
-        # Column A is the source sheet name. Source columns map to B..K (10 columns).
-        merge_ranges = list(sheet.merged_cells.ranges)
-        row_offset = row - 1  # source row 1 -> target row (row_offset + 1)
-
-        for r in range(1, max_r + 1):
-            target_r = row_offset + r
-            combined.cell(row=target_r, column=1, value=sheet_name)
-
-            for c in range(1, max_c + 1):
-                src_cell = sheet.cell(row=r, column=c)
-                if src_cell.value is None and not src_cell.has_style:
-                    continue
-                tgt_cell = combined.cell(row=target_r, column=c + 1)
-                tgt_cell.value = src_cell.value
-                copy_format(src_cell, tgt_cell)
-
-            # Preserve row height
-            if sheet.row_dimensions[r].height is not None:
-                combined.row_dimensions[target_r].height = sheet.row_dimensions[r].height
-
-        # Preserve merged cells (shifted by +1 column, +row_offset rows)
-        for merged in merge_ranges:
-            min_row, min_col, max_row, max_col = merged.min_row, merged.min_col, merged.max_row, merged.max_col
-            # Only merge within copied range (clip to max_c)
-            if min_col > max_source_cols:
-                continue
-            clipped_max_col = min(max_col, max_source_cols)
-            combined.merge_cells(
-                start_row=row_offset + min_row,
-                start_column=min_col + 1,
-                end_row=row_offset + max_row,
-                end_column=clipped_max_col + 1,
-            )
-
-        # Column widths: use max width across all processed sheets
-        for c in range(1, max_c + 1):
-            src_col_letter = get_column_letter(c)
-            tgt_col_letter = get_column_letter(c + 1)
-            w = sheet.column_dimensions[src_col_letter].width
-            if w is None:
-                continue
-            col_widths[tgt_col_letter] = max(col_widths.get(tgt_col_letter, 0), float(w))
-
-        # Add gap row between sheets
-        row = row_offset + max_r + 2
-
-    for col_letter, w in col_widths.items():
-        combined.column_dimensions[col_letter].width = w
-
-    max_row_combined = combined.max_row
-    max_col_combined = combined.max_column
-    if max_row_combined >= 1 and max_col_combined >= 1:
-        filter_range = f"A1:{get_column_letter(max_col_combined)}{max_row_combined}"
-        combined.auto_filter.ref = filter_range
-        print(f"Autofilter applied to range: {filter_range}")
-
-    print(f"Saving: {output_file}")
-    target_wb.save(output_file)
-    print(f"Done! {len(sheets)} sheet(s) merged.")
-    print(f"Output: {output_file}")
 
-
-def main() -> int:
-    input_file = sys.argv[1] if len(sys.argv) > 1 else "/a0/tmp/uploads/predloha.xlsx"
-    if len(sys.argv) > 2:
-        output_file = sys.argv[2]
+from instrumentation import StageTimer, peak_rss_bytes
+from merge_engine import backend_names, get_backend, merge
+from sheet_cache import SheetCache
+from sheet_selection import SheetSelection
+from style_cache import StyleCache
+from used_range import DEFAULT_TRAILING_STYLED_ROWS
+from zip_output import ZipOptions
+
+# xlsx: the styled Kombinovane workbook; the others export data rows only.
+OUTPUT_FORMATS = ("xlsx", "csv", "jsonl", "parquet")
+
+
+def _trailing_rows(text: str) -> int | None:
+    if text == "all":
+        return None
+    try:
+        value = int(text)
+    except ValueError:
+        value = -1
+    if value < 0:
+        raise argparse.ArgumentTypeError(f"expected a row count or 'all', got {text!r}")
+    return value
+
+
+def _print_peak_memory() -> None:
+    # A merge_server.py worker reports the peak of all jobs it ran so far.
+    peak = peak_rss_bytes()
+    if peak is not None:
+        print(f"Peak memory: {peak / 1e6:.0f} MB")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Merge workbook sheets into a single Kombinovane sheet.")
+    parser.add_argument("input_file", nargs="?", default="/a0/tmp/uploads/predloha.xlsx")
+    parser.add_argument("output_file", nargs="?")
+    parser.add_argument(
+        "--input",
+        dest="more_inputs",
+        nargs="+",
+        action="extend",
+        default=[],
+        metavar="FILE",
+        help="further workbooks merged after input_file, with a Soubor column naming the source "
+        "(streaming and xml engines)",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=backend_names(),
+        help="openpyxl loads the whole workbook; streaming uses read-only/write-only mode with bounded memory; "
+        "xml is streaming with the output rows written as raw XML (default: openpyxl, streaming for several "
+        "inputs or --sheet-cache)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        metavar="N",
+        help="parse sheets in N processes (streaming and xml engines)",
+    )
+    parser.add_argument(
+        "--format",
+        choices=OUTPUT_FORMATS,
+        default="xlsx",
+        help="csv, jsonl and parquet write typed data rows only, without styles or separators",
+    )
+    parser.add_argument(
+        "--sheet",
+        dest="sheets",
+        action="append",
+        default=[],
+        metavar="NAME",
+        help="merge only this sheet (repeatable; combines with --sheet-regex)",
+    )
+    parser.add_argument("--sheet-regex", metavar="REGEX", help="merge only sheets whose title matches")
+    parser.add_argument(
+        "--exclude-sheet",
+        dest="exclude_sheets",
+        action="append",
+        default=[],
+        metavar="NAME",
+        help="leave out this sheet (repeatable)",
+    )
+    parser.add_argument("--exclude-regex", metavar="REGEX", help="leave out sheets whose title matches")
+    parser.add_argument("--include-hidden", action="store_true", help="also merge hidden and very hidden sheets")
+    parser.add_argument(
+        "--sheet-cache",
+        metavar="DIR",
+        help="reuse sheets parsed by earlier runs when their XML is unchanged (streaming and xml engines)",
+    )
+    parser.add_argument(
+        "--sheet-cache-max-mb",
+        type=int,
+        default=0,
+        metavar="MB",
+        help="drop least recently used cached sheets beyond this size (default: keep all)",
+    )
+    parser.add_argument(
+        "--trailing-styled-rows",
+        type=_trailing_rows,
+        default=DEFAULT_TRAILING_STYLED_ROWS,
+        metavar="N|all",
+        help="keep at most N empty but formatted rows below each sheet's last value "
+        f"(default: {DEFAULT_TRAILING_STYLED_ROWS}; all keeps every one)",
+    )
+    parser.add_argument(
+        "--zip-level",
+        type=int,
+        choices=range(10),
+        metavar="0-9",
+        help="deflate level of the output package: 1 saves fastest, 9 smallest, 0 stores without compression "
+        "(default: 6)",
+    )
+    parser.add_argument(
+        "--zip-deflate-media",
+        action="store_true",
+        help="deflate already compressed parts such as images too (stored as they are by default)",
+    )
+    parser.add_argument(
+        "--server",
+        metavar="SOCKET",
+        help="run the job on a warm merge_server.py listening on this Unix socket instead of in this process",
+    )
+    argv = sys.argv[1:] if argv is None else argv
+    args = parser.parse_args(argv)
+    if args.server:
+        from merge_client import run_remote, split_server_option
+
+        try:
+            return run_remote(args.server, split_server_option(argv)[1])
+        except OSError as exc:
+            parser.error(f"merge server {args.server}: {exc}")
+    try:
+        selection = SheetSelection(
+            include=tuple(args.sheets),
+            exclude=tuple(args.exclude_sheets),
+            include_pattern=args.sheet_regex,
+            exclude_pattern=args.exclude_regex,
+            visible_only=not args.include_hidden,
+        )
+    except re.error as exc:
+        parser.error(f"invalid sheet regex: {exc}")
+    input_files = [args.input_file, *args.more_inputs]
+    if args.format != "xlsx":
+        if args.engine is not None or args.workers != 1 or args.sheet_cache or args.zip_level is not None:
+            parser.error(f"--format {args.format} takes no --engine, --workers, --sheet-cache or --zip-level")
+    else:
+        if args.engine is None:
+            args.engine = "streaming" if len(input_files) > 1 or args.sheet_cache else "openpyxl"
+        backend = get_backend(args.engine)
+        if len(input_files) > 1 and not backend.multi_file:
+            parser.error(f"--input is not supported by --engine {args.engine}")
+        if args.sheet_cache and not backend.sheet_cache:
+            parser.error(f"--sheet-cache is not supported by --engine {args.engine}")
+        if args.workers < 1:
+            parser.error("--workers must be at least 1")
+        if args.workers > 1 and not backend.workers:
+            parser.error(f"--workers is not supported by --engine {args.engine}")
+
+    input_file = args.input_file
+    if args.output_file:
+        output_file = args.output_file
     else:
         base, _ = os.path.splitext(input_file)
-        output_file = f"{base}_combined_final.xlsx"
-
-    if not os.path.exists(input_file):
-        raise FileNotFoundError(input_file)
-
-    merge_final(input_file=input_file, output_file=output_file)
+        output_file = f"{base}_combined_final.{args.format}"
+
+    for path in input_files:
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+
+    if args.format != "xlsx":
+        from columnar_export import FormatUnavailable, export_rows
+
+        print(f"Exporting ({args.format}): {', '.join(input_files)}")
+        timer = StageTimer()
+        try:
+            written = export_rows(input_files, output_file, args.format, timer=timer, selection=selection)
+        except FormatUnavailable as exc:
+            parser.error(str(exc))
+        print(f"Done! {written} row(s) exported.")
+        if timer.counters.get("values_not_numbers"):
+            print(
+                f"Warning: {timer.counters['values_not_numbers']} price/quantity value(s) are not numbers; "
+                "they are exported as text in the '(text)' columns."
+            )
+        print(f"Stages: {timer.summary()}")
+        _print_peak_memory()
+        print(f"Output: {output_file}")
+        return 0
+
+    print(f"Merging ({args.engine}): {', '.join(input_files)}")
+    styles = StyleCache()
+    timer = StageTimer()
+    sheets = SheetCache(args.sheet_cache, args.sheet_cache_max_mb * 1024 * 1024) if args.sheet_cache else None
+    merged = merge(
+        input_files,
+        output_file,
+        args.engine,
+        style_cache=styles,
+        workers=args.workers,
+        timer=timer,
+        selection=selection,
+        sheet_cache=sheets,
+        trailing_styled_rows=args.trailing_styled_rows,
+        zip_options=ZipOptions(level=args.zip_level, store_media=not args.zip_deflate_media),
+    )
+    print(f"Done! {merged} sheet(s) merged.")
+    print(f"Style cache: {styles.summary()}")
+    if sheets is not None:
+        print(f"Sheet cache: {sheets.summary()}")
+    print(f"Stages: {timer.summary()}")
+    _print_peak_memory()
+    print(f"Output: {output_file}")
     return 0
 
 
 if __name__ == "__main__":
     raise SystemExit(main())
-
@@ -0,0 +1,54 @@
+"""Layout of the combined "Kombinovane" sheet shared by the merge engines."""
+
+from __future__ import annotations
+
+from openpyxl.styles import Alignment, Font, PatternFill
+
+TARGET_SHEET_TITLE = "Kombinovane"
+
+SKIP_SHEETS = ("Rekapitulace stavby", "Pokyny pro vyplnění")
+
+HEADERS = [
+    "List",
+    "Výběrové řízení",
+    "PČ",
+    "Typ",
+    "Kód",
+    "Popis",
+    "MJ",
+    "Množství",
+    "J.cena [CZK]",
+    "Cena celkem [CZK]",
+    "Cenová soustava",
+]
+MAX_SOURCE_COLS = len(HEADERS) - 1  # source A..J -> target B..K (A is "List")
+
+HEADER_FILL = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+HEADER_FONT = Font(bold=True, size=11, color="FFFFFF")
+HEADER_ALIGNMENT = Alignment(horizontal="center", vertical="center")
+HEADER_ROW_HEIGHT = 18
+
+SHEET_HEADER_FONT = Font(bold=True, size=12, color="FFFFFF")
+SHEET_HEADER_ALIGNMENT = Alignment(horizontal="center", vertical="center")
+SEPARATOR_ROW_HEIGHT = 20
+
+LIST_COLUMN_WIDTH = 25
+
+# Merging several workbooks adds the source file name in front of "List".
+SOURCE_FILE_HEADER = "Soubor"
+SOURCE_FILE_COLUMN_WIDTH = 30
+
+
+def combined_headers(with_source_file: bool) -> list[str]:
+    return [SOURCE_FILE_HEADER, *HEADERS] if with_source_file else list(HEADERS)
+
+
+def should_skip_sheet(title: str | None, sheet_state: str | None) -> bool:
+    title = (title or "").strip()
+    if not title:
+        return True
+    if any(s.lower() == title.lower() for s in SKIP_SHEETS):
+        return True
+    if sheet_state in ("hidden", "veryHidden"):
+        return True
+    return False
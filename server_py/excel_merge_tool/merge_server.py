@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""Warm pre-forked merge workers for batch runs of merge_final.py.
+
+Every ``python merge_final.py`` run starts an interpreter and imports
+openpyxl and the merge engines before the first cell is read, which costs
+more than merging a small budget. A script merging hundreds of tender files
+pays it for every one of them.
+
+``merge_server.py`` pays it once. It imports the engines, merges a tiny
+generated workbook with every backend so openpyxl's lazily loaded parts are
+in place too, and then forks the workers, which inherit the warm
+interpreter::
+
+    python merge_server.py --socket /tmp/merge.sock --workers 4 &
+    python merge_client.py --server /tmp/merge.sock rozpocet.xlsx
+
+The workers accept jobs on one shared Unix socket, one job at a time each.
+A job is a ``merge_final.py`` command line; it runs in the client's working
+directory and its output and exit status are those of a local run. Every
+worker is replaced after ``--max-jobs`` jobs (openpyxl leaves a fragmented
+heap behind) and when it dies.
+
+Protocol, one JSON object per line: the client sends
+``{"argv": [...], "cwd": "..."}``; the worker answers with ``{"out": text}``
+and ``{"err": text}`` while the job runs and ends with ``{"exit": status}``.
+The client side is merge_client.py.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+import tempfile
+import time
+import traceback
+from contextlib import redirect_stderr, redirect_stdout
+from typing import BinaryIO, TextIO
+
+import openpyxl
+
+import merge_final
+from merge_client import send
+from merge_engine import backend_names, merge
+from merge_layout import SKIP_SHEETS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_JOBS = 100
+
+
+class _Channel:
+    """Text stream that forwards every write to the client as ``{key: text}``."""
+
+    def __init__(self, wfile: BinaryIO, key: str):
+        self.wfile = wfile
+        self.key = key
+
+    def write(self, text: str) -> int:
+        if text:
+            send(self.wfile, {self.key: text})
+        return len(text)
+
+    def flush(self) -> None:
+        pass
+
+    def isatty(self) -> bool:
+        return False
+
+
+def warm_up() -> None:
+    """Merge a tiny budget with every backend, so the first real job does not load anything."""
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "warm_up.xlsx")
+        wb = openpyxl.Workbook()
+        wb.active.title = SKIP_SHEETS[0]
+        ws = wb.create_sheet("SO 01")
+        ws.append(["1", "HSV", "1", "K", "001", "Položka", "m3", 1.5, 100, "=H1*I1"])
+        ws.merge_cells("A2:J2")
+        wb.save(source)
+        for backend in backend_names():
+            merge([source], os.path.join(tmp, f"{backend}.xlsx"), backend)
+
+
+def run_job(argv: list[str], cwd: str, stdout: TextIO, stderr: TextIO) -> int:
+    """Run ``merge_final.py argv`` in ``cwd`` and return its exit status."""
+    previous, program = os.getcwd(), sys.argv[0]
+    try:
+        os.chdir(cwd)
+        sys.argv[0] = merge_final.__file__  # argparse names it in usage and errors
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            try:
+                return merge_final.main(argv)
+            except SystemExit as exc:  # argparse errors and --help
+                if exc.code is None or isinstance(exc.code, int):
+                    return exc.code or 0
+                print(exc.code, file=sys.stderr)
+                return 1
+            except Exception:
+                traceback.print_exc()
+                return 1
+    finally:
+        os.chdir(previous)
+        sys.argv[0] = program
+
+
+def _handle(conn: socket.socket) -> None:
+    with conn.makefile("rb") as rfile, conn.makefile("wb") as wfile:
+        request = json.loads(rfile.readline())
+        start = time.perf_counter()
+        status = run_job(request["argv"], request["cwd"], _Channel(wfile, "out"), _Channel(wfile, "err"))
+        logger.info("%s: exit %s in %.2fs", " ".join(request["argv"]), status, time.perf_counter() - start)
+        send(wfile, {"exit": status})
+
+
+def _worker(listener: socket.socket, max_jobs: int) -> None:
+    """Body of a forked worker; never returns."""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    try:
+        for _ in range(max_jobs):
+            conn, _ = listener.accept()
+            with conn:
+                try:
+                    _handle(conn)
+                except (OSError, ValueError, KeyError):
+                    logger.exception("Job failed")
+    finally:
+        logging.shutdown()
+        os._exit(0)
+
+
+def _listen(path: str) -> socket.socket:
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except OSError:
+            os.unlink(path)  # left behind by a server that did not stop cleanly
+        else:
+            raise SystemExit(f"a merge server already listens on {path}")
+        finally:
+            probe.close()
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    umask = os.umask(0o177)  # jobs read and write the files of whoever connects
+    try:
+        listener.bind(path)
+    finally:
+        os.umask(umask)
+    listener.listen(64)
+    return listener
+
+
+def serve(socket_path: str, workers: int = DEFAULT_WORKERS, max_jobs: int = DEFAULT_MAX_JOBS) -> None:
+    """Warm up, fork ``workers`` workers on ``socket_path`` and keep them running until SIGTERM/SIGINT."""
+    start = time.perf_counter()
+    warm_up()
+    logger.info("Warmed up in %.2fs", time.perf_counter() - start)
+
+    listener = _listen(socket_path)
+    children: set[int] = set()
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        while True:
+            while len(children) < workers:
+                pid = os.fork()
+                if pid == 0:
+                    _worker(listener, max_jobs)
+                children.add(pid)
+            pid, status = os.wait()
+            children.discard(pid)
+            if os.waitstatus_to_exitcode(status) != 0:
+                logger.warning("Worker %d exited with %d", pid, os.waitstatus_to_exitcode(status))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in children:
+            os.waitpid(pid, 0)
+        listener.close()
+        os.unlink(socket_path)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Serve merge_final.py jobs from warm pre-forked workers.")
+    parser.add_argument("--socket", required=True, metavar="PATH", help="Unix socket to listen on")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        metavar="N",
+        help=f"jobs run at the same time (default: {DEFAULT_WORKERS})",
+    )
+    parser.add_argument(
+        "--max-jobs",
+        type=int,
+        default=DEFAULT_MAX_JOBS,
+        metavar="N",
+        help=f"replace a worker after N jobs (default: {DEFAULT_MAX_JOBS})",
+    )
+    args = parser.parse_args(argv)
+    if args.workers < 1 or args.max_jobs < 1:
+        parser.error("--workers and --max-jobs must be at least 1")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(process)d %(message)s")
+    serve(args.socket, args.workers, args.max_jobs)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,56 @@
+"""Bulk replay of merged ranges and row heights into an in-memory "Kombinovane".
+
+``Worksheet.merge_cells`` checks each new range against every range already
+merged and replaces all covered cells with ``MergedCell`` objects, so budgets
+with thousands of merged description rows spent most of the merge there.
+``RangeReplay`` collects the shifted ranges and row heights instead and
+hands them to the worksheet in one go on ``close()``; openpyxl then writes
+them straight to ``<mergeCells>`` and the ``<row>`` elements when saving.
+
+Covered cells keep the format copied from the source (the borders openpyxl
+gave them when it read the merged range) rather than being replaced, which
+looks the same in Excel. The streaming engine builds its ranges the same way
+(see ``streaming_merge.CombinedWriter``).
+"""
+
+from __future__ import annotations
+
+from openpyxl.worksheet.cell_range import CellRange, MultiCellRange
+
+from merge_layout import MAX_SOURCE_COLS
+
+
+class RangeReplay:
+    def __init__(self, target):
+        self.target = target
+        self.ranges: list[CellRange] = []
+        self.heights: dict[int, float] = {}
+
+    def merge(self, min_row: int, min_col: int, max_row: int, max_col: int) -> None:
+        self.ranges.append(CellRange(min_col=min_col, min_row=min_row, max_col=max_col, max_row=max_row))
+
+    def add_sheet(self, sheet, row_offset: int, col_offset: int, max_row: int) -> None:
+        """Queue the merged ranges and row heights of source ``sheet``.
+
+        Source cell (r, c) lands on (r + row_offset, c + col_offset); ranges
+        are clipped to the copied columns, heights to rows up to ``max_row``.
+        Only rows that have a row dimension in the source are looked at.
+        """
+        for merged in sheet.merged_cells.ranges:
+            if merged.min_col > MAX_SOURCE_COLS:
+                continue
+            self.merge(
+                merged.min_row + row_offset,
+                merged.min_col + col_offset,
+                merged.max_row + row_offset,
+                min(merged.max_col, MAX_SOURCE_COLS) + col_offset,
+            )
+        for row, dimension in sheet.row_dimensions.items():
+            if row <= max_row and dimension.height is not None:
+                self.heights[row + row_offset] = dimension.height
+
+    def close(self) -> None:
+        target = self.target
+        target.merged_cells = MultiCellRange([*target.merged_cells.ranges, *self.ranges])
+        for row, height in self.heights.items():
+            target.row_dimensions[row].height = height
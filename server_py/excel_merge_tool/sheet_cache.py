@@ -0,0 +1,249 @@
+"""Parsed-sheet cache for incremental re-merges.
+
+Budgets are revised a sheet or two at a time, yet every merge used to parse
+every sheet again. With a ``SheetCache`` the streaming engine stores the
+parsed rows of each sheet under a fingerprint of what the parse depends on,
+and on the next merge reuses the sheets whose fingerprint is unchanged. Only new or edited sheets are parsed; the output is then written
+from the mix of cached and fresh blocks exactly as without the cache.
+
+A fingerprint is a SHA-256 over:
+
+- the sheet's XML part, with shared-string references resolved to the
+  strings themselves;
+- ``xl/styles.xml`` and the date epoch (style ids and date conversion);
+- options of the merge that change the parsed blocks (trailing-rows policy).
+
+It does not cover the sheet's name or workbook, so a sheet copied unchanged
+into another workbook is reused as well.
+
+Rows are written to the cache while the sheet is copied and read back
+batch by batch, so a cached merge holds no more of a sheet in memory than
+an uncached one. Every sheet is a file of pickled row batches under
+``root``; ``prune()`` drops the least recently used ones beyond
+``max_bytes``. Unpickling runs code, so ``root``
+must be private to the current user: it is created with mode 0700 and an
+existing directory owned by someone else or writable by group or others
+is refused with ``UnsafeCacheDir``.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import pickle
+import re
+import tempfile
+from typing import BinaryIO, Iterator, Optional
+
+from openpyxl.xml.constants import ARC_STYLE
+
+from merge_layout import MAX_SOURCE_COLS
+
+# Bump when the parsed rows or the file layout change shape.
+CACHE_VERSION = 2
+# Rows per pickled record of a cached sheet.
+BATCH_ROWS = 1000
+
+_CHUNK_SIZE = 1024 * 1024
+# Shared-string cells: <c ... t="s" ...><v>index</v></c>, either quote style
+_SHARED_STRING_CELL = re.compile(rb'(<c\b[^>]*?\bt=["\']s["\'][^>]*>\s*<v>)\s*(\d+)\s*(</v>)')
+_SHARED_STRING_TYPE = re.compile(rb'\bt=["\']s["\']')
+
+
+def workbook_context(workbook, *params) -> str:
+    """What every sheet fingerprint of a read-only ``workbook`` shares.
+
+    ``params`` are options of the caller that change the parsed blocks.
+    """
+    digest = hashlib.sha256(
+        f"v{CACHE_VERSION}:{MAX_SOURCE_COLS}:{workbook.epoch}:{workbook.data_only}:{params!r}".encode()
+    )
+    archive = workbook._archive
+    if ARC_STYLE in archive.namelist():
+        digest.update(archive.read(ARC_STYLE))
+    return digest.hexdigest()
+
+
+def sheet_fingerprint(sheet, context: str) -> str:
+    """Fingerprint of a read-only worksheet; reads its XML part once, without parsing it.
+
+    Shared-string indices are replaced by the strings they stand for before
+    hashing, so renumbering the shared string table (which Excel and openpyxl
+    do whenever a string is added) does not invalidate unchanged sheets.
+    """
+    strings = sheet._shared_strings
+    digest = hashlib.sha256(context.encode())
+    typed = matched = 0
+
+    def resolve(match: re.Match) -> bytes:
+        nonlocal matched
+        matched += 1
+        i = int(match.group(2))
+        value = (strings[i] if i < len(strings) else "").encode("utf-8", "surrogatepass")
+        return b"%s%d:%s%s" % (match.group(1), len(value), value, match.group(3))
+
+    def scan(data: bytes) -> None:
+        nonlocal typed
+        typed += len(_SHARED_STRING_TYPE.findall(data))
+        digest.update(_SHARED_STRING_CELL.sub(resolve, data))
+
+    tail = b""
+    with sheet._get_source() as src:
+        for chunk in iter(lambda: src.read(_CHUNK_SIZE), b""):
+            # Cells may straddle chunks: keep the last, maybe unfinished one.
+            data = tail + chunk
+            cut = data.rfind(b"<c ")
+            cut = cut if cut >= 0 else len(data)
+            scan(data[:cut])
+            tail = data[cut:]
+        scan(tail)
+
+    if typed != matched:
+        # Markup the pattern does not understand: depend on the whole table.
+        for value in strings:
+            digest.update(b"\0" + str(value).encode("utf-8", "surrogatepass"))
+    return digest.hexdigest()
+
+
+class UnsafeCacheDir(PermissionError):
+    """The cache directory could be written by someone other than the current user."""
+
+
+def _check_private_dir(path: str) -> None:
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    stat = os.stat(path)
+    if stat.st_uid != os.geteuid():
+        raise UnsafeCacheDir(f"sheet cache {path} is owned by uid {stat.st_uid}, not by this user")
+    if stat.st_mode & 0o022:
+        raise UnsafeCacheDir(f"sheet cache {path} is writable by group or others (mode {stat.st_mode & 0o777:o})")
+
+
+class SheetCache:
+    def __init__(self, root: str, max_bytes: int = 0):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        _check_private_dir(root)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}.pickle")
+
+    def contains(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def get(self, key: str) -> Optional["CachedSheet"]:
+        """The cached sheet for ``key``, or None."""
+        path = self._path(key)
+        try:
+            fh = open(path, "rb")
+        except OSError:
+            return None
+        try:
+            os.utime(path)  # recently used, for prune()
+        except OSError:
+            pass
+        self.hits += 1
+        return CachedSheet(fh)
+
+    def record(self, key: str, stream) -> "RecordingSheet":
+        """Wrap a freshly parsed sheet stream so its rows are stored under ``key`` as they are read."""
+        self.misses += 1
+        return RecordingSheet(self._path(key), stream)
+
+    def put(self, key: str, block) -> None:
+        """Store a sheet parsed in full (a ``SheetBlock``)."""
+        for _ in self.record(key, block).rows():
+            pass
+
+    def prune(self) -> int:
+        """Delete least recently used blocks beyond ``max_bytes`` (0: keep all). Returns files removed."""
+        if self.max_bytes <= 0:
+            return 0
+        entries = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if not name.endswith(".pickle"):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+    def summary(self) -> str:
+        return f"{self.hits} sheet(s) reused, {self.misses} parsed"
+
+
+class CachedSheet:
+    """A cached sheet replayed with the ``SheetStream`` interface, one batch of rows at a time.
+
+    ``merged_ranges`` is filled once ``rows()`` is exhausted. The file is
+    opened by ``SheetCache.get``, so a ``prune()`` meanwhile cannot take it
+    away.
+    """
+
+    def __init__(self, fh: BinaryIO):
+        self._fh = fh
+        self.merged_ranges: list[tuple[int, int, int, int]] = []
+
+    def rows(self) -> Iterator[tuple]:
+        with self._fh as fh:
+            while True:
+                kind, payload = pickle.load(fh)
+                if kind == "end":
+                    self.merged_ranges = payload
+                    return
+                yield from payload
+
+
+class RecordingSheet:
+    """Passes the rows of ``stream`` through and writes them to ``path`` on the way.
+
+    The file only appears once ``rows()`` is exhausted; a copy that stops
+    early leaves nothing behind.
+    """
+
+    def __init__(self, path: str, stream):
+        self.path = path
+        self.stream = stream
+
+    @property
+    def merged_ranges(self) -> list[tuple[int, int, int, int]]:
+        return self.stream.merged_ranges
+
+    def rows(self) -> Iterator[tuple]:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                batch = []
+                for row in self.stream.rows():
+                    batch.append(row)
+                    if len(batch) >= BATCH_ROWS:
+                        pickle.dump(("rows", batch), fh, protocol=pickle.HIGHEST_PROTOCOL)
+                        batch = []
+                    yield row
+                pickle.dump(("rows", batch), fh, protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump(("end", self.stream.merged_ranges), fh, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
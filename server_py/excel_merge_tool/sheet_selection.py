@@ -0,0 +1,114 @@
+"""Which source sheets a merge processes, decided from workbook metadata.
+
+A sheet's title and visibility are listed in ``xl/workbook.xml``, so the
+choice never needs the sheet's own XML. ``SheetSelection`` holds the rules;
+``load_selected_workbook`` is ``openpyxl.load_workbook`` for the in-memory
+engines that does not parse the worksheets left out. Read-only workbooks
+(streaming engine, data export) parse a sheet only when it is iterated, so
+they just filter with ``selects()``.
+
+The sheets in ``SKIP_SHEETS`` and sheets without a title are always left out.
+"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from typing import Optional, Pattern
+
+from openpyxl.reader.excel import ExcelReader
+
+from merge_layout import SKIP_SHEETS
+
+
+def _normalize(title: Optional[str]) -> str:
+    return (title or "").strip().lower()
+
+
+@dataclass
+class SheetSelection:
+    """Include/exclude rules for source sheets.
+
+    ``include`` names limit the merge to those sheets, ``include_pattern``
+    to titles matching the regex (``re.search``); with both, a sheet matching
+    either is included. ``exclude``/``exclude_pattern`` then remove sheets.
+    Names compare case-insensitively, ignoring surrounding whitespace.
+    ``visible_only`` leaves out hidden and very hidden sheets.
+    """
+
+    include: tuple[str, ...] = ()
+    exclude: tuple[str, ...] = ()
+    include_pattern: Optional[str] = None
+    exclude_pattern: Optional[str] = None
+    visible_only: bool = True
+    _include_names: frozenset = field(init=False, repr=False, compare=False)
+    _exclude_names: frozenset = field(init=False, repr=False, compare=False)
+    _include_re: Optional[Pattern] = field(init=False, repr=False, compare=False)
+    _exclude_re: Optional[Pattern] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        # Raises re.error for an invalid pattern.
+        self._include_names = frozenset(_normalize(name) for name in self.include)
+        self._exclude_names = frozenset(_normalize(name) for name in (*SKIP_SHEETS, *self.exclude))
+        self._include_re = re.compile(self.include_pattern) if self.include_pattern else None
+        self._exclude_re = re.compile(self.exclude_pattern) if self.exclude_pattern else None
+
+    def selects(self, title: Optional[str], sheet_state: Optional[str] = None) -> bool:
+        key = _normalize(title)
+        if not key or key in self._exclude_names:
+            return False
+        if self.visible_only and sheet_state in ("hidden", "veryHidden"):
+            return False
+        if self._exclude_re is not None and self._exclude_re.search(title):
+            return False
+        if self._include_names or self._include_re is not None:
+            return key in self._include_names or (
+                self._include_re is not None and self._include_re.search(title) is not None
+            )
+        return True
+
+    def params(self) -> dict:
+        """The rules as plain data (cache keys, job state); ``SheetSelection(**params)`` restores them."""
+        return {
+            "include": sorted(self._include_names),
+            "exclude": sorted({_normalize(name) for name in self.exclude}),
+            "include_pattern": self.include_pattern,
+            "exclude_pattern": self.exclude_pattern,
+            "visible_only": self.visible_only,
+        }
+
+
+DEFAULT_SELECTION = SheetSelection()
+
+
+class _SelectiveReader(ExcelReader):
+    """``ExcelReader`` that drops unselected sheets before any worksheet is read."""
+
+    def __init__(self, filename, selection: SheetSelection, **kwargs):
+        super().__init__(filename, **kwargs)
+        self.selection = selection
+
+    def read_workbook(self) -> None:
+        super().read_workbook()
+        parser = self.parser
+        kept = [(idx, sheet) for idx, sheet in enumerate(parser.sheets) if self.selection.selects(sheet.name, sheet.state)]
+        parser.sheets = [sheet for _, sheet in kept]
+
+        # Sheet-scoped defined names refer to sheets by position: renumber
+        # them and drop those of the sheets left out.
+        positions = {old: new for new, (old, _) in enumerate(kept)}
+        names = []
+        for defn in parser.defined_names.definedName:
+            if defn.localSheetId is not None:
+                if int(defn.localSheetId) not in positions:
+                    continue
+                defn.localSheetId = positions[int(defn.localSheetId)]
+            names.append(defn)
+        parser.defined_names.definedName = names
+
+
+def load_selected_workbook(filename, selection: SheetSelection = DEFAULT_SELECTION, **kwargs):
+    """``openpyxl.load_workbook`` that only parses the sheets ``selection`` picks."""
+    reader = _SelectiveReader(filename, selection, **kwargs)
+    reader.read()
+    return reader.wb
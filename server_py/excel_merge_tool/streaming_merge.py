@@ -0,0 +1,623 @@
+"""Bounded-memory merge engine.
+
+The source workbook is opened with ``read_only=True`` and every sheet is
+parsed exactly once, row by row. The "Kombinovane" sheet is produced by a
+``write_only=True`` workbook, so rows are written in order and never held in
+memory. Merged ranges, row heights, column widths, freeze panes and the
+autofilter go through the write-only worksheet API.
+
+openpyxl's ``iter_rows`` on a read-only sheet throws away row heights and
+merged ranges, so the engine drives the same worksheet parser that
+``iter_rows`` uses and reads those from it in the same pass.
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, contextmanager
+from typing import Any, BinaryIO, Callable, Iterator, Optional, Union
+from xml.etree.ElementTree import iterparse
+
+import openpyxl
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.read_only import ReadOnlyCell
+from openpyxl.utils import get_column_letter, range_boundaries
+from openpyxl.worksheet._reader import WorkSheetParser
+from openpyxl.worksheet.cell_range import CellRange, MultiCellRange
+from openpyxl.xml.constants import SHEET_MAIN_NS
+
+from merge_layout import (
+    HEADER_ALIGNMENT,
+    HEADER_FILL,
+    HEADER_FONT,
+    HEADER_ROW_HEIGHT,
+    LIST_COLUMN_WIDTH,
+    MAX_SOURCE_COLS,
+    SEPARATOR_ROW_HEIGHT,
+    SHEET_HEADER_ALIGNMENT,
+    SHEET_HEADER_FONT,
+    SOURCE_FILE_COLUMN_WIDTH,
+    TARGET_SHEET_TITLE,
+    combined_headers,
+)
+from instrumentation import StageTimer
+from sheet_cache import SheetCache, sheet_fingerprint, workbook_context
+from sheet_selection import DEFAULT_SELECTION, SheetSelection
+from style_cache import StyleCache
+from used_range import DEFAULT_TRAILING_STYLED_ROWS, scan_max_column, scan_used_range
+from zip_output import ZipOptions, save_workbook
+
+Source = Union[str, BinaryIO]
+# Called with (sheets processed, source rows processed).
+ProgressCallback = Callable[[int, int], None]
+# (column, value, style id) of one parsed source cell.
+Cell = tuple[int, Any, int]
+Row = tuple[int, list[Cell], Optional[float]]
+# Row limit and merged ranges of a trimmed sheet, as SheetStream takes them.
+RowLimit = tuple[int, list[tuple[int, int, int, int]]]
+
+DEFAULT_COLUMN_WIDTH = 13  # what openpyxl reports for a column without <col>
+PROGRESS_EVERY_ROWS = 5000
+
+_COL_TAG = f"{{{SHEET_MAIN_NS}}}col"
+_DIMENSION_TAG = f"{{{SHEET_MAIN_NS}}}dimension"
+_DATA_TAG = f"{{{SHEET_MAIN_NS}}}sheetData"
+
+
+def read_column_widths(sheet, max_column: Optional[int] = None) -> dict[int, float]:
+    """Widths of source columns 1..MAX_SOURCE_COLS, read before <sheetData>.
+
+    Write-only worksheets emit <cols> ahead of the first row, so widths have
+    to be known before any sheet is copied. The sheet's <dimension> stands in
+    for ``max_column`` unless the caller knows better (a trimmed sheet, see
+    ``used_range.scan_max_column``); columns inside it without a <col> get
+    openpyxl's default width, the same as the in-memory engine sees.
+    """
+    max_col = MAX_SOURCE_COLS if max_column is None else min(max_column, MAX_SOURCE_COLS)
+    explicit: dict[int, float] = {}
+
+    with sheet._get_source() as src:
+        for _, element in iterparse(src, events=("start",)):
+            if element.tag == _DIMENSION_TAG and max_column is None:
+                ref = element.get("ref", "")
+                try:
+                    max_col = min(range_boundaries(ref)[2] or MAX_SOURCE_COLS, MAX_SOURCE_COLS)
+                except ValueError:
+                    pass
+            elif element.tag == _COL_TAG:
+                col = int(element.get("min", 0))
+                if 1 <= col <= MAX_SOURCE_COLS:
+                    explicit[col] = float(element.get("width", DEFAULT_COLUMN_WIDTH))
+            elif element.tag == _DATA_TAG:
+                break
+
+    return {c: explicit.get(c, DEFAULT_COLUMN_WIDTH) for c in range(1, max_col + 1)}
+
+
+class SheetStream:
+    """Single pass over a read-only worksheet.
+
+    ``rows()`` yields ``(row_idx, cells, height)`` for every <row> element,
+    with cells as ``(column, value, style_id)``; ``merged_ranges`` is filled
+    once the generator is exhausted because <mergeCells> follows <sheetData>
+    in the part.
+
+    With ``max_row`` parsing stops at the first row past it; the merged
+    ranges it would have read later must then be passed in (see
+    ``used_range.scan_used_range``).
+    """
+
+    def __init__(
+        self,
+        workbook,
+        sheet,
+        max_row: Optional[int] = None,
+        merged_ranges: Optional[list[tuple[int, int, int, int]]] = None,
+        collapse: bool = False,
+    ):
+        self.workbook = workbook
+        self.sheet = sheet
+        self.max_row = max_row
+        self.merged_ranges: list[tuple[int, int, int, int]] = []
+        self._known_merged_ranges = merged_ranges
+        self.collapse = collapse  # as a SheetBlock keeps them
+
+    def rows(self) -> Iterator[Row]:
+        wb = self.workbook
+        with self.sheet._get_source() as src:
+            parser = WorkSheetParser(
+                src,
+                self.sheet._shared_strings,
+                data_only=wb.data_only,
+                epoch=wb.epoch,
+                date_formats=wb._date_formats,
+                timedelta_formats=wb._timedelta_formats,
+            )
+            for idx, cells in parser.parse():
+                if self.max_row is not None and idx > self.max_row:
+                    self.merged_ranges.extend(self._known_merged_ranges or ())
+                    return
+                attrs = parser.row_dimensions.pop(str(idx), None) or {}
+                height = attrs.get("ht")
+                row = [(c["column"], c["value"], c["style_id"]) for c in cells]
+                yield (
+                    idx,
+                    _collapse(row) if self.collapse else row,
+                    float(height) if height is not None else None,
+                )
+
+            if parser.merged_cells is not None:
+                for merged in parser.merged_cells.mergeCell:
+                    min_col, min_row, max_col, max_row = range_boundaries(merged.ref)
+                    self.merged_ranges.append((min_row, min_col, max_row, max_col))
+
+
+def _collapse(cells: list[Cell]) -> list[Cell]:
+    """``cells`` with those right of the copied columns replaced by one valueless placeholder."""
+    kept = [cell for cell in cells if cell[0] <= MAX_SOURCE_COLS]
+    if len(kept) < len(cells):
+        kept.append((MAX_SOURCE_COLS + 1, None, 0))
+    return kept
+
+
+class SheetBlock:
+    """A sheet parsed by a worker process, replayed with the ``SheetStream`` interface.
+
+    Cells right of the copied columns are collapsed into one valueless
+    placeholder per row: they are never written, but still decide whether a
+    sheet counts as empty.
+    """
+
+    def __init__(self, rows: list[Row], merged_ranges: list[tuple[int, int, int, int]]):
+        self.parsed_rows = rows
+        self.merged_ranges = merged_ranges
+
+    @classmethod
+    def from_stream(cls, stream: SheetStream) -> "SheetBlock":
+        rows = [(idx, _collapse(cells), height) for idx, cells, height in stream.rows()]
+        return cls(rows, stream.merged_ranges)
+
+    def rows(self) -> Iterator[Row]:
+        return iter(self.parsed_rows)
+
+
+# Source workbook of a parse worker as (path, workbook); kept open across
+# tasks and replaced when a task names another file.
+_worker_source: Optional[tuple[str, Any]] = None
+
+
+def _parse_sheet(
+    path: str,
+    title: str,
+    max_row: Optional[int] = None,
+    merged_ranges: Optional[list[tuple[int, int, int, int]]] = None,
+) -> SheetBlock:
+    global _worker_source
+    if _worker_source is None or _worker_source[0] != path:
+        if _worker_source is not None:
+            _worker_source[1].close()
+        _worker_source = (path, openpyxl.load_workbook(path, read_only=True))
+    workbook = _worker_source[1]
+    return SheetBlock.from_stream(SheetStream(workbook, workbook[title], max_row, merged_ranges))
+
+
+def _parsed_blocks(tasks: list[tuple], workers: int) -> Iterator[SheetBlock]:
+    """Yield the parsed ``_parse_sheet`` tasks (path, sheet title, row limit...) in order.
+
+    At most ``workers`` sheets are parsed ahead of the one being written, so
+    memory grows with the largest few sheets rather than the whole workbook.
+    """
+    # spawn: the service is multi-threaded, forking it is not safe.
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        remaining = iter(tasks)
+        pending = deque(pool.submit(_parse_sheet, *task) for _, task in zip(range(workers), remaining))
+        while pending:
+            block = pending.popleft().result()
+            for task in remaining:
+                pending.append(pool.submit(_parse_sheet, *task))
+                break
+            yield block
+
+
+@contextmanager
+def _on_disk(source: Source) -> Iterator[str]:
+    """Path of ``source``; file objects are spooled to a temporary file for the workers."""
+    if isinstance(source, (str, os.PathLike)):
+        yield os.fspath(source)
+        return
+
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            shutil.copyfileobj(source, fh)
+        yield path
+    finally:
+        os.remove(path)
+
+
+class CombinedWriter:
+    """Appends rows to the write-only "Kombinovane" sheet and tracks offsets.
+
+    ``merge_streaming_many`` takes a subclass as ``writer_class`` to produce
+    the rows some other way (see merge_engine/xml_direct.py).
+    """
+
+    def __init__(self, sheet, columns: int):
+        self.sheet = sheet
+        self.columns = columns
+        self.rows_written = 0
+        self.last_row_with_cells = 0
+        self.merged: list[CellRange] = []
+
+    def append(self, cells: list, height: float | None = None) -> int:
+        row_idx = self.rows_written + 1
+        if height is not None:
+            self.sheet.row_dimensions[row_idx].height = height
+        self.sheet.append(cells)
+        # The writer has consumed the dimension; do not keep one per row.
+        self.sheet.row_dimensions.pop(row_idx, None)
+        self.rows_written = row_idx
+        if any(c is not None for c in cells):
+            self.last_row_with_cells = row_idx
+        return row_idx
+
+    def append_source(
+        self, prefix: list, sheet, src_idx: int, cells: list[Cell], height: float | None, styles: StyleCache
+    ) -> int:
+        """Append source row ``src_idx`` of ``sheet`` after ``prefix``. Returns the cells copied."""
+        offset = len(prefix)  # target column of source column 1, minus one
+        out: list = prefix + [None] * MAX_SOURCE_COLS
+        copied = 0
+        for c, value, style_id in cells:
+            if c > MAX_SOURCE_COLS:
+                continue
+            if value is None and not style_id:
+                continue
+            tgt_cell = WriteOnlyCell(self.sheet, value=value)
+            if style_id:
+                styles.copy_format(ReadOnlyCell(sheet, src_idx, c, value, "n", style_id), tgt_cell)
+            out[offset + c - 1] = tgt_cell
+            copied += 1
+        self.append(out, height)
+        return copied
+
+    def merge(self, min_row: int, min_col: int, max_row: int, max_col: int) -> None:
+        self.merged.append(CellRange(min_col=min_col, min_row=min_row, max_col=max_col, max_row=max_row))
+
+    def close(self) -> None:
+        self.sheet.merged_cells = MultiCellRange(self.merged)
+        self.sheet.auto_filter.ref = f"A1:{get_column_letter(self.columns)}{max(self.last_row_with_cells, 1)}"
+
+    def save(self, workbook, output_file: Source, zip_options: Optional[ZipOptions] = None) -> None:
+        save_workbook(workbook, output_file, zip_options)
+
+
+def _styled_cell(sheet, value, font, fill, alignment) -> WriteOnlyCell:
+    cell = WriteOnlyCell(sheet, value=value)
+    cell.font = font
+    cell.fill = fill
+    cell.alignment = alignment
+    return cell
+
+
+def _is_significant(row_idx: int, cell: Cell) -> bool:
+    """True for anything that stops a sheet from counting as empty.
+
+    Mirrors ``max_row <= 1 and max_column <= 1 and A1 is None``.
+    """
+    return row_idx > 1 or cell[0] > 1 or cell[1] is not None
+
+
+class _ProgressTracker:
+    def __init__(self, callback: Optional[ProgressCallback]):
+        self.callback = callback
+        self.sheets = 0
+        self.rows = 0
+        self.cells = 0
+
+    def row_parsed(self) -> None:
+        self.rows += 1
+        if self.callback is not None and self.rows % PROGRESS_EVERY_ROWS == 0:
+            self.callback(self.sheets, self.rows)
+
+    def sheet_done(self) -> None:
+        self.sheets += 1
+        if self.callback is not None:
+            self.callback(self.sheets, self.rows)
+
+
+def _copy_sheet(
+    sheet,
+    stream: SheetStream | SheetBlock,
+    writer: CombinedWriter,
+    styles: StyleCache,
+    tracker: _ProgressTracker,
+    source_file: Optional[str] = None,
+) -> bool:
+    """Copy one source sheet below the rows already written. Returns False if skipped.
+
+    ``sheet`` is the read-only source worksheet (it resolves style ids),
+    ``stream`` supplies its rows and merged ranges. With ``source_file`` the
+    rows start with a column naming the workbook they came from.
+    """
+    title = sheet.title
+    prefix = [title] if source_file is None else [source_file, title]
+    offset = len(prefix)  # target column of source column 1, minus one
+    label = f"=== {title} ===" if source_file is None else f"=== {source_file} / {title} ==="
+    started = False
+    # Rows that only count once a later row proves the sheet is not empty, or
+    # that lie past the last cell (height-only rows are not copied there).
+    deferred: list[Row] = []
+    next_src_row = 1
+    data_start_row = 0
+
+    def write_separator() -> None:
+        nonlocal data_start_row
+        cells = [_styled_cell(writer.sheet, label, SHEET_HEADER_FONT, HEADER_FILL, SHEET_HEADER_ALIGNMENT)]
+        for _ in range(2, writer.columns + 1):
+            cells.append(_styled_cell(writer.sheet, None, SHEET_HEADER_FONT, HEADER_FILL, SHEET_HEADER_ALIGNMENT))
+        row_idx = writer.append(cells, SEPARATOR_ROW_HEIGHT)
+        writer.merge(row_idx, 1, row_idx, writer.columns)
+        data_start_row = row_idx + 1
+
+    def write_source_row(src_idx: int, cells: list[Cell], height: float | None) -> None:
+        nonlocal next_src_row
+        while next_src_row < src_idx:
+            writer.append(prefix)
+            next_src_row += 1
+
+        tracker.cells += writer.append_source(prefix, sheet, src_idx, cells, height, styles)
+        next_src_row = src_idx + 1
+
+    def flush(upto: int) -> None:
+        for src_idx, cells, height in deferred:
+            if src_idx <= upto:
+                write_source_row(src_idx, cells, height)
+        deferred.clear()
+
+    for src_idx, cells, height in stream.rows():
+        tracker.row_parsed()
+        if not started and any(_is_significant(src_idx, c) for c in cells):
+            started = True
+            write_separator()
+        if not started or not cells:
+            deferred.append((src_idx, cells, height))
+            continue
+        flush(src_idx)
+        write_source_row(src_idx, cells, height)
+
+    last_merged_row = max((r[2] for r in stream.merged_ranges), default=0)
+    if not started:
+        if not any(r[2] > r[0] or r[3] > r[1] for r in stream.merged_ranges):
+            return False
+        started = True
+        write_separator()
+
+    flush(max(last_merged_row, max((d[0] for d in deferred if d[1]), default=0)))
+    while next_src_row <= last_merged_row:
+        write_source_row(next_src_row, [], None)
+
+    for min_row, min_col, max_row, max_col in stream.merged_ranges:
+        if min_col > MAX_SOURCE_COLS:
+            continue
+        writer.merge(
+            data_start_row + min_row - 1,
+            min_col + offset,
+            data_start_row + max_row - 1,
+            min(max_col, MAX_SOURCE_COLS) + offset,
+        )
+
+    # Gap row between sheets
+    writer.append([])
+    return True
+
+
+def source_name(source: Source, index: int) -> str:
+    """Default "Soubor" value of the ``index``-th input (1-based)."""
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.basename(os.fspath(source))
+    return getattr(source, "name", None) or f"soubor {index}"
+
+
+def merge_streaming(
+    input_file: Source,
+    output_file: Source,
+    style_cache: StyleCache | None = None,
+    progress: Optional[ProgressCallback] = None,
+    workers: int = 1,
+    timer: StageTimer | None = None,
+    selection: SheetSelection = DEFAULT_SELECTION,
+    sheet_cache: SheetCache | None = None,
+    trailing_styled_rows: Optional[int] = DEFAULT_TRAILING_STYLED_ROWS,
+    writer_class: type[CombinedWriter] = CombinedWriter,
+    zip_options: Optional[ZipOptions] = None,
+) -> int:
+    """Merge the sheets of ``input_file`` picked by ``selection`` into ``output_file``.
+
+    Returns the number of source sheets that ended up in the output. Pass a
+    ``style_cache`` to read its hit rate afterwards, a ``timer`` for stage
+    timings. Sheets left out are never parsed.
+
+    With ``workers > 1`` the sheets are parsed in that many worker processes
+    while this process writes them out in workbook order; the output is the
+    same as with a single process.
+
+    With a ``sheet_cache`` sheets parsed by an earlier merge are reused when
+    their XML is unchanged (see sheet_cache.py); the output is the same.
+
+    Empty styled rows below a sheet's content beyond ``trailing_styled_rows``
+    are neither parsed nor copied (see used_range.py).
+
+    ``writer_class`` turns the copied rows into the output sheet; the
+    default goes through openpyxl's write-only worksheet. ``zip_options``
+    set how the output package is compressed (see zip_output.py).
+    """
+    return merge_streaming_many(
+        [input_file],
+        output_file,
+        style_cache,
+        progress,
+        workers,
+        timer,
+        selection=selection,
+        sheet_cache=sheet_cache,
+        trailing_styled_rows=trailing_styled_rows,
+        writer_class=writer_class,
+        zip_options=zip_options,
+    )
+
+
+def merge_streaming_many(
+    input_files: list[Source],
+    output_file: Source,
+    style_cache: StyleCache | None = None,
+    progress: Optional[ProgressCallback] = None,
+    workers: int = 1,
+    timer: StageTimer | None = None,
+    source_names: Optional[list[str]] = None,
+    selection: SheetSelection = DEFAULT_SELECTION,
+    sheet_cache: SheetCache | None = None,
+    trailing_styled_rows: Optional[int] = DEFAULT_TRAILING_STYLED_ROWS,
+    writer_class: type[CombinedWriter] = CombinedWriter,
+    zip_options: Optional[ZipOptions] = None,
+) -> int:
+    """Merge the eligible sheets of several workbooks, one after another.
+
+    With more than one input the output gets a leading "Soubor" column with
+    the workbook's name (``source_names`` or the file's base name). Only one
+    source workbook is open at a time. See ``merge_streaming`` for the rest.
+    """
+    styles = style_cache if style_cache is not None else StyleCache()
+    timer = timer if timer is not None else StageTimer()
+    names = list(source_names) if source_names else [source_name(f, i) for i, f in enumerate(input_files, start=1)]
+    with_source_file = len(input_files) > 1
+    headers = combined_headers(with_source_file)
+    offset = len(headers) - MAX_SOURCE_COLS  # target column of source column 1, minus one
+
+    with ExitStack() as stack:
+        with timer.stage("load"):
+            if workers > 1:
+                input_files = [stack.enter_context(_on_disk(f)) for f in input_files]
+
+            target_wb = openpyxl.Workbook(write_only=True)
+            combined = target_wb.create_sheet(TARGET_SHEET_TITLE)
+            combined.freeze_panes = "A2"
+
+        # Write-only sheets need <cols> before the first row, so every input
+        # is opened briefly for its sheet list and widths first. The same
+        # pass finds where trailing styled rows start. A single input simply
+        # stays open for the copy.
+        with timer.stage("widths"):
+            titles: list[list[str]] = []
+            # Fingerprint of every sheet when caching, in the order of titles.
+            keys: list[list[Optional[str]]] = []
+            # Row limit of every sheet that gets trimmed, else None.
+            limits: list[list[Optional[RowLimit]]] = []
+            trimmed_rows = 0
+            col_widths: dict[str, float] = {}
+            kept_open = None
+            for input_file in input_files:
+                source_wb = openpyxl.load_workbook(input_file, read_only=True)
+                try:
+                    sheets = [s for s in source_wb.worksheets if selection.selects(s.title, s.sheet_state)]
+                    titles.append([s.title for s in sheets])
+                    sheet_limits: list[Optional[RowLimit]] = []
+                    for sheet in sheets:
+                        used = scan_used_range(sheet, trailing_styled_rows) if trailing_styled_rows is not None else None
+                        if used is None or used.max_row(trailing_styled_rows) >= used.last_row:
+                            sheet_limits.append(None)
+                            max_column = None
+                        else:
+                            max_row = used.max_row(trailing_styled_rows)
+                            sheet_limits.append((max_row, list(used.merged_ranges)))
+                            trimmed_rows += used.last_row - max_row
+                            # Trimmed rows do not widen the sheet, as in loaded_bounds.
+                            max_column = scan_max_column(sheet, max_row, used.merged_ranges, MAX_SOURCE_COLS)
+                        for c, w in read_column_widths(sheet, max_column).items():
+                            tgt_col = get_column_letter(c + offset)
+                            col_widths[tgt_col] = max(col_widths.get(tgt_col, 0), w)
+                    limits.append(sheet_limits)
+                    if sheet_cache is not None:
+                        # Blocks hold trimmed sheets, so the policy is part of the key.
+                        context = workbook_context(source_wb, trailing_styled_rows)
+                        keys.append([sheet_fingerprint(sheet, context) for sheet in sheets])
+                    else:
+                        keys.append([None] * len(sheets))
+                finally:
+                    if with_source_file:
+                        source_wb.close()
+                    else:
+                        kept_open = source_wb
+                        stack.callback(source_wb.close)
+            if with_source_file:
+                combined.column_dimensions["A"].width = SOURCE_FILE_COLUMN_WIDTH
+            combined.column_dimensions[get_column_letter(offset)].width = LIST_COLUMN_WIDTH
+            for col, w in col_widths.items():
+                combined.column_dimensions[col].width = w
+
+        with timer.stage("copy"):
+            writer = writer_class(combined, len(headers))
+            header = [_styled_cell(combined, label, HEADER_FONT, HEADER_FILL, HEADER_ALIGNMENT) for label in headers]
+            writer.append(header, HEADER_ROW_HEIGHT)
+
+            # Only sheets without a cached block are parsed.
+            cached = {key for sheet_keys in keys for key in sheet_keys if key is not None and sheet_cache.contains(key)}
+            tasks = [
+                (f, title, *(limit or ()))
+                for f, sheet_titles, sheet_keys, sheet_limits in zip(input_files, titles, keys, limits)
+                for title, key, limit in zip(sheet_titles, sheet_keys, sheet_limits)
+                if key not in cached
+            ]
+            blocks = None
+            if workers > 1 and len(tasks) > 1:
+                blocks = _parsed_blocks(tasks, min(workers, len(tasks)))
+
+            tracker = _ProgressTracker(progress)
+            merged = reused = 0
+            sources = zip(input_files, names, titles, keys, limits)
+            for index, (input_file, name, sheet_titles, sheet_keys, sheet_limits) in enumerate(sources):
+                source_wb = kept_open or openpyxl.load_workbook(input_file, read_only=True)
+                try:
+                    # Style ids are only unique within one source workbook.
+                    styles.start_source(index)
+                    for title, key, limit in zip(sheet_titles, sheet_keys, sheet_limits):
+                        sheet = source_wb[title]
+                        stream = sheet_cache.get(key) if key in cached else None
+                        if stream is not None:
+                            reused += 1
+                        else:
+                            if blocks is not None and key not in cached:
+                                stream = next(blocks)
+                            else:
+                                # Sequential, or a cached block vanished since the pre-pass.
+                                stream = SheetStream(source_wb, sheet, *(limit or ()), collapse=key is not None)
+                            if key is not None:
+                                # Rows go to the cache as they are copied, never all at once.
+                                stream = sheet_cache.record(key, stream)
+                        if _copy_sheet(sheet, stream, writer, styles, tracker, name if with_source_file else None):
+                            merged += 1
+                        tracker.sheet_done()
+                finally:
+                    source_wb.close()
+            if blocks is not None:
+                blocks.close()
+
+        with timer.stage("merges"):
+            writer.close()
+        with timer.stage("save"):
+            writer.save(target_wb, output_file, zip_options)
+
+        if trimmed_rows:
+            timer.count("rows_trimmed", trimmed_rows)
+        if sheet_cache is not None:
+            timer.count("sheets_reused", reused)
+            sheet_cache.prune()
+        timer.count("sheets", merged)
+        timer.count("rows", tracker.rows)
+        timer.count("cells", tracker.cells)
+        return merged
@@ -0,0 +1,79 @@
+"""Style translation cache for copying cells between workbooks.
+
+Tender budgets reuse a few dozen distinct styles across hundreds of thousands
+of cells. Instead of copying font, fill, border, alignment and protection for
+every cell (and looking each of them up in the target workbook's style
+tables), the first cell with a given source style is copied in full and the
+resulting target ``StyleArray`` is reused for every later cell with the same
+source style.
+
+One cache belongs to one target workbook. Source style ids mean nothing in
+another source workbook, so a merge of several sources calls
+``start_source()`` before each of them.
+"""
+
+from __future__ import annotations
+
+from copy import copy
+
+
+def _style_key(cell):
+    style_id = getattr(cell, "_style_id", None)  # ReadOnlyCell
+    if style_id is not None:
+        return style_id
+    return tuple(cell._style)
+
+
+class StyleCache:
+    def __init__(self) -> None:
+        self._styles: dict = {}
+        self._source = None
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._styles)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    @property
+    def source(self):
+        """Id of the source workbook cells currently come from."""
+        return self._source
+
+    def start_source(self, source_id) -> None:
+        """Following cells come from another source workbook."""
+        self._source = source_id
+
+    def record_hit(self) -> None:
+        """Count a style the caller reused from its own cache of ``copy_format`` results."""
+        self.hits += 1
+
+    def copy_format(self, src, tgt) -> None:
+        if not src.has_style:
+            return
+
+        key = (self._source, _style_key(src))
+        style = self._styles.get(key)
+        if style is not None:
+            self.hits += 1
+            tgt._style = copy(style)
+            return
+
+        self.misses += 1
+        tgt.font = copy(src.font)
+        tgt.fill = copy(src.fill)
+        tgt.border = copy(src.border)
+        tgt.alignment = copy(src.alignment)
+        tgt.number_format = src.number_format
+        tgt.protection = copy(src.protection)
+        self._styles[key] = copy(tgt._style)
+
+    def summary(self) -> str:
+        return (
+            f"{len(self)} distinct styles, {self.hits} hits / {self.misses} misses "
+            f"({self.hit_rate:.1%} hit rate)"
+        )
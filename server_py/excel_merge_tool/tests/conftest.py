@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The merge tool's modules import each other by plain name (see merge_final.py).
+MERGE_TOOL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+if MERGE_TOOL_DIR not in sys.path:
+    sys.path.insert(0, MERGE_TOOL_DIR)
@@ -0,0 +1,71 @@
+"""Data export: every row says what it is, and no value is lost."""
+
+from __future__ import annotations
+
+import csv
+import json
+
+import openpyxl
+import pytest
+
+from columnar_export import ITEM_ROW, OTHER_ROW, ROW_KIND_HEADER, export_columns, export_rows
+from instrumentation import StageTimer
+from merge_layout import HEADERS
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    path = tmp_path / "rozpocet.xlsx"
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "SO 01"
+    ws.append(["Soupis prací - SO 01"])
+    ws.append(["Výběrové řízení", "PČ", "Typ", "Kód", "Popis", "MJ", "Množství", "J.cena [CZK]", "Cena celkem [CZK]"])
+    ws.append([None, None, None, None, "Oddíl 1"])
+    ws.append(["VŘ 1", 1, "K", "001", "Výkop", "m3", 1.5, "1 234,50", 1851.75])
+    ws.append(["VŘ 1", 2, "K", "002", "Zásyp", "m3", "dle PD", "cca 100", 10])
+    wb.save(path)
+    return str(path)
+
+
+def _rows(path, fmt):
+    if fmt == "parquet":
+        pq = pytest.importorskip("pyarrow.parquet")
+        return pq.read_table(path).to_pylist()
+    with open(path, encoding="utf-8", newline="") as fh:
+        if fmt == "csv":
+            return list(csv.DictReader(fh))
+        return [json.loads(line) for line in fh]
+
+
+@pytest.mark.parametrize("fmt", ["csv", "jsonl", "parquet"])
+def test_rows_carry_their_kind_and_raw_text(workbook, tmp_path, fmt):
+    if fmt == "parquet":
+        pytest.importorskip("pyarrow")
+    out = tmp_path / f"out.{fmt}"
+    timer = StageTimer()
+    assert export_rows([workbook], str(out), fmt, timer=timer) == 5
+    rows = _rows(out, fmt)
+
+    assert list(rows[0]) == export_columns(False)
+    assert [row[ROW_KIND_HEADER] for row in rows] == [OTHER_ROW, OTHER_ROW, OTHER_ROW, ITEM_ROW, ITEM_ROW]
+    header, item, unparsed = rows[1], rows[3], rows[4]
+
+    # Column headers keep their text, but are not counted as bad numbers.
+    assert header["Množství (text)"] == "Množství"
+    assert float(item["J.cena [CZK]"]) == 1234.5 and item["J.cena [CZK] (text)"] in ("", None)
+    assert unparsed["Množství"] in ("", None) and unparsed["Množství (text)"] == "dle PD"
+    assert unparsed["J.cena [CZK] (text)"] == "cca 100"
+    assert float(unparsed["Cena celkem [CZK]"]) == 10
+    assert timer.counters["values_not_numbers"] == 2
+
+
+def test_columns_extend_the_merged_sheet(tmp_path):
+    columns = export_columns(True)
+    assert columns[: len(HEADERS) + 1] == ["Soubor", *HEADERS]
+    assert columns[len(HEADERS) + 1 :] == [
+        ROW_KIND_HEADER,
+        "Množství (text)",
+        "J.cena [CZK] (text)",
+        "Cena celkem [CZK] (text)",
+    ]
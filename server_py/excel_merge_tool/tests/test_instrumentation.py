@@ -0,0 +1,42 @@
+"""The merge tool runs where ``resource`` does not exist (the desktop app on Windows)."""
+
+from __future__ import annotations
+
+import os
+import subprocess
+import sys
+
+from test_merge_equivalence import _budget
+
+TOOL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+# Makes ``import resource`` fail as it does on Windows, then runs merge_final.py.
+WITHOUT_RESOURCE = """
+import runpy, sys
+sys.modules["resource"] = None
+sys.argv[0] = "merge_final.py"
+runpy.run_path("merge_final.py", run_name="__main__")
+"""
+
+
+def _merge(tmp_path, *interpreter_args: str) -> subprocess.CompletedProcess:
+    source = _budget(tmp_path / "rozpocet.xlsx")
+    return subprocess.run(
+        [sys.executable, *interpreter_args, source, str(tmp_path / "out.xlsx"), "--engine", "xml"],
+        cwd=TOOL_DIR,
+        capture_output=True,
+        text=True,
+    )
+
+
+def test_report_includes_peak_memory(tmp_path):
+    result = _merge(tmp_path, "merge_final.py")
+    assert result.returncode == 0, result.stderr
+    assert "Peak memory: " in result.stdout
+
+
+def test_merge_runs_without_resource(tmp_path):
+    result = _merge(tmp_path, "-c", WITHOUT_RESOURCE)
+    assert result.returncode == 0, result.stderr
+    assert "Done! 4 sheet(s) merged." in result.stdout
+    assert "Peak memory" not in result.stdout
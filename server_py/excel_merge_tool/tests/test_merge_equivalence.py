@@ -0,0 +1,306 @@
+"""Every merge backend must produce the same "Kombinovane" workbook.
+
+The budgets are generated here with the quirks real exports have: merged
+title and section rows, merges reaching past the copied columns, row
+heights, formulas, dates, whitespace-padded texts, empty styled cells,
+styled rows far below the last item, hidden and skipped sheets. Outputs are
+compared cell by cell after loading them back with openpyxl, together with
+merged ranges, row heights, column widths, freeze pane and autofilter.
+"""
+
+from __future__ import annotations
+
+import datetime
+import zipfile
+
+import openpyxl
+import pytest
+from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+
+from merge_engine import BACKENDS, backend_names, get_backend, merge
+from sheet_selection import SheetSelection
+from style_cache import StyleCache
+from used_range import DEFAULT_TRAILING_STYLED_ROWS
+
+REFERENCE = "openpyxl"
+OTHER_BACKENDS = [name for name in backend_names() if name != REFERENCE]
+MULTI_FILE_BACKENDS = [name for name in backend_names() if get_backend(name).multi_file]
+
+THIN = Side(style="thin")
+BOX = Border(left=THIN, right=THIN, top=THIN, bottom=THIN)
+TITLE_FONT = Font(bold=True, size=14)
+SECTION_FILL = PatternFill(start_color="DDEBF7", end_color="DDEBF7", fill_type="solid")
+
+
+def _so_sheet(wb, title: str, items: int, trailing_styled_rows: int = 0) -> None:
+    ws = wb.create_sheet(title)
+    ws["A1"] = f"Soupis prací - {title}"
+    ws["A1"].font = TITLE_FONT
+    ws.merge_cells("A1:J1")
+    ws.row_dimensions[1].height = 24
+    ws["A2"] = "  Stavba: Rekonstrukce objektu & přístavba <B>  "
+    ws["A3"] = "Výběrové řízení"
+    ws["E3"] = "Popis"
+    for cell in ws[3]:
+        cell.border = BOX
+    ws.column_dimensions["A"].width = 14
+    ws.column_dimensions["E"].width = 60
+    ws.column_dimensions["L"].width = 40  # right of the copied columns
+
+    row = 4
+    for i in range(items):
+        if i % 7 == 0:
+            ws.cell(row=row, column=5, value=f"Oddíl {i // 7 + 1}").fill = SECTION_FILL
+            ws.merge_cells(start_row=row, start_column=5, end_row=row, end_column=12)  # clipped at J
+            row += 1
+        values = [
+            "VŘ 1",
+            i + 1,
+            "K",
+            f"{100000 + i}",
+            f"Položka {i}\n druhý řádek" if i % 5 == 0 else f"Položka {i}",
+            "m2",
+            round(1.5 * (i + 1), 3),
+            1234.5 + i,
+            f"=G{row}*H{row}",
+            "CS ÚRS 2024 01",
+        ]
+        for col, value in enumerate(values, start=1):
+            cell = ws.cell(row=row, column=col, value=value)
+            cell.border = BOX
+        ws.cell(row=row, column=8).number_format = "#,##0.00"
+        ws.cell(row=row, column=11, value="mimo")  # never copied
+        if i % 4 == 0:
+            ws.row_dimensions[row].height = 30
+        row += 1
+
+    ws.cell(row=row, column=1, value=datetime.datetime(2024, 3, 1)).number_format = "dd.mm.yyyy"
+    ws.cell(row=row, column=2, value=True)
+    ws.cell(row=row, column=3, value="#N/A")
+    ws.cell(row=row, column=4).border = BOX  # styled, no value
+    ws.cell(row=row + 2, column=5, value="   ")
+    for r in range(row + 3, row + 3 + trailing_styled_rows):
+        ws.cell(row=r, column=2).border = BOX
+
+
+def _budget(path, items: int = 30, trailing_styled_rows: int = 150) -> str:
+    wb = openpyxl.Workbook()
+    wb.active.title = "Rekapitulace stavby"
+    wb.active["A1"] = "skipped"
+    _so_sheet(wb, "SO 01", items, trailing_styled_rows)
+    _so_sheet(wb, "SO 02", items // 2)
+    wb.create_sheet("Prázdný")
+    only_merge = wb.create_sheet("Jen sloučení")
+    only_merge.merge_cells("B2:D3")
+    hidden = wb.create_sheet("Číselník")
+    hidden["A1"] = "hidden"
+    hidden.sheet_state = "hidden"
+    _so_sheet(wb, "VRN", 3)
+    wb.save(path)
+    return str(path)
+
+
+def _gapped_budget(path, gap: int) -> tuple[str, int]:
+    """A budget whose styled tail starts ``gap`` empty rows (one with a height)
+    below the items. Returns (path, last item row)."""
+    wb = openpyxl.Workbook()
+    _so_sheet(wb, "SO 01", 10)
+    ws = wb["SO 01"]
+    content_row = ws.max_row
+    ws.row_dimensions[content_row + gap // 2 + 1].height = 40
+    for r in range(content_row + gap + 1, content_row + gap + 21):
+        ws.cell(row=r, column=2).border = BOX
+        ws.cell(row=r, column=9).border = BOX
+    wb.save(path)
+    return str(path), content_row
+
+
+def _style(cell) -> tuple:
+    return (
+        repr(cell.font),
+        repr(cell.fill),
+        repr(cell.border),
+        repr(cell.alignment),
+        cell.number_format,
+        repr(cell.protection),
+    )
+
+
+def snapshot(path) -> dict:
+    wb = openpyxl.load_workbook(path)
+    (ws,) = wb.worksheets
+    cells = {}
+    for row in ws.iter_rows():
+        for cell in row:
+            if cell.value is not None or cell.has_style:
+                cells[cell.coordinate] = (cell.value, _style(cell))
+    return {
+        "title": ws.title,
+        "cells": cells,
+        "merged": sorted(str(r) for r in ws.merged_cells.ranges),
+        "heights": {r: d.height for r, d in ws.row_dimensions.items() if d.height is not None},
+        "widths": {c: d.width for c, d in ws.column_dimensions.items() if d.customWidth},
+        "freeze_panes": ws.freeze_panes,
+        "auto_filter": ws.auto_filter.ref,
+        "defined_names": sorted(ws.defined_names),
+    }
+
+
+def assert_same(actual: dict, expected: dict) -> None:
+    for key in expected:
+        if key == "cells":
+            continue
+        assert actual[key] == expected[key], key
+    missing = expected["cells"].keys() - actual["cells"].keys()
+    extra = actual["cells"].keys() - expected["cells"].keys()
+    assert not missing and not extra, (sorted(missing)[:10], sorted(extra)[:10])
+    different = [c for c in expected["cells"] if actual["cells"][c] != expected["cells"][c]]
+    assert not different, [(c, expected["cells"][c], actual["cells"][c]) for c in different[:5]]
+
+
+@pytest.fixture(scope="module")
+def budget(tmp_path_factory):
+    return _budget(tmp_path_factory.mktemp("budget") / "rozpocet.xlsx")
+
+
+@pytest.fixture(scope="module")
+def reference(budget, tmp_path_factory):
+    out = tmp_path_factory.mktemp("reference") / "openpyxl.xlsx"
+    merge([budget], out, REFERENCE)
+    return snapshot(out)
+
+
+def test_reference_layout(reference):
+    cells = reference["cells"]
+    assert reference["title"] == "Kombinovane"
+    assert cells["A1"][0] == "List"
+    assert cells["A2"][0] == "=== SO 01 ==="
+    assert cells["A3"][0] == "SO 01"
+    assert reference["freeze_panes"] == "A2"
+    assert reference["heights"][1] == 18 and reference["heights"][2] == 20
+    assert "A2:K2" in reference["merged"]
+    # Separators of the sheets that are not skipped, hidden or empty.
+    separators = [value for value, _ in cells.values() if isinstance(value, str) and value.startswith("=== ")]
+    assert separators == ["=== SO 01 ===", "=== SO 02 ===", "=== Jen sloučení ===", "=== VRN ==="]
+    # No column right of K, and trailing styled rows cut to the default 100.
+    assert all(coord[0] <= "K" and coord[1].isdigit() for coord in cells)
+
+
+@pytest.mark.parametrize("backend", OTHER_BACKENDS)
+def test_backend_matches_reference(backend, budget, reference, tmp_path):
+    out = tmp_path / f"{backend}.xlsx"
+    assert merge([budget], out, backend) == 4
+    assert_same(snapshot(out), reference)
+
+
+@pytest.mark.parametrize("backend", OTHER_BACKENDS)
+@pytest.mark.parametrize("trailing_styled_rows", [0, None])
+def test_trailing_rows_policy_matches_reference(backend, trailing_styled_rows, budget, tmp_path):
+    expected = tmp_path / "reference.xlsx"
+    merge([budget], expected, REFERENCE, trailing_styled_rows=trailing_styled_rows)
+    out = tmp_path / f"{backend}.xlsx"
+    merge([budget], out, backend, trailing_styled_rows=trailing_styled_rows)
+    assert_same(snapshot(out), snapshot(expected))
+
+
+@pytest.mark.parametrize("backend", OTHER_BACKENDS)
+@pytest.mark.parametrize(
+    "gap, trailing_styled_rows",
+    [(5, 3), (150, DEFAULT_TRAILING_STYLED_ROWS)],
+    ids=["small-trailing", "gap-before-styled-tail"],
+)
+def test_trailing_rows_past_a_gap_match_reference(backend, gap, trailing_styled_rows, tmp_path):
+    # The policy's limit falls into the empty rows: nothing is written past the items.
+    source, content_row = _gapped_budget(tmp_path / "rozpocet.xlsx", gap)
+    expected = tmp_path / "reference.xlsx"
+    merge([source], expected, REFERENCE, trailing_styled_rows=trailing_styled_rows)
+    out = tmp_path / f"{backend}.xlsx"
+    merge([source], out, backend, trailing_styled_rows=trailing_styled_rows)
+    reference = snapshot(expected)
+    assert reference["auto_filter"] == f"A1:K{2 + content_row}"  # header, separator, items
+    assert_same(snapshot(out), reference)
+
+
+@pytest.mark.parametrize("backend", OTHER_BACKENDS)
+@pytest.mark.parametrize("trailing_styled_rows", [0, 2])
+def test_trimmed_columns_get_no_width(backend, trailing_styled_rows, tmp_path):
+    # Only the trimmed styled rows reach past column A.
+    source = tmp_path / "poznamky.xlsx"
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "Poznámky"
+    ws["A1"] = "Poznámka"
+    for r in range(10, 20):
+        ws.cell(row=r, column=8).border = BOX
+    wb.save(source)
+
+    expected = tmp_path / "reference.xlsx"
+    merge([source], expected, REFERENCE, trailing_styled_rows=trailing_styled_rows)
+    out = tmp_path / f"{backend}.xlsx"
+    merge([source], out, backend, trailing_styled_rows=trailing_styled_rows)
+    reference = snapshot(expected)
+    assert set(reference["widths"]) <= {"A", "B"}
+    assert_same(snapshot(out), reference)
+
+
+@pytest.mark.parametrize("backend", OTHER_BACKENDS)
+def test_selection_matches_reference(backend, budget, tmp_path):
+    selection = SheetSelection(include_pattern="^SO", exclude=("SO 02",))
+    expected = tmp_path / "reference.xlsx"
+    merge([budget], expected, REFERENCE, selection=selection)
+    out = tmp_path / f"{backend}.xlsx"
+    merge([budget], out, backend, selection=selection)
+    assert_same(snapshot(out), snapshot(expected))
+
+
+def test_multi_file_backends_agree(budget, tmp_path):
+    other = _budget(tmp_path / "druhy.xlsx", items=12, trailing_styled_rows=0)
+    snapshots = {}
+    for backend in MULTI_FILE_BACKENDS:
+        out = tmp_path / f"{backend}.xlsx"
+        merge([budget, other], out, backend, source_names=["a.xlsx", "b.xlsx"])
+        snapshots[backend] = snapshot(out)
+    first, *rest = MULTI_FILE_BACKENDS
+    assert snapshots[first]["cells"]["A1"][0] == "Soubor"
+    assert snapshots[first]["cells"]["A2"][0] == "=== a.xlsx / SO 01 ==="
+    for backend in rest:
+        assert_same(snapshots[backend], snapshots[first])
+
+
+@pytest.mark.parametrize("backend", [name for name in backend_names() if get_backend(name).workers])
+def test_workers_do_not_change_output(backend, budget, tmp_path, reference):
+    out = tmp_path / f"{backend}.xlsx"
+    merge([budget], out, backend, workers=2)
+    assert_same(snapshot(out), reference)
+
+
+def test_xml_backend_writes_streaming_sheet_bytes(budget, tmp_path):
+    if openpyxl.LXML:
+        pytest.skip("lxml serializes empty elements differently from the XML writer")
+    parts = {}
+    for backend in ("streaming", "xml"):
+        out = tmp_path / f"{backend}.xlsx"
+        merge([budget], out, backend)
+        with zipfile.ZipFile(out) as package:
+            parts[backend] = {
+                name: package.read(name) for name in package.namelist() if name != "docProps/core.xml"
+            }
+    assert parts["xml"] == parts["streaming"]
+
+
+def test_single_file_backend_rejects_several_inputs(budget, tmp_path):
+    single = [name for name, backend in BACKENDS.items() if not backend.multi_file]
+    for backend in single:
+        with pytest.raises(ValueError):
+            merge([budget, budget], tmp_path / "out.xlsx", backend)
+    with pytest.raises(ValueError):
+        merge([budget], tmp_path / "out.xlsx", "nope")
+
+
+def test_backends_report_the_same_style_statistics(budget, tmp_path):
+    counts = {}
+    for backend in backend_names():
+        styles = StyleCache()
+        merge([budget], tmp_path / f"{backend}.xlsx", backend, style_cache=styles)
+        counts[backend] = (styles.hits, styles.misses)
+    assert len(set(counts.values())) == 1, counts
@@ -0,0 +1,59 @@
+"""Jobs run on a warm merge_server.py give the same result as a local run."""
+
+from __future__ import annotations
+
+import io
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from merge_client import run_remote
+from merge_engine import merge
+from test_merge_equivalence import _budget, assert_same, snapshot
+
+SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "merge_server.py")
+
+
+@pytest.fixture(scope="module")
+def server(tmp_path_factory):
+    socket_path = str(tmp_path_factory.mktemp("server") / "merge.sock")
+    process = subprocess.Popen([sys.executable, SERVER, "--socket", socket_path, "--workers", "1", "--max-jobs", "2"])
+    deadline = time.monotonic() + 60
+    while not os.path.exists(socket_path):
+        assert process.poll() is None and time.monotonic() < deadline, "merge server did not start"
+        time.sleep(0.1)
+    yield socket_path
+    process.terminate()
+    assert process.wait(timeout=30) == 0
+    assert not os.path.exists(socket_path)
+
+
+def _remote(socket_path: str, argv: list[str]) -> tuple[int, str, str]:
+    stdout, stderr = io.StringIO(), io.StringIO()
+    return run_remote(socket_path, argv, stdout, stderr), stdout.getvalue(), stderr.getvalue()
+
+
+def test_remote_merge_matches_local(server, tmp_path, monkeypatch):
+    budget = _budget(tmp_path / "rozpocet.xlsx")
+    merge([budget], tmp_path / "local.xlsx", "xml")
+    monkeypatch.chdir(tmp_path)  # relative paths are the client's
+
+    for _ in range(3):  # the third job runs on a replacement worker
+        status, out, err = _remote(server, ["rozpocet.xlsx", "remote.xlsx", "--engine", "xml"])
+        assert (status, err) == (0, "")
+        assert "Done! 4 sheet(s) merged." in out
+        assert_same(snapshot(tmp_path / "remote.xlsx"), snapshot(tmp_path / "local.xlsx"))
+        os.remove(tmp_path / "remote.xlsx")
+
+
+def test_remote_errors_are_reported(server, tmp_path):
+    status, _, err = _remote(server, ["rozpocet.xlsx", "--engine", "nope"])
+    assert status == 2
+    assert "merge_final.py: error: argument --engine" in err
+
+    status, _, err = _remote(server, [str(tmp_path / "missing.xlsx")])
+    assert status == 1
+    assert "FileNotFoundError" in err
@@ -0,0 +1,141 @@
+"""Sheets stored in and replayed from the parsed-sheet cache."""
+
+from __future__ import annotations
+
+import os
+import stat
+import zipfile
+
+import pytest
+from openpyxl import Workbook, load_workbook
+
+from merge_engine import merge
+from sheet_cache import SheetCache, UnsafeCacheDir, sheet_fingerprint, workbook_context
+from test_merge_equivalence import _budget, assert_same, snapshot
+
+
+def test_new_directory_is_private(tmp_path):
+    root = tmp_path / "cache"
+    SheetCache(str(root))
+    assert stat.S_IMODE(os.stat(root).st_mode) == 0o700
+
+
+def test_directory_writable_by_others_is_refused(tmp_path):
+    root = tmp_path / "shared"
+    root.mkdir()
+    os.chmod(root, 0o777)
+    with pytest.raises(UnsafeCacheDir):
+        SheetCache(str(root))
+
+
+class _Stream:
+    def __init__(self, rows, merged_ranges):
+        self._rows = rows
+        self.merged_ranges = []
+        self._merged = merged_ranges
+
+    def rows(self):
+        yield from self._rows
+        self.merged_ranges = self._merged
+
+
+ROWS = [(i, [(1, f"r{i}", 0)], None) for i in range(1, 2500)]
+KEY = "ab" * 32
+
+
+def test_rows_round_trip(tmp_path):
+    cache = SheetCache(str(tmp_path / "cache"))
+    assert cache.get(KEY) is None
+    recording = cache.record(KEY, _Stream(ROWS, [(1, 1, 2, 3)]))
+    assert not cache.contains(KEY)
+    assert list(recording.rows()) == ROWS
+    assert recording.merged_ranges == [(1, 1, 2, 3)]
+
+    cached = cache.get(KEY)
+    assert list(cached.rows()) == ROWS
+    assert cached.merged_ranges == [(1, 1, 2, 3)]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_copy_stopped_early_stores_nothing(tmp_path):
+    cache = SheetCache(str(tmp_path / "cache"))
+    rows = cache.record(KEY, _Stream(ROWS, [])).rows()
+    next(rows)
+    rows.close()
+    assert not cache.contains(KEY)
+    assert not list((tmp_path / "cache").rglob("*.part"))
+
+
+@pytest.mark.parametrize("backend", ["streaming", "xml"])
+def test_cached_merge_matches_reference(backend, tmp_path):
+    budget = _budget(tmp_path / "rozpocet.xlsx")
+    merge([budget], tmp_path / "reference.xlsx", "openpyxl")
+    expected = snapshot(tmp_path / "reference.xlsx")
+
+    cache = SheetCache(str(tmp_path / "cache"))
+    for run in ("miss", "hit"):
+        out = tmp_path / f"{run}.xlsx"
+        merge([budget], out, backend, sheet_cache=cache)
+        assert_same(snapshot(out), expected)
+    assert cache.hits == cache.misses > 0
+
+
+SHARED_STRINGS_REL = (
+    '<Relationship Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings"'
+    ' Target="sharedStrings.xml" Id="rIdStrings" /></Relationships>'
+)
+SHARED_STRINGS_TYPE = (
+    '<Override PartName="/xl/sharedStrings.xml"'
+    ' ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml" /></Types>'
+)
+
+
+def _strings_workbook(path, strings: list[str], order: list[int], quote: str) -> str:
+    """Cells A1.. hold ``strings``, stored in the shared string table in ``order``.
+
+    The sheet XML is written by hand so that its attributes use ``quote``.
+    """
+    Workbook().save(path)
+    with zipfile.ZipFile(path) as zin:
+        parts = {name: zin.read(name).decode() for name in zin.namelist()}
+    q = quote
+    cells = "".join(
+        f"<row r={q}{row}{q}><c r={q}A{row}{q} t={q}s{q}><v>{order.index(row - 1)}</v></c></row>"
+        for row in range(1, len(strings) + 1)
+    )
+    sheet = parts["xl/worksheets/sheet1.xml"].replace('"A1:A1"', f'"A1:A{len(strings)}"')
+    start, end = sheet.index("<sheetData"), sheet.index("<pageMargins")
+    parts["xl/worksheets/sheet1.xml"] = sheet[:start] + f"<sheetData>{cells}</sheetData>" + sheet[end:]
+    parts["xl/sharedStrings.xml"] = (
+        '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        + "".join(f"<si><t>{strings[i]}</t></si>" for i in order)
+        + "</sst>"
+    )
+    parts["xl/_rels/workbook.xml.rels"] = parts["xl/_rels/workbook.xml.rels"].replace(
+        "</Relationships>", SHARED_STRINGS_REL
+    )
+    parts["[Content_Types].xml"] = parts["[Content_Types].xml"].replace("</Types>", SHARED_STRINGS_TYPE)
+    with zipfile.ZipFile(path, "w") as zout:
+        for name, data in parts.items():
+            zout.writestr(name, data.encode())
+    return str(path)
+
+
+def _fingerprint(path) -> str:
+    wb = load_workbook(path, read_only=True)
+    try:
+        return sheet_fingerprint(wb.worksheets[0], workbook_context(wb))
+    finally:
+        wb.close()
+
+
+@pytest.mark.parametrize("quote", ['"', "'"], ids=["double-quoted", "single-quoted"])
+def test_fingerprint_follows_shared_strings(quote, tmp_path):
+    strings = ["Beton", "Ocel", "Dřevo"]
+    original = _fingerprint(_strings_workbook(tmp_path / "a.xlsx", strings, [0, 1, 2], quote))
+    path = _strings_workbook(tmp_path / "b.xlsx", strings, [2, 0, 1], quote)
+    assert [cell.value for (cell,) in load_workbook(path).active.iter_rows()] == strings
+    renumbered = _fingerprint(path)
+    edited = _fingerprint(_strings_workbook(tmp_path / "c.xlsx", ["Beton", "Sklo", "Dřevo"], [0, 1, 2], quote))
+    assert edited != original
+    assert renumbered == original
@@ -0,0 +1,38 @@
+"""scan_max_column reads the same columns loaded_bounds sees, whatever the chunking."""
+
+from __future__ import annotations
+
+import random
+
+import openpyxl
+import pytest
+from openpyxl.styles import Border, Side
+
+import used_range
+from used_range import loaded_bounds, scan_max_column
+
+BOX = Border(left=Side(style="thin"))
+
+
+@pytest.fixture(scope="module")
+def sheet_path(tmp_path_factory):
+    path = tmp_path_factory.mktemp("used_range") / "styled.xlsx"
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    rnd = random.Random(18)
+    ws["A1"] = "Položka"
+    for row in range(2, 60):
+        ws.cell(row=row, column=rnd.randint(1, 12)).border = BOX
+    wb.save(path)
+    return path
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 1024 * 1024])
+def test_scan_matches_loaded_bounds(sheet_path, monkeypatch, chunk_size):
+    monkeypatch.setattr(used_range, "_CHUNK_SIZE", chunk_size)
+    loaded = openpyxl.load_workbook(sheet_path).active
+    read_only = openpyxl.load_workbook(sheet_path, read_only=True).active
+    for trailing_styled_rows in (0, 3, 20, 57):
+        max_row, max_column = loaded_bounds(loaded, trailing_styled_rows)
+        assert scan_max_column(read_only, max_row) == max_column, trailing_styled_rows
+    assert scan_max_column(read_only, 59, stop_at=2) >= 2  # stops at the first cell that far right
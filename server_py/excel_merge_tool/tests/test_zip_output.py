@@ -0,0 +1,67 @@
+"""Members copied by copy_member_raw come out intact, with or without the raw path."""
+
+from __future__ import annotations
+
+import zipfile
+
+import openpyxl
+import pytest
+
+import zip_output
+from zip_output import OutputZipFile, ZipOptions, copy_member_raw
+
+MEDIA = "xl/media/image1.png"
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    """A workbook with deflated XML parts and a stored image part."""
+    path = tmp_path / "source.xlsx"
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "SO 01"
+    for row in range(1, 200):
+        ws.append([row, "HSV", "Položka", "m3", row * 1.5, 100, f"=E{row}*F{row}"])
+    wb.save(path)
+    with zipfile.ZipFile(path, "a") as archive:
+        archive.writestr(zipfile.ZipInfo(MEDIA, (2024, 1, 1, 0, 0, 0)), bytes(range(256)) * 64)
+    with zipfile.ZipFile(path) as archive:
+        types = {info.compress_type for info in archive.infolist()}
+    assert types == {zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED}
+    return path
+
+
+@pytest.mark.parametrize("raw", [True, False], ids=["raw", "fallback"])
+def test_round_trip_keeps_every_member(workbook, tmp_path, monkeypatch, raw):
+    monkeypatch.setattr(zip_output, "RAW_COPY_SUPPORTED", raw)
+    copy = tmp_path / "copy.xlsx"
+    with zipfile.ZipFile(workbook) as source, zipfile.ZipFile(copy, "w") as target:
+        for info in source.infolist():
+            copy_member_raw(source, target, info)
+
+    with zipfile.ZipFile(workbook) as source, zipfile.ZipFile(copy) as result:
+        assert result.testzip() is None
+        expected = [(i.filename, i.compress_type, i.CRC, i.file_size) for i in source.infolist()]
+        assert [(i.filename, i.compress_type, i.CRC, i.file_size) for i in result.infolist()] == expected
+        for info in source.infolist():
+            assert result.read(info.filename) == source.read(info)
+    assert openpyxl.load_workbook(copy)["SO 01"]["G199"].value == "=E199*F199"
+
+
+@pytest.mark.parametrize("raw", [True, False], ids=["raw", "fallback"])
+def test_passthrough_copies_unchanged_parts(workbook, tmp_path, monkeypatch, raw):
+    monkeypatch.setattr(zip_output, "RAW_COPY_SUPPORTED", raw)
+    copy = tmp_path / "copy.xlsx"
+    with zipfile.ZipFile(workbook) as source:
+        with OutputZipFile(str(copy), ZipOptions(level=1), source) as target:
+            for info in source.infolist():
+                target.writestr(info.filename, source.read(info))
+            assert target.parts_passed_through == len(source.infolist())
+    with zipfile.ZipFile(copy) as result:
+        assert result.testzip() is None
+        assert result.getinfo(MEDIA).compress_type == zipfile.ZIP_STORED
+
+
+def test_raw_copy_is_supported_here():
+    # The fallback is for other Pythons; this one should take the fast path.
+    assert zip_output.RAW_COPY_SUPPORTED
@@ -0,0 +1,196 @@
+"""Effective used range of a source sheet.
+
+Exported budgets often carry formatting far below the last item: rows of
+empty but styled (bordered, filled) cells, sometimes down to row 1,048,576,
+and a ``<dimension>`` to match. Copied naively, every such row becomes a
+styled row in "Kombinovane", and merge time follows the formatting instead
+of the content.
+
+``UsedRange`` tells the last row that holds anything from the last row with
+content: a value, a formula, or a merged range. A merge keeps at most
+``trailing_styled_rows`` empty styled rows after the content and drops the
+rest; ``None`` keeps them all (the behaviour before trimming existed).
+Rows inside the content are never touched.
+
+``scan_used_range`` finds the range of a read-only sheet by scanning its XML
+part without parsing it, and ``scan_max_column`` the columns a trimmed sheet
+keeps; ``loaded_bounds`` does both for a sheet loaded in memory.
+"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+from openpyxl.utils import column_index_from_string, range_boundaries
+
+# Empty styled rows kept below the last content row; None keeps all of them.
+DEFAULT_TRAILING_STYLED_ROWS: Optional[int] = 100
+
+_CHUNK_SIZE = 1024 * 1024
+_DIMENSION = re.compile(rb'<dimension\b[^>]*\bref="([^"]*)"')
+_CELL_ROW = re.compile(rb'<c\b[^>]*?\br="[A-Za-z]{1,3}(\d+)"')
+_CELL_REF = re.compile(rb'<c\b[^>]*?\br="([A-Za-z]{1,3})(\d+)"')
+_MERGE_REF = re.compile(rb'<mergeCell\b[^>]*?\bref="([^"]+)"')
+_SHEET_DATA = b"<sheetData"
+_SHEET_DATA_END = b"</sheetData>"
+_EMPTY_VALUE = b"<v></v>"
+
+
+@dataclass(frozen=True)
+class UsedRange:
+    """Row extent of one sheet; ``merged_ranges`` as (min_row, min_col, max_row, max_col)."""
+
+    last_row: int  # last row with a cell of any kind or a merged range
+    content_row: int  # last row with a value, a formula or a merged range
+    declared_row: Optional[int]  # last row of <dimension>, if any
+    merged_ranges: tuple[tuple[int, int, int, int], ...] = ()
+
+    def max_row(self, trailing_styled_rows: Optional[int]) -> int:
+        """Last row to copy under the trailing-rows policy."""
+        if trailing_styled_rows is None:
+            return self.last_row
+        return min(self.last_row, self.content_row + trailing_styled_rows)
+
+
+def _cell_row(data: bytes, pos: int) -> Optional[int]:
+    """Row of the cell whose start tag is the last one at or before ``pos``."""
+    start = data.rfind(b"<c ", 0, pos + 3)
+    if start < 0:
+        return None
+    match = _CELL_ROW.match(data, start)
+    return int(match.group(1)) if match else None
+
+
+def _last_value(data: bytes) -> int:
+    """Offset of the last value, formula or inline string in ``data``, or -1."""
+    value = data.rfind(b"<v>")
+    while value >= 0 and data.startswith(_EMPTY_VALUE, value):
+        value = data.rfind(b"<v>", 0, value)
+    return max(value, data.rfind(b"<f>"), data.rfind(b"<f "), data.rfind(b"<is>"))
+
+
+def scan_used_range(sheet, trailing_styled_rows: Optional[int] = None) -> Optional[UsedRange]:
+    """Used range of a read-only worksheet from one pass over its XML part.
+
+    Returns None when the range cannot be told reliably (cells without an
+    ``r`` reference, prefixed markup) or, with ``trailing_styled_rows``,
+    when the ``<dimension>`` already shows that nothing would be trimmed;
+    the caller then copies the sheet as it is.
+    """
+    declared = None
+    last_row = content_row = 0
+    seen_data = False
+    rest = b""
+
+    with sheet._get_source() as src:
+        tail = b""
+        for chunk in iter(lambda: src.read(_CHUNK_SIZE), b""):
+            data = tail + chunk
+            if not seen_data:
+                match = _DIMENSION.search(data)
+                if match:
+                    try:
+                        declared = range_boundaries(match.group(1).decode())[3]
+                    except ValueError:
+                        declared = None
+                    if declared is not None and trailing_styled_rows is not None and declared <= trailing_styled_rows:
+                        return None
+                seen_data = _SHEET_DATA in data
+
+            end = data.find(_SHEET_DATA_END)
+            if end >= 0:
+                region, rest = data[:end], data[end:]
+            else:
+                # Keep the last, maybe unfinished cell (or a split end tag) for the next chunk.
+                cut = data.rfind(b"<c ")
+                cut = cut if cut >= 0 else max(0, len(data) - len(_SHEET_DATA_END))
+                region, tail = data[:cut], data[cut:]
+
+            cell = region.rfind(b"<c ")
+            if cell >= 0:
+                row = _cell_row(region, cell)
+                if row is None:
+                    return None
+                last_row = max(last_row, row)
+                value = _last_value(region)
+                if value >= 0:
+                    row = _cell_row(region, value)
+                    if row is None:
+                        return None
+                    content_row = max(content_row, row)
+            if end >= 0:
+                rest += src.read()
+                break
+
+    if not seen_data:
+        return None
+
+    merged = []
+    for match in _MERGE_REF.finditer(rest):
+        try:
+            min_col, min_row, max_col, max_row = range_boundaries(match.group(1).decode())
+        except ValueError:
+            return None
+        merged.append((min_row, min_col, max_row, max_col))
+        content_row = max(content_row, max_row)
+    return UsedRange(max(last_row, content_row), content_row, declared, tuple(merged))
+
+
+def scan_max_column(
+    sheet,
+    max_row: int,
+    merged_ranges: tuple[tuple[int, int, int, int], ...] = (),
+    stop_at: Optional[int] = None,
+) -> int:
+    """Last column of a read-only worksheet with a cell in rows up to ``max_row``.
+
+    This is the ``max_column`` ``loaded_bounds`` reports for a trimmed sheet:
+    merged ranges count with every cell but their first. Rows past
+    ``max_row`` are not read, and neither is anything once a cell reaches
+    column ``stop_at``.
+    """
+    max_column = max((r[3] for r in merged_ranges if r[3] > r[1] or r[2] > r[0]), default=0)
+    with sheet._get_source() as src:
+        tail = b""
+        for chunk in iter(lambda: src.read(_CHUNK_SIZE), b""):
+            data = tail + chunk
+            # Keep the last, maybe unfinished tag for the next chunk.
+            cut = data.rfind(b"<")
+            cut = cut if cut >= 0 else len(data)
+            for match in _CELL_REF.finditer(data, 0, cut):
+                if int(match.group(2)) > max_row:
+                    return max_column
+                max_column = max(max_column, column_index_from_string(match.group(1).decode().upper()))
+                if stop_at is not None and max_column >= stop_at:
+                    return max_column
+            tail = data[cut:]
+        for match in _CELL_REF.finditer(tail):
+            if int(match.group(2)) > max_row:
+                break
+            max_column = max(max_column, column_index_from_string(match.group(1).decode().upper()))
+    return max_column
+
+
+def loaded_bounds(sheet, trailing_styled_rows: Optional[int]) -> tuple[int, int]:
+    """``(max_row, max_column)`` of an in-memory worksheet under the trailing-rows policy.
+
+    Without trimming these are ``sheet.max_row``/``max_column``. A trimmed
+    sheet ends at its last row with cells within the policy, as the
+    streaming engines end it; trimmed rows take the columns only they
+    reached with them.
+    """
+    max_row, max_column = sheet.max_row or 0, sheet.max_column or 0
+    if trailing_styled_rows is None or not sheet._cells:
+        return max_row, max_column
+
+    content_row = max((merged.max_row for merged in sheet.merged_cells.ranges), default=0)
+    for (row, _), cell in sheet._cells.items():
+        if row > content_row and cell.value is not None:
+            content_row = row
+    limit = content_row + trailing_styled_rows
+    if limit >= max_row:
+        return max_row, max_column
+    kept = [(row, col) for row, col in sheet._cells if row <= limit]
+    return max((row for row, _ in kept), default=0), max((col for _, col in kept), default=0)
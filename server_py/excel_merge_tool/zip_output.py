@@ -0,0 +1,203 @@
+"""How output workbooks are written into their ZIP package.
+
+``Workbook.save`` deflates every part at zlib's default level 6, which makes
+the save stage a large share of a big merge or unlock. ``ZipOptions`` lets
+the CLI and the service trade size for speed:
+
+- ``level`` is the zlib level of deflated parts: 1 is several times faster
+  than 6 on sheet XML and only slightly bigger, 0 stores every part;
+- ``store_media`` stores parts that are already compressed (images,
+  embedded Office files) instead of deflating them once more for nothing;
+- ``passthrough`` copies parts identical to the source workbook's as their
+  compressed bytes (images, ``vbaProject.bin`` and the rest of the VBA
+  project), so they are neither inflated nor deflated again.
+
+``OutputZipFile`` is the write-mode archive applying them; openpyxl's
+``ExcelWriter`` is pointed at it by ``write_workbook``. The options change
+the bytes of the package, never the workbook in it.
+"""
+
+from __future__ import annotations
+
+import datetime
+import io
+import posixpath
+import shutil
+import struct
+import time
+import zipfile
+import zlib
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+from openpyxl.writer.excel import ExcelWriter
+
+CHUNK_SIZE = 1024 * 1024
+
+# Parts whose content is compressed already; deflating them gains nothing.
+COMPRESSED_SUFFIXES = frozenset(
+    (".png", ".jpg", ".jpeg", ".jfif", ".gif", ".wdp", ".mp3", ".mp4", ".zip", ".xlsx", ".xlsm", ".docx", ".pptx")
+)
+
+
+@dataclass(frozen=True)
+class ZipOptions:
+    level: Optional[int] = None  # zlib level 1-9 of deflated parts (None: 6), 0: store every part
+    store_media: bool = True
+    passthrough: bool = True
+
+    def __post_init__(self) -> None:
+        if self.level is not None and not 0 <= self.level <= 9:
+            raise ValueError(f"ZIP compression level must be 0-9, got {self.level}")
+
+    def params(self) -> dict:
+        """The options as plain values (result cache key, job state)."""
+        return asdict(self)
+
+
+DEFAULT_ZIP_OPTIONS = ZipOptions()
+
+
+def _raw_copy_supported() -> bool:
+    """Whether this Python's ``zipfile`` has the internals ``copy_member_raw`` writes through."""
+    if not (hasattr(zipfile, "sizeFileHeader") and hasattr(zipfile, "stringFileHeader")):
+        return False
+    if not callable(getattr(zipfile.ZipInfo, "FileHeader", None)):
+        return False
+    with zipfile.ZipFile(io.BytesIO(), "w") as probe:
+        internals = ("fp", "_lock", "_seekable", "_writing", "_writecheck", "_didModify", "start_dir")
+        return all(hasattr(probe, name) for name in internals) and isinstance(probe.NameToInfo, dict)
+
+
+RAW_COPY_SUPPORTED = _raw_copy_supported()
+
+
+def copy_member_raw(source: zipfile.ZipFile, target: zipfile.ZipFile, info: zipfile.ZipInfo) -> None:
+    """Copy one member's compressed bytes from ``source`` into ``target``.
+
+    Mirrors what ``ZipFile.write`` does internally, minus the recompression.
+    That takes ``zipfile`` internals; on a Python without them, or when
+    ``source`` is not seekable, the member is inflated and compressed again
+    with its own compression type instead.
+    """
+    if not RAW_COPY_SUPPORTED or target._writing or not source.fp.seekable():
+        _copy_member(source, target, info)
+        return
+    src = source.fp
+    src.seek(info.header_offset)
+    header = src.read(zipfile.sizeFileHeader)
+    if len(header) != zipfile.sizeFileHeader or header[:4] != zipfile.stringFileHeader:
+        raise zipfile.BadZipFile(f"Bad local file header for {info.filename}")
+    name_len, extra_len = struct.unpack("<HH", header[26:30])
+    src.seek(name_len + extra_len, 1)
+
+    zinfo = zipfile.ZipInfo(info.filename, info.date_time)
+    zinfo.compress_type = info.compress_type
+    zinfo.create_system = info.create_system
+    zinfo.external_attr = info.external_attr
+    zinfo.flag_bits = info.flag_bits & ~0x08  # sizes go into the local header
+    zinfo.CRC = info.CRC
+    zinfo.compress_size = info.compress_size
+    zinfo.file_size = info.file_size
+    zip64 = zinfo.file_size > zipfile.ZIP64_LIMIT or zinfo.compress_size > zipfile.ZIP64_LIMIT
+
+    with target._lock:
+        fp = target.fp
+        if target._seekable:
+            fp.seek(target.start_dir)
+        zinfo.header_offset = fp.tell()
+        target._writecheck(zinfo)
+        target._didModify = True
+        fp.write(zinfo.FileHeader(zip64))
+
+        remaining = info.compress_size
+        while remaining > 0:
+            block = src.read(min(CHUNK_SIZE, remaining))
+            if not block:
+                raise zipfile.BadZipFile(f"Truncated data for {info.filename}")
+            fp.write(block)
+            remaining -= len(block)
+
+        target.filelist.append(zinfo)
+        target.NameToInfo[zinfo.filename] = zinfo
+        target.start_dir = fp.tell()
+
+
+def _copy_member(source: zipfile.ZipFile, target: zipfile.ZipFile, info: zipfile.ZipInfo) -> None:
+    """``copy_member_raw`` through the public API: decompress and compress again."""
+    zinfo = zipfile.ZipInfo(info.filename, info.date_time)
+    zinfo.compress_type = info.compress_type
+    zinfo.create_system = info.create_system
+    zinfo.external_attr = info.external_attr
+    force_zip64 = info.file_size > zipfile.ZIP64_LIMIT
+    with source.open(info) as src, target.open(zinfo, "w", force_zip64=force_zip64) as dst:
+        shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+
+class OutputZipFile(zipfile.ZipFile):
+    """Write-mode ``ZipFile`` that compresses every part as ``options`` say.
+
+    Parts written with ``writestr`` that are byte-identical to a part of
+    ``source`` (same name, size and CRC) are copied from it raw when
+    ``options.passthrough`` is set.
+    """
+
+    def __init__(self, file, options: Optional[ZipOptions] = None, source: Optional[zipfile.ZipFile] = None):
+        self.options = options if options is not None else DEFAULT_ZIP_OPTIONS
+        compression = zipfile.ZIP_STORED if self.options.level == 0 else zipfile.ZIP_DEFLATED
+        super().__init__(file, "w", compression, allowZip64=True, compresslevel=self.options.level or None)
+        self.source = source if self.options.passthrough else None
+        self.parts_passed_through = 0
+
+    def compress_type(self, name: str) -> int:
+        if self.options.store_media and posixpath.splitext(name)[1].lower() in COMPRESSED_SUFFIXES:
+            return zipfile.ZIP_STORED
+        return self.compression
+
+    def entry(self, name: str, date_time: Optional[tuple] = None) -> zipfile.ZipInfo:
+        """A ``ZipInfo`` for ``name`` compressed as the options say (``open(entry, "w")``)."""
+        zinfo = zipfile.ZipInfo(name, date_time or time.localtime(time.time())[:6])
+        zinfo.compress_type = self.compress_type(name)
+        zinfo._compresslevel = self.compresslevel
+        zinfo.external_attr = 0o600 << 16
+        return zinfo
+
+    def _unchanged(self, name: str, data: bytes) -> Optional[zipfile.ZipInfo]:
+        if self.source is None:
+            return None
+        try:
+            info = self.source.getinfo(name)
+        except KeyError:
+            return None
+        if info.file_size != len(data) or info.CRC != zlib.crc32(data):
+            return None
+        return info
+
+    def writestr(self, zinfo_or_arcname, data, compress_type=None, compresslevel=None) -> None:
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        name = zinfo_or_arcname.filename if isinstance(zinfo_or_arcname, zipfile.ZipInfo) else zinfo_or_arcname
+        info = self._unchanged(name, data)
+        if info is not None:
+            copy_member_raw(self.source, self, info)
+            self.parts_passed_through += 1
+            return
+        if compress_type is None and not isinstance(zinfo_or_arcname, zipfile.ZipInfo):
+            compress_type = self.compress_type(name)
+        super().writestr(zinfo_or_arcname, data, compress_type, compresslevel)
+
+    def write(self, filename, arcname=None, compress_type=None, compresslevel=None) -> None:
+        if compress_type is None:
+            compress_type = self.compress_type(arcname or filename)
+        super().write(filename, arcname, compress_type, compresslevel)
+
+
+def write_workbook(workbook, archive: zipfile.ZipFile) -> None:
+    """What ``Workbook.save`` does, into an archive of the caller's choice."""
+    workbook.properties.modified = datetime.datetime.now(tz=datetime.timezone.utc).replace(tzinfo=None)
+    ExcelWriter(workbook, archive).save()
+
+
+def save_workbook(workbook, target, options: Optional[ZipOptions] = None) -> None:
+    """``workbook.save(target)`` compressed according to ``options``."""
+    write_workbook(workbook, OutputZipFile(target, options))
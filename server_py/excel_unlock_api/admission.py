@@ -0,0 +1,52 @@
+"""Admission control for the CPU-heavy endpoints.
+
+Each operation gets a fixed number of slots per server process. A request
+that cannot get a slot (immediately, or within ``wait`` seconds) is rejected
+so the caller can retry later, instead of piling up threads and memory behind
+a 150 MB merge. Endpoints without a slot (``/health``, ``/metrics``, job
+status) are never held back.
+"""
+
+from __future__ import annotations
+
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class Busy(Exception):
+    def __init__(self, operation: str):
+        super().__init__(operation)
+        self.operation = operation
+
+
+class OperationSlots:
+    def __init__(self, limits: dict[str, int], wait: float = 0.0):
+        self.limits = {operation: max(1, limit) for operation, limit in limits.items()}
+        self.wait = wait
+        self._semaphores = {operation: threading.BoundedSemaphore(limit) for operation, limit in self.limits.items()}
+        self._lock = threading.Lock()
+        self._in_flight = {operation: 0 for operation in self.limits}
+
+    @property
+    def total(self) -> int:
+        return sum(self.limits.values())
+
+    def in_flight(self, operation: str) -> int:
+        return self._in_flight[operation]
+
+    @contextmanager
+    def acquire(self, operation: str) -> Iterator[None]:
+        """Hold a slot of ``operation`` for the duration of the block, or raise ``Busy``."""
+        semaphore = self._semaphores[operation]
+        acquired = semaphore.acquire(timeout=self.wait) if self.wait > 0 else semaphore.acquire(blocking=False)
+        if not acquired:
+            raise Busy(operation)
+        with self._lock:
+            self._in_flight[operation] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight[operation] -= 1
+            semaphore.release()
@@ -1,15 +1,75 @@
 from __future__ import annotations
 
-import io
+import hashlib
 import os
-from copy import copy
-
-from flask import Flask, request, send_file
-from openpyxl import Workbook, load_workbook
-from openpyxl.styles import Alignment, Font, PatternFill, Protection
-from openpyxl.utils import get_column_letter
+import re
+import tempfile
+import time
+import zipfile
+from contextlib import ExitStack
+from dataclasses import dataclass
+from typing import BinaryIO
+
+from flask import Flask, Response, g, request, send_file
+from openpyxl.utils.exceptions import InvalidFileException
 from werkzeug.utils import secure_filename
 
+import metrics
+from admission import Busy, OperationSlots
+from jobs import EmptyUpload, JobManager, QueueFull
+from preflight import (
+    DamagedPackage,
+    EncryptedWorkbook,
+    InvalidWorkbook,
+    LegacyWorkbook,
+    Limits,
+    NoSheets,
+    NotASpreadsheet,
+    NotAZipPackage,
+    PackageTooLarge,
+    SuspiciousCompression,
+    TooManySheets,
+    check_workbook,
+)
+from processing import (
+    AUTO_ENGINE,
+    DEFAULT_TRAILING_STYLED_ROWS,
+    MERGE_ENGINE_CHOICES,
+    MERGE_ENGINES,
+    MERGE_FORMATS,
+    MERGE_MIMETYPE,
+    UNLOCK_ENGINES,
+    UNLOCK_MIMETYPE,
+    merge_download_name,
+    merge_mimetype,
+    StageTimer,
+    auto_merge_plan,
+    export_rows,
+    get_backend,
+    merge_workbook,
+    merge_workbooks,
+    parquet_available,
+    result_params,
+    SheetCache,
+    SheetSelection,
+    unlock_download_name,
+    unlock_workbook,
+    ZipOptions,
+)
+from result_cache import ResultCache, cache_key
+from uploads import (
+    AssembledUpload,
+    ChunkCorrupt,
+    OffsetMismatch,
+    UploadBusy,
+    UploadClosed,
+    UploadCorrupt,
+    UploadIncomplete,
+    UploadNotFound,
+    UploadStore,
+    UploadTooLarge,
+)
+
 app = Flask(__name__)
 
 # Allow larger uploads (adjust as needed)
@@ -17,6 +77,79 @@ app.config["MAX_CONTENT_LENGTH"] = 150 * 1024 * 1024  # 150MB
 
 EXCEL_UNLOCK_API_KEY = os.environ.get("EXCEL_UNLOCK_API_KEY", "")
 
+# Engine used when a request does not pass "engine" (see processing.py).
+DEFAULT_UNLOCK_ENGINE = os.environ.get("EXCEL_UNLOCK_ENGINE", "openpyxl")
+DEFAULT_MERGE_ENGINE = os.environ.get("EXCEL_MERGE_ENGINE", "openpyxl")
+# Processes parsing sheets in parallel for the streaming merge engine.
+MERGE_WORKERS = max(1, int(os.environ.get("EXCEL_MERGE_WORKERS", "1")))
+# Most workbooks one /merge request may combine.
+MERGE_MAX_FILES = max(1, int(os.environ.get("EXCEL_MERGE_MAX_FILES", "20")))
+# Empty formatted rows kept below each sheet's content ("all" keeps every one).
+_trailing_rows = os.environ.get("EXCEL_MERGE_TRAILING_STYLED_ROWS", str(DEFAULT_TRAILING_STYLED_ROWS))
+MERGE_TRAILING_STYLED_ROWS = None if _trailing_rows == "all" else max(0, int(_trailing_rows))
+
+# Compression of the output packages (see excel_merge_tool/zip_output.py)
+_zip_level = os.environ.get("EXCEL_ZIP_LEVEL", "")
+ZIP_OPTIONS = ZipOptions(
+    level=int(_zip_level) if _zip_level else None,
+    store_media=os.environ.get("EXCEL_ZIP_STORE_MEDIA", "1") != "0",
+    passthrough=os.environ.get("EXCEL_ZIP_PASSTHROUGH", "1") != "0",
+)
+
+# Pre-flight limits every uploaded workbook is checked against (see preflight.py)
+preflight_limits = Limits(
+    max_sheets=int(os.environ.get("EXCEL_MAX_SHEETS", "1000")),
+    max_uncompressed_bytes=int(os.environ.get("EXCEL_MAX_UNPACKED_MB", "2048")) * 1024 * 1024,
+    max_compression_ratio=float(os.environ.get("EXCEL_MAX_COMPRESSION_RATIO", "200")),
+)
+
+# Concurrent /unlock and /merge requests per server process, and "transfer"
+# for the other requests that stream a file in or out (upload chunks, job
+# submissions and job results). Requests beyond that wait up to
+# EXCEL_ADMISSION_WAIT seconds for a slot, then get 429.
+slots = OperationSlots(
+    {
+        "unlock": int(os.environ.get("EXCEL_MAX_CONCURRENT_UNLOCK", "2")),
+        "merge": int(os.environ.get("EXCEL_MAX_CONCURRENT_MERGE", "1")),
+        "transfer": int(os.environ.get("EXCEL_MAX_CONCURRENT_TRANSFER", "4")),
+    },
+    wait=float(os.environ.get("EXCEL_ADMISSION_WAIT", "0")),
+)
+RETRY_AFTER_SECONDS = int(os.environ.get("EXCEL_RETRY_AFTER", "10"))
+
+# Background jobs (POST /jobs/unlock, POST /jobs/merge)
+jobs = JobManager(
+    root=os.environ.get("EXCEL_JOBS_DIR", os.path.join(tempfile.gettempdir(), "excel_unlock_jobs")),
+    max_workers=int(os.environ.get("EXCEL_JOB_WORKERS", "2")),
+    max_queued=int(os.environ.get("EXCEL_JOB_QUEUE_DEPTH", "8")),
+    result_ttl=float(os.environ.get("EXCEL_JOB_RESULT_TTL", "3600")),
+)
+
+# Uploads and results of /unlock and /merge are spooled here, never held in memory.
+SPOOL_DIR = os.environ.get("EXCEL_SPOOL_DIR") or None  # None: the system temp dir
+SPOOL_CHUNK_SIZE = 1024 * 1024
+
+# Chunked uploads (POST /uploads), processed in place by /unlock, /merge and /jobs
+upload_store = UploadStore(
+    root=os.environ.get("EXCEL_UPLOADS_DIR", os.path.join(tempfile.gettempdir(), "excel_unlock_uploads")),
+    max_bytes=int(os.environ.get("EXCEL_UPLOAD_MAX_MB", "2048")) * 1024 * 1024,
+    ttl=float(os.environ.get("EXCEL_UPLOAD_TTL", "86400")),
+)
+
+# Results of /unlock and /merge keyed by upload hash (EXCEL_CACHE_MAX_MB=0 disables)
+results = ResultCache(
+    root=os.environ.get("EXCEL_CACHE_DIR", os.path.join(tempfile.gettempdir(), "excel_unlock_cache")),
+    max_bytes=int(os.environ.get("EXCEL_CACHE_MAX_MB", "1024")) * 1024 * 1024,
+    ttl=float(os.environ.get("EXCEL_CACHE_TTL", "86400")),
+)
+
+# Parsed sheets of earlier streaming merges, reused for revised budgets. Opt-in:
+# the blocks are pickles, so the directory must be private to the service user
+# (EXCEL_SHEET_CACHE_DIR unset or EXCEL_SHEET_CACHE_MAX_MB=0 disables)
+SHEET_CACHE_DIR = os.environ.get("EXCEL_SHEET_CACHE_DIR") or None
+SHEET_CACHE_MAX_BYTES = int(os.environ.get("EXCEL_SHEET_CACHE_MAX_MB", "512")) * 1024 * 1024
+sheet_cache = SheetCache(SHEET_CACHE_DIR, SHEET_CACHE_MAX_BYTES) if SHEET_CACHE_DIR and SHEET_CACHE_MAX_BYTES > 0 else None
+
 ALLOWED_ORIGINS = {
     "https://tenderflow.cz",
     "https://www.tenderflow.cz",
@@ -28,17 +161,40 @@ def add_cors_headers(response):
     origin = request.headers.get("Origin", "")
     allowed_origin = origin if origin in ALLOWED_ORIGINS else "https://tenderflow.cz"
     response.headers["Access-Control-Allow-Origin"] = allowed_origin
-    response.headers["Access-Control-Allow-Methods"] = "GET,POST,OPTIONS"
-    response.headers["Access-Control-Allow-Headers"] = "Content-Type,Authorization,X-Excel-Unlock-Key"
+    response.headers["Access-Control-Allow-Methods"] = "GET,HEAD,POST,PATCH,DELETE,OPTIONS"
+    response.headers["Access-Control-Allow-Headers"] = "Content-Type,Authorization,X-Excel-Unlock-Key,Upload-Offset,X-Chunk-SHA256"
+    response.headers["Access-Control-Expose-Headers"] = "X-Cache,Server-Timing,Upload-Offset,Location"
     response.headers["Vary"] = "Origin"
     return response
 
 
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def add_server_timing(response):
+    # Opt-in per request with the form/query field timing=1.
+    timer = g.get("timer")
+    if timer is not None and request.values.get("timing") == "1":
+        response.headers["Server-Timing"] = timer.server_timing()
+    return response
+
+
 @app.get("/health")
 def health():
     return {"ok": True}
 
 
+@app.get("/metrics")
+def metrics_endpoint():
+    check_api_key()
+    for operation in slots.limits:
+        metrics.IN_FLIGHT.set(slots.in_flight(operation), operation=operation)
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
 def has_valid_api_key() -> bool:
     if not EXCEL_UNLOCK_API_KEY:
         return False
@@ -56,65 +212,417 @@ def has_valid_api_key() -> bool:
     return False
 
 
-@app.post("/unlock")
-def unlock_excel():
-    if request.method == "OPTIONS":
-        return "", 204
+class UploadError(Exception):
+    def __init__(self, message: str, status: int):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+@app.errorhandler(UploadError)
+def handle_upload_error(error: UploadError):
+    return error.message, error.status
+
+
+@app.errorhandler(Busy)
+def handle_busy(error: Busy):
+    metrics.REJECTED.inc(operation=error.operation)
+    return "Chyba: Server je vytížený, zkuste to později", 429, {"Retry-After": str(RETRY_AFTER_SECONDS)}
+
+
+@app.errorhandler(UploadNotFound)
+def handle_upload_not_found(error: UploadNotFound):
+    return "Chyba: Nahrávání neexistuje nebo vypršelo", 404
+
+
+@app.errorhandler(UploadBusy)
+def handle_upload_busy(error: UploadBusy):
+    return "Chyba: Do nahrávání právě zapisuje jiný požadavek", 409
+
+
+@app.errorhandler(UploadClosed)
+def handle_upload_closed(error: UploadClosed):
+    return "Chyba: Nahrávání je už dokončené", 409
+
+
+@app.errorhandler(OffsetMismatch)
+def handle_offset_mismatch(error: OffsetMismatch):
+    return "Chyba: Část nenavazuje na nahraná data", 409, {"Upload-Offset": str(error.offset)}
+
 
+@app.errorhandler(UploadIncomplete)
+def handle_upload_incomplete(error: UploadIncomplete):
+    return "Chyba: Soubor ještě není celý nahraný", 409, {"Upload-Offset": str(error.offset)}
+
+
+@app.errorhandler(ChunkCorrupt)
+def handle_chunk_corrupt(error: ChunkCorrupt):
+    return "Chyba: Kontrolní součet části nesouhlasí", 400
+
+
+@app.errorhandler(UploadCorrupt)
+def handle_upload_corrupt(error: UploadCorrupt):
+    return "Chyba: Kontrolní součet souboru nesouhlasí", 400
+
+
+@app.errorhandler(UploadTooLarge)
+def handle_upload_too_large(error: UploadTooLarge):
+    return "Chyba: Soubor je příliš velký", 413
+
+
+def check_api_key() -> None:
     if not EXCEL_UNLOCK_API_KEY:
-        return "Chyba: EXCEL_UNLOCK_API_KEY není nakonfigurovaný", 503
+        raise UploadError("Chyba: EXCEL_UNLOCK_API_KEY není nakonfigurovaný", 503)
 
     if not has_valid_api_key():
-        return "Chyba: Neautorizovaný přístup", 401
+        raise UploadError("Chyba: Neautorizovaný přístup", 401)
 
-    if "file" not in request.files:
-        return "Chyba: Žádný soubor nebyl nahrán", 400
 
-    uploaded = request.files["file"]
-    if not uploaded or uploaded.filename is None or uploaded.filename == "":
-        return "Chyba: Prázdné jméno souboru", 400
+def check_filename(name: str | None) -> tuple[str, str]:
+    """Validate the name of an uploaded file. Returns (filename, ext)."""
+    if name is None or name == "":
+        raise UploadError("Chyba: Prázdné jméno souboru", 400)
 
-    filename = secure_filename(uploaded.filename)
+    filename = secure_filename(name)
     _, ext = os.path.splitext(filename.lower())
     if ext not in (".xlsx", ".xlsm"):
-        return "Chyba: Podporované jsou pouze soubory .xlsx a .xlsm", 400
+        raise UploadError("Chyba: Podporované jsou pouze soubory .xlsx a .xlsm", 400)
+    return filename, ext
 
-    try:
-        data = uploaded.read()
-        if not data:
-            return "Chyba: Soubor je prázdný", 400
 
-        # keep_vba preserves macros for .xlsm; for .xlsx it is harmless but unnecessary.
-        keep_vba = ext == ".xlsm"
-        wb = load_workbook(io.BytesIO(data), keep_vba=keep_vba)
+def check_file(uploaded) -> tuple[str, str]:
+    """Validate one uploaded file. Returns (filename, ext)."""
+    if not uploaded:
+        raise UploadError("Chyba: Prázdné jméno souboru", 400)
+    return check_filename(uploaded.filename)
 
-        for sheet in wb.worksheets:
-            # Disable sheet protection
-            sheet.protection.enabled = False
 
-            # Optionally unlock cell styles. This is the behavior you validated in Python/openpyxl.
-            # It can take longer on huge sheets, but preserves file size and formatting reliably.
-            for row in sheet.iter_rows():
-                for cell in row:
-                    cell.protection = Protection(locked=False, hidden=False)
+@dataclass(frozen=True)
+class PendingUpload:
+    """A chunked upload named by an "upload" field, not finished yet."""
 
-        out = io.BytesIO()
-        wb.save(out)
-        out.seek(0)
+    upload_id: str
+    filename: str
 
-        base = os.path.splitext(filename)[0]
-        download_name = f"{base}-odemceno.xlsm"
 
-        return send_file(
-            out,
-            mimetype="application/vnd.ms-excel.sheet.macroEnabled.12",
-            as_attachment=True,
-            download_name=download_name,
-            max_age=0,
-        )
+def get_files() -> list:
+    """The request's workbooks: "file" fields, then chunked uploads named by "upload" fields.
+
+    Chunked uploads come back as ``PendingUpload``; they must exist but stay
+    open until ``finish_uploads`` once the rest of the request is valid.
+    """
+    files = request.files.getlist("file")
+    return files + [
+        PendingUpload(upload_id, upload_store.get(upload_id)["filename"])
+        for upload_id in request.values.getlist("upload")
+    ]
+
+
+def finish_uploads(files: list) -> list:
+    """Finish the ``PendingUpload``s of ``files``; they come back as
+    ``AssembledUpload``, processed in place instead of being spooled again.
+
+    Finishing closes an upload for further chunks, so a request refused for
+    its other fields leaves the client's uploads open.
+    """
+    return [upload_store.finish(f.upload_id) if isinstance(f, PendingUpload) else f for f in files]
+
+
+def get_upload(engines: tuple[str, ...], default_engine: str):
+    """Validate an upload request. Returns (uploaded file, filename, ext, engine)."""
+    check_api_key()
+
+    files = get_files()
+    if not files:
+        raise UploadError("Chyba: Žádný soubor nebyl nahrán", 400)
+
+    uploaded = files[0]
+    filename, ext = check_file(uploaded)
+
+    engine = request.values.get("engine", default_engine)
+    if engine not in engines:
+        raise UploadError("Chyba: Neznámý režim zpracování", 400)
+
+    [uploaded] = finish_uploads([uploaded])
+    return uploaded, filename, ext, engine
+
+
+def get_merge_uploads() -> tuple[list[tuple], str, str]:
+    """Validate a /merge request with one or more "file" or "upload" fields.
+
+    Returns ([(uploaded file, filename, ext), ...], engine, format). Several
+    files need an engine that merges several workbooks; streaming is then
+    the default. Data-only formats ignore "engine" and report it as "columnar".
+    """
+    check_api_key()
+
+    output_format = request.values.get("format", "xlsx")
+    if output_format not in MERGE_FORMATS:
+        raise UploadError("Chyba: Neznámý výstupní formát", 400)
+    if output_format == "parquet" and not parquet_available():
+        raise UploadError("Chyba: Formát parquet není na serveru dostupný", 400)
 
+    files = get_files()
+    if not files:
+        raise UploadError("Chyba: Žádný soubor nebyl nahrán", 400)
+    if len(files) > MERGE_MAX_FILES:
+        raise UploadError(f"Chyba: Najednou lze sloučit nejvýše {MERGE_MAX_FILES} souborů", 400)
+    uploads = [(uploaded, *check_file(uploaded)) for uploaded in files]
+
+    if output_format != "xlsx":
+        return _finish_merge_uploads(uploads), "columnar", output_format
+    if len(uploads) == 1:
+        engine = request.values.get("engine", DEFAULT_MERGE_ENGINE)
+    else:
+        engine = request.values.get("engine", "streaming")
+    if engine not in MERGE_ENGINE_CHOICES:
+        raise UploadError("Chyba: Neznámý režim zpracování", 400)
+    if len(uploads) > 1 and engine != AUTO_ENGINE and not get_backend(engine).multi_file:
+        multi = ", ".join(name for name in MERGE_ENGINES if get_backend(name).multi_file)
+        raise UploadError(f"Chyba: Více souborů najednou umí sloučit jen režimy {multi}", 400)
+
+    return _finish_merge_uploads(uploads), engine, output_format
+
+
+def _finish_merge_uploads(uploads: list[tuple]) -> list[tuple]:
+    files = finish_uploads([uploaded for uploaded, _, _ in uploads])
+    return [(uploaded, filename, ext) for uploaded, (_, filename, ext) in zip(files, uploads)]
+
+
+def spool_upload(uploaded, suffix: str) -> tuple[str, str]:
+    """Copy an upload to a temporary file. Returns (path, SHA-256 hex digest)."""
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=SPOOL_DIR)
+    digest = hashlib.sha256()
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            for chunk in iter(lambda: uploaded.stream.read(SPOOL_CHUNK_SIZE), b""):
+                digest.update(chunk)
+                fh.write(chunk)
+    except BaseException:
+        remove_file(path)
+        raise
+    return path, digest.hexdigest()
+
+
+def remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def send_result(path: str | BinaryIO, mimetype: str, download_name: str, cache_status: str, temporary: bool = False):
+    """Stream a result file (a path or an open file, closed with the response).
+
+    ``temporary`` files are deleted once the response is sent.
+    """
+    response = send_file(
+        path,
+        mimetype=mimetype,
+        as_attachment=True,
+        download_name=download_name,
+        max_age=0,
+    )
+    response.headers["X-Cache"] = cache_status
+    if temporary:
+        # Passthrough responses skip close callbacks; iterating still streams the file.
+        response.direct_passthrough = False
+        response.call_on_close(lambda: remove_file(path))
+    return response
+
+
+# Uploads that are not a readable .xlsx/.xlsm package: the client's fault, not ours.
+INVALID_WORKBOOK_ERRORS = (zipfile.BadZipFile, InvalidFileException)
+
+
+def preflight_error(error: InvalidWorkbook) -> tuple[str, int]:
+    """Message and status for a workbook refused by the pre-flight check."""
+    if isinstance(error, EncryptedWorkbook):
+        return "Chyba: Sešit je chráněný heslem pro otevření, uložte ho bez hesla", 400
+    if isinstance(error, LegacyWorkbook):
+        return "Chyba: Starý formát .xls není podporovaný, uložte sešit jako .xlsx", 400
+    if isinstance(error, NotAZipPackage):
+        return "Chyba: Soubor není sešit .xlsx nebo .xlsm", 400
+    if isinstance(error, DamagedPackage):
+        return "Chyba: Soubor je poškozený nebo nebyl nahrán celý", 400
+    if isinstance(error, NotASpreadsheet):
+        return "Chyba: Soubor není sešit Excelu", 400
+    if isinstance(error, NoSheets):
+        return "Chyba: Sešit neobsahuje žádný list", 400
+    if isinstance(error, TooManySheets):
+        return f"Chyba: Sešit má víc než {preflight_limits.max_sheets} listů", 400
+    if isinstance(error, PackageTooLarge):
+        return "Chyba: Sešit je po rozbalení příliš velký", 413
+    if isinstance(error, SuspiciousCompression):
+        return "Chyba: Soubor je podezřele silně komprimovaný", 400
+    return "Chyba: Soubor není platný sešit .xlsx nebo .xlsm", 400
+
+
+def get_sheet_selection() -> SheetSelection:
+    """Sheet selection of a merge request: repeatable "sheet" and
+    "exclude_sheet" fields, "sheet_regex", "exclude_regex" and
+    "include_hidden=1"."""
+    try:
+        return SheetSelection(
+            include=tuple(request.values.getlist("sheet")),
+            exclude=tuple(request.values.getlist("exclude_sheet")),
+            include_pattern=request.values.get("sheet_regex") or None,
+            exclude_pattern=request.values.get("exclude_regex") or None,
+            visible_only=request.values.get("include_hidden") != "1",
+        )
+    except re.error:
+        raise UploadError("Chyba: Neplatný regulární výraz pro výběr listů", 400)
+
+
+def uploads_hash(names: list[str], hashes: list[str]) -> str:
+    """Content hash of a request's uploads, the result cache key's base.
+
+    One upload keeps its own hash. The hash of several also covers their
+    names and order, both of which show up in the merged output.
+    """
+    if len(hashes) == 1:
+        return hashes[0]
+    digest = hashlib.sha256()
+    for name, content_hash in zip(names, hashes):
+        digest.update(f"{name}\0{content_hash}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def process_upload(
+    operation: str,
+    engine: str,
+    uploads: list[tuple],
+    params: dict,
+    run,
+    mimetype: str,
+    download_name: str,
+    timer: StageTimer,
+):
+    """Spool the uploads, answer from the result cache or ``run(input_paths, profiles, output_path, timer)``.
+
+    ``uploads`` holds (uploaded file, filename, ext) tuples as returned by
+    ``get_upload``/``get_merge_uploads``. Finished chunked uploads are
+    already on disk and hashed; they are read where they are. Every input
+    passes the pre-flight check before ``run``; ``profiles`` are the
+    resulting ``WorkbookProfile``s.
+    """
+    status = 500
+    cache_status = "miss"
+    input_bytes = output_bytes = None
+
+    in_paths: list[str] = []
+    spooled: list[str] = []
+    out_path = None
+    try:
+        hashes = []
+        with timer.stage("upload"):
+            for uploaded, _, ext in uploads:
+                if isinstance(uploaded, AssembledUpload):
+                    in_path, content_hash = uploaded.path, uploaded.sha256
+                else:
+                    in_path, content_hash = spool_upload(uploaded, ext)
+                    spooled.append(in_path)
+                in_paths.append(in_path)
+                hashes.append(content_hash)
+        content_hash = uploads_hash([filename for _, filename, _ in uploads], hashes)
+
+        sizes = [os.path.getsize(path) for path in in_paths]
+        input_bytes = sum(sizes)
+        if 0 in sizes:
+            status = 400
+            return "Chyba: Soubor je prázdný", status
+
+        key = cache_key(content_hash, operation, params)
+        with timer.stage("cache"):
+            cached = results.open(key)
+        if cached is None:
+            with timer.stage("preflight"):
+                profiles = [check_workbook(path, preflight_limits) for path in in_paths]
+            for (_, filename, _), profile in zip(uploads, profiles):
+                app.logger.info("%s %s: %s", operation, filename, profile.summary())
+        if cached is not None:
+            cache_status = "hit"
+            output_bytes = os.fstat(cached.fileno()).st_size
+            try:
+                response = send_result(cached, mimetype, download_name, cache_status)
+            except BaseException:
+                cached.close()
+                raise
+            status = response.status_code
+            return response
+
+        fd, out_path = tempfile.mkstemp(suffix=os.path.splitext(download_name)[1], dir=SPOOL_DIR)
+        os.close(fd)
+        run(in_paths, profiles, out_path, timer)
+        output_bytes = os.path.getsize(out_path)
+
+        with timer.stage("cache"):
+            try:
+                results.put(key, out_path)
+            except OSError:
+                # A full or read-only cache dir must not fail the request.
+                app.logger.warning("could not cache result %s", key, exc_info=True)
+
+        response = send_result(out_path, mimetype, download_name, cache_status, temporary=True)
+        out_path = None  # removed by the response
+        status = response.status_code
+        return response
+
+    except InvalidWorkbook as exc:
+        app.logger.info("%s rejected %s: %s", operation, download_name, exc)
+        message, status = preflight_error(exc)
+        return message, status
+    except INVALID_WORKBOOK_ERRORS as exc:
+        app.logger.info("%s rejected %s: %s", operation, download_name, exc)
+        status = 400
+        return "Chyba: Soubor není platný sešit .xlsx nebo .xlsm", status
     except Exception:
-        return "Chyba při zpracování souboru", 500
+        app.logger.exception("%s failed (%s, engine %s)", operation, download_name, engine)
+        return "Chyba při zpracování souboru", status
+    finally:
+        for in_path in spooled:
+            remove_file(in_path)
+        if out_path is not None:
+            remove_file(out_path)
+        app.logger.info("%s %s (%s): %s", operation, download_name, engine, timer.summary())
+        metrics.record_request(
+            operation,
+            engine,
+            status,
+            cache_status,
+            time.perf_counter() - g.request_started,
+            timer,
+            input_bytes,
+            output_bytes,
+        )
+
+
+@app.post("/unlock")
+def unlock_excel():
+    if request.method == "OPTIONS":
+        return "", 204
+
+    check_api_key()
+    # Refuse before the upload is read when all slots are taken.
+    with slots.acquire("unlock"):
+        timer = g.timer = StageTimer()
+        with timer.stage("upload"):
+            uploaded, filename, ext, engine = get_upload(UNLOCK_ENGINES, DEFAULT_UNLOCK_ENGINE)
+        keep_vba = ext == ".xlsm"
+
+        def run(in_paths: list[str], profiles: list, out_path: str, timer: StageTimer) -> None:
+            unlock_workbook(in_paths[0], out_path, engine, keep_vba=keep_vba, timer=timer, zip_options=ZIP_OPTIONS)
+
+        return process_upload(
+            "unlock",
+            engine,
+            [(uploaded, filename, ext)],
+            result_params("unlock", engine, keep_vba, zip_options=ZIP_OPTIONS),
+            run,
+            UNLOCK_MIMETYPE,
+            unlock_download_name(filename),
+            timer,
+        )
 
 
 @app.post("/merge")
@@ -122,180 +630,224 @@ def merge_excel():
     if request.method == "OPTIONS":
         return "", 204
 
-    if not EXCEL_UNLOCK_API_KEY:
-        return "Chyba: EXCEL_UNLOCK_API_KEY není nakonfigurovaný", 503
+    check_api_key()
+    # Refuse before the upload is read when all slots are taken.
+    with slots.acquire("merge"):
+        timer = g.timer = StageTimer()
+        with timer.stage("upload"):
+            # Uploads are finished last, once every other field is valid.
+            selection = get_sheet_selection()
+            uploads, engine, output_format = get_merge_uploads()
+        filenames = [filename for _, filename, _ in uploads]
+
+        def run(in_paths: list[str], profiles: list, out_path: str, timer: StageTimer) -> None:
+            if output_format != "xlsx":
+                source_names = filenames if len(in_paths) > 1 else None
+                rows = export_rows(
+                    in_paths, out_path, output_format, source_names=source_names, timer=timer, selection=selection
+                )
+                app.logger.info("merge %s (%s): %d rows exported", ", ".join(filenames), output_format, rows)
+                return
+            run_engine, workers = engine, MERGE_WORKERS
+            if engine == AUTO_ENGINE:
+                run_engine, workers = auto_merge_plan(profiles, MERGE_WORKERS)
+                app.logger.info("merge %s: auto picked %s with %d workers", ", ".join(filenames), run_engine, workers)
+            if len(in_paths) == 1:
+                styles = merge_workbook(
+                    in_paths[0],
+                    out_path,
+                    run_engine,
+                    workers=workers,
+                    timer=timer,
+                    selection=selection,
+                    sheet_cache=sheet_cache,
+                    trailing_styled_rows=MERGE_TRAILING_STYLED_ROWS,
+                    zip_options=ZIP_OPTIONS,
+                )
+            else:
+                styles = merge_workbooks(
+                    in_paths,
+                    out_path,
+                    filenames,
+                    run_engine,
+                    workers=workers,
+                    timer=timer,
+                    selection=selection,
+                    sheet_cache=sheet_cache,
+                    trailing_styled_rows=MERGE_TRAILING_STYLED_ROWS,
+                    zip_options=ZIP_OPTIONS,
+                )
+            app.logger.info("merge %s (%s): style cache %s", ", ".join(filenames), run_engine, styles.summary())
+
+        return process_upload(
+            "merge",
+            engine,
+            uploads,
+            result_params(
+                "merge",
+                engine,
+                output_format=output_format,
+                selection=selection,
+                trailing_styled_rows=MERGE_TRAILING_STYLED_ROWS,
+                zip_options=ZIP_OPTIONS,
+            ),
+            run,
+            merge_mimetype(output_format),
+            merge_download_name(filenames[0], output_format),
+            timer,
+        )
 
-    if not has_valid_api_key():
-        return "Chyba: Neautorizovaný přístup", 401
 
-    if "file" not in request.files:
-        return "Chyba: Žádný soubor nebyl nahrán", 400
+def upload_response(state: dict, status: int = 200, headers: dict | None = None):
+    return state, status, {"Upload-Offset": str(state["offset"]), "Cache-Control": "no-store", **(headers or {})}
 
-    uploaded = request.files["file"]
-    if not uploaded or uploaded.filename is None or uploaded.filename == "":
-        return "Chyba: Prázdné jméno souboru", 400
 
-    filename = secure_filename(uploaded.filename)
-    _, ext = os.path.splitext(filename.lower())
-    if ext not in (".xlsx", ".xlsm"):
-        return "Chyba: Podporované jsou pouze soubory .xlsx a .xlsm", 400
-
-    headers = [
-        "List",
-        "Výběrové řízení",
-        "PČ",
-        "Typ",
-        "Kód",
-        "Popis",
-        "MJ",
-        "Množství",
-        "J.cena [CZK]",
-        "Cena celkem [CZK]",
-        "Cenová soustava",
-    ]
-    max_source_cols = len(headers) - 1  # source A..J -> target B..K (A is "List")
-    skip_sheets = {"Rekapitulace stavby", "Pokyny pro vyplnění"}
-
-    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    header_font = Font(bold=True, size=11, color="FFFFFF")
-    header_alignment = Alignment(horizontal="center", vertical="center")
-
-    sep_font = Font(bold=True, size=12, color="FFFFFF")
-    sep_alignment = Alignment(horizontal="center", vertical="center")
-
-    def copy_format(src, tgt):
-        if not src.has_style:
-            return
-        tgt.font = copy(src.font)
-        tgt.fill = copy(src.fill)
-        tgt.border = copy(src.border)
-        tgt.alignment = copy(src.alignment)
-        tgt.number_format = src.number_format
-        tgt.protection = copy(src.protection)
+@app.post("/uploads")
+def create_upload():
+    check_api_key()
+    filename, _ = check_filename(request.values.get("filename"))
 
-    try:
-        data = uploaded.read()
-        if not data:
-            return "Chyba: Soubor je prázdný", 400
-
-        # We always output .xlsx; macros are not preserved.
-        source_wb = load_workbook(io.BytesIO(data))
-
-        target_wb = Workbook()
-        target_wb.remove(target_wb.active)
-        combined = target_wb.create_sheet("Kombinovane")
-
-        # Header row (Row 1)
-        for idx, label in enumerate(headers, start=1):
-            cell = combined.cell(row=1, column=idx, value=label)
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = header_alignment
-
-        combined.freeze_panes = "A2"
-        combined.row_dimensions[1].height = 18
-        combined.column_dimensions["A"].width = 25
-
-        col_widths = {}
-        row = 2
-
-        for sheet in source_wb.worksheets:
-            if sheet.title in skip_sheets:
-                continue
-            if sheet.sheet_state in ("hidden", "veryHidden"):
-                continue
-
-            max_r = sheet.max_row or 0
-            max_c = min(sheet.max_column or 0, max_source_cols)
-
-            if max_r == 1 and max_c == 1 and sheet["A1"].value is None:
-                continue
-
-            # Separator row per sheet
-            sep_cell = combined.cell(row=row, column=1, value=f"=== {sheet.title} ===")
-            sep_cell.font = sep_font
-            sep_cell.fill = header_fill
-            sep_cell.alignment = sep_alignment
-            for col in range(2, len(headers) + 1):
-                c = combined.cell(row=row, column=col, value=None)
-                c.font = sep_font
-                c.fill = header_fill
-                c.alignment = sep_alignment
-            combined.merge_cells(start_row=row, start_column=1, end_row=row, end_column=len(headers))
-            combined.row_dimensions[row].height = 20
-            row += 1
-
-            data_start_row = row
-
-            # Data copy
-            for r in range(1, max_r + 1):
-                target_r = data_start_row + r - 1
-                combined.cell(row=target_r, column=1, value=sheet.title)
-                for c in range(1, max_c + 1):
-                    src_cell = sheet.cell(row=r, column=c)
-                    if src_cell.value is None and not src_cell.has_style:
-                        continue
-                    tgt_cell = combined.cell(row=target_r, column=c + 1)
-                    tgt_cell.value = src_cell.value
-                    copy_format(src_cell, tgt_cell)
-
-                if sheet.row_dimensions[r].height is not None:
-                    combined.row_dimensions[target_r].height = sheet.row_dimensions[r].height
-
-            # Merged cells (shifted by +1 column, and +data_start_row offset)
-            for merged in sheet.merged_cells.ranges:
-                min_row, min_col, max_row, max_col = (
-                    merged.min_row,
-                    merged.min_col,
-                    merged.max_row,
-                    merged.max_col,
-                )
-                if min_col > max_source_cols:
-                    continue
-                clipped_max_col = min(max_col, max_source_cols)
-                if clipped_max_col < min_col:
-                    continue
-                combined.merge_cells(
-                    start_row=data_start_row + min_row - 1,
-                    start_column=min_col + 1,
-                    end_row=data_start_row + max_row - 1,
-                    end_column=clipped_max_col + 1,
-                )
+    length = request.values.get("length")
+    if length is not None:
+        if not length.isdigit():
+            raise UploadError("Chyba: Neplatná délka souboru", 400)
+        length = int(length)
+    sha256 = request.values.get("sha256") or None
+    if sha256 is not None and not re.fullmatch(r"[0-9a-fA-F]{64}", sha256):
+        raise UploadError("Chyba: Neplatný kontrolní součet SHA-256", 400)
 
-            # Column widths (keep max across sheets)
-            for c in range(1, max_c + 1):
-                src_col = get_column_letter(c)
-                tgt_col = get_column_letter(c + 1)
-                w = sheet.column_dimensions[src_col].width
-                if w is None:
-                    continue
-                col_widths[tgt_col] = max(col_widths.get(tgt_col, 0), float(w))
-
-            # Gap row between sheets
-            row = data_start_row + max_r + 1
-
-        for col, w in col_widths.items():
-            combined.column_dimensions[col].width = w
-
-        max_row_combined = combined.max_row
-        combined.auto_filter.ref = f"A1:{get_column_letter(len(headers))}{max_row_combined}"
-
-        out = io.BytesIO()
-        target_wb.save(out)
-        out.seek(0)
-
-        base = os.path.splitext(filename)[0]
-        download_name = f"{base}_combined_final.xlsx"
-        return send_file(
-            out,
-            mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            as_attachment=True,
-            download_name=download_name,
-            max_age=0,
-        )
+    state = upload_store.create(filename, length, sha256)
+    return upload_response(state, 201, {"Location": f"/uploads/{state['id']}"})
+
+
+@app.get("/uploads/<upload_id>")
+def upload_status(upload_id: str):
+    check_api_key()
+    return upload_response(upload_store.get(upload_id))
+
+
+@app.patch("/uploads/<upload_id>")
+def append_upload(upload_id: str):
+    """Append the raw request body at the offset in the "Upload-Offset" header."""
+    check_api_key()
+    offset = request.headers.get("Upload-Offset", "")
+    if not offset.isdigit():
+        raise UploadError("Chyba: Chybí hlavička Upload-Offset", 400)
+    chunk_sha256 = request.headers.get("X-Chunk-SHA256") or None
+    with slots.acquire("transfer"):
+        return upload_response(upload_store.append(upload_id, int(offset), request.stream, chunk_sha256))
+
+
+@app.delete("/uploads/<upload_id>")
+def delete_upload(upload_id: str):
+    check_api_key()
+    upload_store.delete(upload_id)
+    return "", 204
 
+
+def submit_job(operation: str, **kwargs):
+    try:
+        state = jobs.submit(operation, **kwargs)
+    except QueueFull:
+        return "Chyba: Fronta úloh je plná, zkuste to později", 429, {"Retry-After": "30"}
+    except EmptyUpload:
+        return "Chyba: Soubor je prázdný", 400
+    except InvalidWorkbook as exc:
+        app.logger.info("%s job rejected: %s", operation, exc)
+        return preflight_error(exc)
     except Exception:
+        app.logger.exception("job submission failed")
         return "Chyba při zpracování souboru", 500
+    return state, 202, {"Location": f"/jobs/{state['id']}"}
+
+
+@app.post("/jobs/unlock")
+def submit_unlock_job():
+    check_api_key()
+    with slots.acquire("transfer"):
+        return _submit_unlock_job()
+
+
+def _submit_unlock_job():
+    uploaded, filename, ext, engine = get_upload(UNLOCK_ENGINES, DEFAULT_UNLOCK_ENGINE)
+    return submit_job(
+        "unlock",
+        engine=engine,
+        uploaded=uploaded,
+        ext=ext,
+        download_name=unlock_download_name(filename),
+        mimetype=UNLOCK_MIMETYPE,
+        keep_vba=ext == ".xlsm",
+        zip_options=ZIP_OPTIONS.params(),
+        limits=preflight_limits,
+    )
+
+
+@app.post("/jobs/merge")
+def submit_merge_job():
+    check_api_key()
+    with slots.acquire("transfer"):
+        return _submit_merge_job()
+
+
+def _submit_merge_job():
+    selection = get_sheet_selection()
+    uploaded, filename, ext, engine = get_upload(MERGE_ENGINE_CHOICES, DEFAULT_MERGE_ENGINE)
+    return submit_job(
+        "merge",
+        engine=engine,
+        uploaded=uploaded,
+        ext=ext,
+        download_name=merge_download_name(filename),
+        mimetype=MERGE_MIMETYPE,
+        merge_workers=MERGE_WORKERS,
+        sheet_selection=selection.params(),
+        sheet_cache_dir=SHEET_CACHE_DIR if sheet_cache is not None else None,
+        sheet_cache_max_bytes=SHEET_CACHE_MAX_BYTES,
+        trailing_styled_rows=MERGE_TRAILING_STYLED_ROWS,
+        zip_options=ZIP_OPTIONS.params(),
+        limits=preflight_limits,
+    )
+
+
+@app.get("/jobs/<job_id>")
+def job_status(job_id: str):
+    check_api_key()
+    state = jobs.get(job_id)
+    if state is None:
+        return "Chyba: Úloha neexistuje nebo vypršela", 404
+    return jobs.public_state(state)
+
+
+@app.get("/jobs/<job_id>/result")
+def job_result(job_id: str):
+    check_api_key()
+    state = jobs.get(job_id)
+    if state is None:
+        return "Chyba: Úloha neexistuje nebo vypršela", 404
+    if state["state"] == "failed":
+        return state.get("error") or "Chyba při zpracování souboru", 500
+    if state["state"] != "done":
+        return "Chyba: Úloha ještě není dokončena", 409
+
+    # The slot is held until the file is sent, not just until it starts.
+    slot = ExitStack()
+    slot.enter_context(slots.acquire("transfer"))
+    try:
+        response = send_file(
+            jobs.result_path(state),
+            mimetype=state["mimetype"],
+            as_attachment=True,
+            download_name=state["download_name"],
+            max_age=0,
+        )
+    except BaseException:
+        slot.close()
+        raise
+    # Passthrough responses skip close callbacks; iterating still streams the file.
+    response.direct_passthrough = False
+    response.call_on_close(slot.close)
+    return response
 
 
 if __name__ == "__main__":
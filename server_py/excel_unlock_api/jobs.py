@@ -0,0 +1,394 @@
+"""Background jobs for large /unlock and /merge uploads.
+
+Every job has its own directory under the jobs root::
+
+    <root>/<job id>/input.xlsx    uploaded workbook (removed once processed)
+    <root>/<job id>/result.xlsx   output of a finished job
+    <root>/<job id>/state.json    state and progress, replaced atomically
+
+State is kept on disk rather than in memory, so any service worker can answer
+``GET /jobs/<id>`` and finished results are served until they expire.
+
+The limits hold across all service processes sharing the jobs root. Each
+process runs jobs on its own process pool, but a job only starts once it
+holds one of ``max_workers`` run locks in the root, and submissions are
+counted from the ``state.json`` files under a lock on the root: beyond
+``max_workers + max_queued`` unfinished jobs they are rejected. A job
+records the pid of the service process that queued it; an unfinished job
+whose process is gone is marked failed, one whose process lives is never
+purged however long it waits.
+"""
+
+from __future__ import annotations
+
+import fcntl
+import json
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from preflight import Limits, check_workbook
+from processing import (
+    AUTO_ENGINE,
+    DEFAULT_TRAILING_STYLED_ROWS,
+    SheetCache,
+    SheetSelection,
+    ZipOptions,
+    auto_merge_plan,
+    merge_workbook,
+    unlock_workbook,
+)
+
+logger = logging.getLogger(__name__)
+
+JOB_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+STATE_FILE = "state.json"
+INPUT_FILE = "input{ext}"
+RESULT_FILE = "result{ext}"
+# In the jobs root: held while submissions are counted, and while a job runs.
+SUBMIT_LOCK = ".submit.lock"
+RUN_LOCK = ".run-{n}.lock"
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+FINISHED_STATES = (DONE, FAILED)
+
+PROGRESS_INTERVAL = 0.5  # seconds between progress writes from a worker
+RUN_LOCK_POLL = 0.5  # seconds between attempts to get a run lock
+PURGE_INTERVAL = 60.0  # seconds between purges triggered by status and result lookups
+
+# Fields of state.json that are safe to hand out to clients.
+PUBLIC_FIELDS = ("id", "operation", "engine", "state", "sheets", "rows", "error", "created_at", "updated_at", "expires_at")
+
+
+class QueueFull(Exception):
+    pass
+
+
+class EmptyUpload(Exception):
+    pass
+
+
+def _write_state(job_dir: str, state: dict) -> None:
+    state["updated_at"] = time.time()
+    tmp = os.path.join(job_dir, STATE_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(state, fh)
+    os.replace(tmp, os.path.join(job_dir, STATE_FILE))
+
+
+def _read_state(job_dir: str) -> Optional[dict]:
+    try:
+        with open(os.path.join(job_dir, STATE_FILE), encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def _process_alive(pid: Optional[int]) -> bool:
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+@contextmanager
+def _locked(path: str, blocking: bool = True) -> Iterator[bool]:
+    """Hold an exclusive lock on ``path``; yields False if it is taken and ``blocking`` is off."""
+    with open(path, "a") as fh:
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        yield True
+
+
+@contextmanager
+def _run_slot(root: str, max_workers: int) -> Iterator[None]:
+    """Wait for one of the ``max_workers`` run locks shared by every service process."""
+    while True:
+        for n in range(max_workers):
+            with _locked(os.path.join(root, RUN_LOCK.format(n=n)), blocking=False) as acquired:
+                if acquired:
+                    yield
+                    return
+        time.sleep(RUN_LOCK_POLL)
+
+
+def run_job(job_dir: str, root: str, max_workers: int) -> None:
+    """Entry point executed in a pool worker process."""
+    with _run_slot(root, max_workers):
+        _run_job(job_dir)
+
+
+def _run_job(job_dir: str) -> None:
+    state = _read_state(job_dir)
+    if state is None:
+        return
+
+    state["state"] = RUNNING
+    state["worker_pid"] = os.getpid()
+    _write_state(job_dir, state)
+
+    input_path = os.path.join(job_dir, state["input"])
+    result_path = os.path.join(job_dir, state["result"])
+    tmp_path = result_path + ".part"
+    last_write = 0.0
+
+    def progress(sheets: int, rows: int) -> None:
+        nonlocal last_write
+        state["sheets"] = sheets
+        state["rows"] = rows
+        now = time.monotonic()
+        if now - last_write >= PROGRESS_INTERVAL:
+            last_write = now
+            _write_state(job_dir, state)
+
+    try:
+        if state["operation"] == "unlock":
+            unlock_workbook(
+                input_path,
+                tmp_path,
+                state["engine"],
+                state["keep_vba"],
+                progress,
+                zip_options=ZipOptions(**state.get("zip_options", {})),
+            )
+        else:
+            merge_workbook(
+                input_path,
+                tmp_path,
+                state["engine"],
+                progress=progress,
+                workers=state.get("merge_workers", 1),
+                selection=SheetSelection(**state.get("sheet_selection", {})),
+                sheet_cache=(
+                    SheetCache(state["sheet_cache_dir"], state.get("sheet_cache_max_bytes", 0))
+                    if state.get("sheet_cache_dir")
+                    else None
+                ),
+                trailing_styled_rows=state.get("trailing_styled_rows", DEFAULT_TRAILING_STYLED_ROWS),
+                zip_options=ZipOptions(**state.get("zip_options", {})),
+            )
+        os.replace(tmp_path, result_path)
+        state["state"] = DONE
+    except Exception:
+        logger.exception("job %s failed", state["id"])
+        state["state"] = FAILED
+        state["error"] = "Chyba při zpracování souboru"
+    finally:
+        for path in (input_path, tmp_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    state["finished_at"] = time.time()
+    _write_state(job_dir, state)
+
+
+class JobManager:
+    def __init__(self, root: str, max_workers: int, max_queued: int, result_ttl: float):
+        self.root = root
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._purged_at = -PURGE_INTERVAL
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: the service is multi-threaded, forking it is not safe.
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    def _job_dir(self, job_id: str) -> Optional[str]:
+        if not JOB_ID_RE.match(job_id or ""):
+            return None
+        return os.path.join(self.root, job_id)
+
+    def submit(
+        self,
+        operation: str,
+        engine: str,
+        uploaded,
+        ext: str,
+        download_name: str,
+        mimetype: str,
+        keep_vba: bool = False,
+        merge_workers: int = 1,
+        sheet_selection: Optional[dict] = None,
+        sheet_cache_dir: Optional[str] = None,
+        sheet_cache_max_bytes: int = 0,
+        trailing_styled_rows: Optional[int] = DEFAULT_TRAILING_STYLED_ROWS,
+        zip_options: Optional[dict] = None,
+        limits: Optional[Limits] = None,
+    ) -> dict:
+        """Store ``uploaded`` (a werkzeug FileStorage) and queue it for processing.
+
+        The stored file goes through the pre-flight check first, so an
+        invalid workbook raises ``InvalidWorkbook`` here instead of failing
+        the job later. ``engine=auto`` is resolved from its profile.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(self.root, job_id)
+        with _locked(os.path.join(self.root, SUBMIT_LOCK)):
+            if self.purge_expired() >= self.max_workers + self.max_queued:
+                raise QueueFull()
+            # Counted by other submissions from here on, while the upload is stored.
+            os.makedirs(job_dir)
+            _write_state(job_dir, {"id": job_id, "state": QUEUED, "owner_pid": os.getpid(), "created_at": time.time()})
+
+        try:
+            input_name = INPUT_FILE.format(ext=ext)
+            input_path = os.path.join(job_dir, input_name)
+            uploaded.save(input_path)
+            if os.path.getsize(input_path) == 0:
+                raise EmptyUpload()
+            profile = check_workbook(input_path, limits)
+            if engine == AUTO_ENGINE:
+                engine, merge_workers = auto_merge_plan([profile], merge_workers)
+
+            state = {
+                "id": job_id,
+                "operation": operation,
+                "engine": engine,
+                "keep_vba": keep_vba,
+                "merge_workers": merge_workers,
+                "sheet_selection": sheet_selection or {},
+                "sheet_cache_dir": sheet_cache_dir,
+                "sheet_cache_max_bytes": sheet_cache_max_bytes,
+                "trailing_styled_rows": trailing_styled_rows,
+                "zip_options": zip_options or {},
+                "owner_pid": os.getpid(),
+                "state": QUEUED,
+                "sheets": 0,
+                "rows": 0,
+                "error": None,
+                "input": input_name,
+                "result": RESULT_FILE.format(ext=os.path.splitext(download_name)[1]),
+                "download_name": download_name,
+                "mimetype": mimetype,
+                "created_at": time.time(),
+            }
+            _write_state(job_dir, state)
+
+            try:
+                future = self._get_executor().submit(run_job, job_dir, self.root, self.max_workers)
+            except BrokenProcessPool:
+                # A worker died (e.g. OOM-killed) and took the pool with it.
+                self._executor = None
+                future = self._get_executor().submit(run_job, job_dir, self.root, self.max_workers)
+        except BaseException:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise
+
+        future.add_done_callback(lambda f: self._on_done(job_id, job_dir, f))
+        return self.public_state(state)
+
+    def _on_done(self, job_id: str, job_dir: str, future: Future) -> None:
+        if future.exception() is None:
+            return
+        # The worker died before it could record the outcome (e.g. killed by the OOM killer).
+        logger.error("job %s crashed: %r", job_id, future.exception())
+        state = _read_state(job_dir)
+        if state is not None and state.get("state") not in FINISHED_STATES:
+            state["state"] = FAILED
+            state["error"] = "Chyba při zpracování souboru"
+            state["finished_at"] = time.time()
+            _write_state(job_dir, state)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        self._purge_now_and_then()
+        job_dir = self._job_dir(job_id)
+        if job_dir is None:
+            return None
+        state = _read_state(job_dir)
+        if state is None or self._is_expired(state):
+            return None
+        return state
+
+    def result_path(self, state: dict) -> str:
+        return os.path.join(self.root, state["id"], state["result"])
+
+    def public_state(self, state: dict) -> dict:
+        public = {key: state.get(key) for key in PUBLIC_FIELDS}
+        if state.get("finished_at") is not None:
+            public["expires_at"] = state["finished_at"] + self.result_ttl
+        return public
+
+    def _is_expired(self, state: dict) -> bool:
+        finished_at = state.get("finished_at")
+        return finished_at is not None and finished_at + self.result_ttl < time.time()
+
+    def _purge_now_and_then(self) -> None:
+        """Purge on lookups too, so results expire while nothing new is submitted.
+
+        At most every ``PURGE_INTERVAL`` seconds, and skipped while a
+        submission (which purges anyway) holds the lock.
+        """
+        now = time.monotonic()
+        if now - self._purged_at < PURGE_INTERVAL or not os.path.isdir(self.root):
+            return
+        self._purged_at = now
+        with _locked(os.path.join(self.root, SUBMIT_LOCK), blocking=False) as acquired:
+            if acquired:
+                self.purge_expired()
+
+    def purge_expired(self) -> int:
+        """Delete finished jobs past their TTL and fail orphans. Returns the unfinished jobs left.
+
+        An unfinished job is an orphan when the service process that queued
+        it and the worker running it are gone: nothing will ever finish it.
+        """
+        try:
+            entries = os.listdir(self.root)
+        except FileNotFoundError:
+            return 0
+
+        now = time.time()
+        unfinished = 0
+        for job_id in entries:
+            job_dir = self._job_dir(job_id)
+            if job_dir is None:
+                continue
+            state = _read_state(job_dir)
+            if state is None:
+                # Between makedirs and the first state write, or left half-created.
+                if os.path.getmtime(job_dir) + self.result_ttl < now:
+                    shutil.rmtree(job_dir, ignore_errors=True)
+                continue
+            if state.get("state") not in FINISHED_STATES:
+                # A pool worker may outlive the process that queued its job.
+                if _process_alive(state.get("owner_pid")) or _process_alive(state.get("worker_pid")):
+                    unfinished += 1
+                    continue
+                logger.warning("job %s orphaned by process %s", job_id, state.get("owner_pid"))
+                state["state"] = FAILED
+                state["error"] = "Chyba při zpracování souboru"
+                state["finished_at"] = now
+                _write_state(job_dir, state)
+            if self._is_expired(state):
+                shutil.rmtree(job_dir, ignore_errors=True)
+        return unfinished
@@ -0,0 +1,182 @@
+"""Prometheus metrics for /unlock and /merge.
+
+A small in-process registry rendered in the Prometheus text format, so the
+service needs no client library. Values are per process: with several
+server processes, scrape each of them or aggregate in Prometheus.
+"""
+
+from __future__ import annotations
+
+import threading
+from typing import Iterable
+
+from processing import StageTimer, peak_rss_bytes
+
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+BYTES_BUCKETS = tuple(2**n for n in range(16, 29, 2))  # 64 KiB .. 256 MiB
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> list[str]:
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(v)}" for key, v in self._values.items()]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _samples(self) -> list[str]:
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(v)}" for key, v in self._values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> (per-bucket counts, sum, count)
+        self._values: dict[tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def _samples(self) -> list[str]:
+        lines = []
+        for key, (counts, total, count) in self._values.items():
+            for bound, n in zip(self.buckets, counts):
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {n}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+REQUESTS = Counter(
+    "excel_requests_total",
+    "Finished /unlock and /merge requests.",
+    ("operation", "engine", "status", "cache"),
+)
+REQUEST_SECONDS = Histogram(
+    "excel_request_duration_seconds",
+    "Time from receiving an upload to handing out the result.",
+    ("operation", "engine"),
+)
+STAGE_SECONDS = Histogram(
+    "excel_stage_duration_seconds",
+    "Time spent per processing stage (upload, load, copy, merges, widths, save, ...).",
+    ("operation", "engine", "stage"),
+)
+INPUT_BYTES = Histogram("excel_input_bytes", "Size of uploaded workbooks.", ("operation",), BYTES_BUCKETS)
+OUTPUT_BYTES = Histogram("excel_output_bytes", "Size of produced workbooks.", ("operation",), BYTES_BUCKETS)
+ROWS = Counter("excel_rows_processed_total", "Source rows processed.", ("operation", "engine"))
+CELLS = Counter("excel_cells_processed_total", "Cells copied or unlocked.", ("operation", "engine"))
+PEAK_RSS = Gauge("excel_process_peak_rss_bytes", "Peak resident memory of this server process.")
+REJECTED = Counter("excel_rejected_total", "Requests refused with 429 because every slot of the operation was busy.", ("operation",))
+IN_FLIGHT = Gauge("excel_in_flight_requests", "Requests holding a processing slot.", ("operation",))
+
+REGISTRY = (REQUESTS, REQUEST_SECONDS, STAGE_SECONDS, INPUT_BYTES, OUTPUT_BYTES, ROWS, CELLS, PEAK_RSS, REJECTED, IN_FLIGHT)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def record_request(
+    operation: str,
+    engine: str,
+    status: int,
+    cache: str,
+    seconds: float,
+    timer: StageTimer,
+    input_bytes: int | None = None,
+    output_bytes: int | None = None,
+) -> None:
+    REQUESTS.inc(operation=operation, engine=engine, status=status, cache=cache)
+    REQUEST_SECONDS.observe(seconds, operation=operation, engine=engine)
+    for stage, stage_seconds in timer.stages.items():
+        STAGE_SECONDS.observe(stage_seconds, operation=operation, engine=engine, stage=stage)
+    if input_bytes is not None:
+        INPUT_BYTES.observe(input_bytes, operation=operation)
+    if output_bytes is not None:
+        OUTPUT_BYTES.observe(output_bytes, operation=operation)
+    ROWS.inc(timer.counters.get("rows", 0), operation=operation, engine=engine)
+    CELLS.inc(timer.counters.get("cells", 0), operation=operation, engine=engine)
+    _update_peak_rss()
+
+
+def _update_peak_rss() -> None:
+    peak = peak_rss_bytes()
+    if peak is not None:
+        PEAK_RSS.set(peak)
+
+
+def render() -> str:
+    _update_peak_rss()
+    lines: list[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
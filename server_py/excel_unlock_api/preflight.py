@@ -0,0 +1,273 @@
+"""Pre-flight check of an uploaded workbook before any engine opens it.
+
+Only the package structure is read: the first bytes, the ZIP central
+directory and ``[Content_Types].xml``. That takes milliseconds even for
+large workbooks and catches what would otherwise end deep inside
+``load_workbook`` as a generic error after seconds of work:
+
+- files that are no ZIP at all, or a password-protected / legacy ``.xls``
+  workbook (both are OLE compound files);
+- truncated or damaged ZIP packages;
+- ZIP packages that are no spreadsheet (a renamed ``.docx``, say);
+- too many sheets, too much XML once unpacked, or parts compressed far
+  beyond what spreadsheet XML reaches (zip bombs). The ratio is checked for
+  every large part and for the package as a whole, so a bomb split into
+  many small parts does not get through either.
+
+Sizes come from the central directory. Python's ``zipfile`` never inflates a
+part past the size recorded there, so the engines cannot be made to unpack
+more than was checked.
+
+What passes is summed up in a ``WorkbookProfile`` the service logs and
+uses to pick a merge engine for ``engine=auto``.
+"""
+
+from __future__ import annotations
+
+import posixpath
+import struct
+import zipfile
+from dataclasses import dataclass
+from typing import BinaryIO, Optional
+
+from openpyxl.xml.functions import fromstring
+
+CFB_MAGIC = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+ZIP_MAGIC = (b"PK\x03\x04", b"PK\x05\x06")
+CONTENT_TYPES = "[Content_Types].xml"
+MAX_CONTENT_TYPES_BYTES = 1024 * 1024
+# Sector ids from here up mark the end of a chain, free or FAT sectors.
+CFB_MAX_SECTOR = 0xFFFFFFFA
+# Directory (and DIFAT) sectors read at most; also ends cyclic chains.
+MAX_CFB_DIRECTORY_SECTORS = 64
+
+# Content types of the main workbook part (.xlsx, .xlsm, .xltx, .xltm).
+WORKBOOK_TYPES = frozenset(
+    f"application/vnd.{kind}+xml"
+    for kind in (
+        "openxmlformats-officedocument.spreadsheetml.sheet.main",
+        "ms-excel.sheet.macroEnabled.main",
+        "openxmlformats-officedocument.spreadsheetml.template.main",
+        "ms-excel.template.macroEnabled.main",
+    )
+)
+WORKSHEET_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"
+SHARED_STRINGS_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"
+VBA_PART = "xl/vbaProject.bin"
+
+# Parts (and packages) smaller than this unpacked are not checked for their
+# compression ratio: tiny, repetitive parts compress extremely well and are harmless.
+RATIO_MIN_BYTES = 1024 * 1024
+
+
+class InvalidWorkbook(Exception):
+    """The upload is not a workbook the service can process."""
+
+
+class NotAZipPackage(InvalidWorkbook):
+    pass
+
+
+class EncryptedWorkbook(InvalidWorkbook):
+    pass
+
+
+class LegacyWorkbook(InvalidWorkbook):
+    """An OLE compound file without an encrypted package: an old binary .xls."""
+
+
+class DamagedPackage(InvalidWorkbook):
+    pass
+
+
+class NotASpreadsheet(InvalidWorkbook):
+    pass
+
+
+class NoSheets(InvalidWorkbook):
+    pass
+
+
+class TooManySheets(InvalidWorkbook):
+    pass
+
+
+class PackageTooLarge(InvalidWorkbook):
+    pass
+
+
+class SuspiciousCompression(InvalidWorkbook):
+    pass
+
+
+@dataclass(frozen=True)
+class Limits:
+    max_sheets: int = 1000
+    max_uncompressed_bytes: int = 2048 * 1024 * 1024
+    max_compression_ratio: float = 200.0
+
+
+@dataclass(frozen=True)
+class WorkbookProfile:
+    """Sizes of a workbook package as its central directory records them."""
+
+    file_bytes: int
+    uncompressed_bytes: int  # every part unpacked
+    sheets: int
+    sheet_bytes: int  # XML of all worksheets
+    largest_sheet_bytes: int
+    shared_strings_bytes: int
+    has_vba: bool
+
+    def summary(self) -> str:
+        return (
+            f"{self.sheets} sheets, sheet XML {self.sheet_bytes / 1e6:.1f} MB "
+            f"(largest {self.largest_sheet_bytes / 1e6:.1f} MB), "
+            f"shared strings {self.shared_strings_bytes / 1e6:.1f} MB, "
+            f"unpacked {self.uncompressed_bytes / 1e6:.1f} MB"
+        )
+
+
+def _cfb_sector(fh: BinaryIO, sector_size: int, sector: int) -> bytes:
+    fh.seek((sector + 1) * sector_size)
+    return fh.read(sector_size)
+
+
+def _cfb_fat_sectors(fh: BinaryIO, header: bytes, sector_size: int) -> list[int]:
+    """Where the FAT is: the 109 ids in the header, then those in the DIFAT chain."""
+    fat_sectors = list(struct.unpack_from("<109I", header, 76))
+    (difat_sector,) = struct.unpack_from("<I", header, 68)
+    for _ in range(MAX_CFB_DIRECTORY_SECTORS):
+        if difat_sector >= CFB_MAX_SECTOR:
+            break
+        data = _cfb_sector(fh, sector_size, difat_sector)
+        if len(data) < sector_size:
+            break
+        *ids, difat_sector = struct.unpack(f"<{sector_size // 4}I", data)
+        fat_sectors.extend(ids)
+    return fat_sectors
+
+
+def _cfb_stream_names(fh: BinaryIO, header: bytes) -> set[str]:
+    """Names in the directory of an OLE compound file.
+
+    The directory's sectors are followed through the FAT: an encrypted
+    workbook's ``EncryptedPackage`` entry is often not in the first one.
+    A broken chain ends the walk with the names read so far.
+    """
+    if len(header) < 512:
+        return set()
+    sector_size = 1 << struct.unpack_from("<H", header, 30)[0]
+    (sector,) = struct.unpack_from("<I", header, 48)
+    if sector_size not in (512, 4096):
+        return set()
+    ids_per_sector = sector_size // 4
+    fat_sectors: Optional[list[int]] = None
+    fat: dict[int, bytes] = {}
+
+    names = set()
+    for _ in range(MAX_CFB_DIRECTORY_SECTORS):
+        if sector >= CFB_MAX_SECTOR:
+            break
+        data = _cfb_sector(fh, sector_size, sector)
+        for entry in range(0, len(data) - 127, 128):
+            (name_length,) = struct.unpack_from("<H", data, entry + 64)
+            if 2 <= name_length <= 64:
+                names.add(data[entry : entry + name_length - 2].decode("utf-16-le", "replace"))
+        if len(data) < sector_size:
+            break
+
+        # The next directory sector is this one's entry in the FAT.
+        index, offset = divmod(sector, ids_per_sector)
+        if fat_sectors is None:
+            fat_sectors = _cfb_fat_sectors(fh, header, sector_size)
+        if index >= len(fat_sectors) or fat_sectors[index] >= CFB_MAX_SECTOR:
+            break
+        if index not in fat:
+            fat[index] = _cfb_sector(fh, sector_size, fat_sectors[index])
+        if len(fat[index]) < sector_size:
+            break
+        (sector,) = struct.unpack_from("<I", fat[index], offset * 4)
+    return names
+
+
+def _content_types(package: zipfile.ZipFile) -> dict[str, str]:
+    """Part name (without the leading "/") -> content type of every Override."""
+    try:
+        info = package.getinfo(CONTENT_TYPES)
+    except KeyError:
+        raise NotASpreadsheet(f"no {CONTENT_TYPES}") from None
+    if info.file_size > MAX_CONTENT_TYPES_BYTES:
+        raise DamagedPackage(f"{CONTENT_TYPES} has {info.file_size} bytes")
+    try:
+        root = fromstring(package.read(info))
+    except Exception as exc:  # zlib, CRC and XML errors alike
+        raise DamagedPackage(f"unreadable {CONTENT_TYPES}: {exc}") from None
+
+    overrides = {}
+    for element in root:
+        if element.tag.rpartition("}")[2] == "Override":
+            name = posixpath.normpath(element.get("PartName", "")).lstrip("/")
+            overrides[name] = element.get("ContentType", "")
+    return overrides
+
+
+def _part_sizes(parts: dict[str, zipfile.ZipInfo], content_types: dict[str, str], content_type: str) -> list[int]:
+    """Unpacked sizes of the parts of ``content_type`` present in the package."""
+    return [parts[name].file_size for name, kind in content_types.items() if kind == content_type and name in parts]
+
+
+def check_workbook(path: str, limits: Optional[Limits] = None) -> WorkbookProfile:
+    """Check the package at ``path``. Returns its profile or raises an ``InvalidWorkbook``."""
+    limits = limits if limits is not None else Limits()
+    with open(path, "rb") as fh:
+        header = fh.read(512)
+        if header.startswith(CFB_MAGIC):
+            if "EncryptedPackage" in _cfb_stream_names(fh, header):
+                raise EncryptedWorkbook("OLE compound file with an EncryptedPackage stream")
+            raise LegacyWorkbook("OLE compound file")
+        if not header.startswith(ZIP_MAGIC):
+            raise NotAZipPackage(f"starts with {header[:8]!r}")
+
+        try:
+            package = zipfile.ZipFile(fh)
+        except (zipfile.BadZipFile, OSError, ValueError) as exc:
+            raise DamagedPackage(f"unreadable central directory: {exc}") from None
+
+        with package:
+            parts = {info.filename: info for info in package.infolist()}
+            uncompressed = sum(info.file_size for info in parts.values())
+            if uncompressed > limits.max_uncompressed_bytes:
+                raise PackageTooLarge(f"{uncompressed} bytes unpacked")
+            for info in parts.values():
+                if info.file_size >= RATIO_MIN_BYTES:
+                    ratio = info.file_size / max(info.compress_size, 1)
+                    if ratio > limits.max_compression_ratio:
+                        raise SuspiciousCompression(f"{info.filename} compressed {ratio:.0f}:1")
+            if uncompressed >= RATIO_MIN_BYTES:
+                ratio = uncompressed / max(sum(info.compress_size for info in parts.values()), 1)
+                if ratio > limits.max_compression_ratio:
+                    raise SuspiciousCompression(f"{len(parts)} parts compressed {ratio:.0f}:1 in total")
+
+            content_types = _content_types(package)
+            workbook_parts = [name for name, kind in content_types.items() if kind in WORKBOOK_TYPES]
+            if not workbook_parts:
+                raise NotASpreadsheet("no workbook part in the content types")
+            if workbook_parts[0] not in parts:
+                raise DamagedPackage(f"{workbook_parts[0]} is missing")
+
+            sheet_sizes = _part_sizes(parts, content_types, WORKSHEET_TYPE)
+            if not sheet_sizes:
+                raise NoSheets("no worksheet parts")
+            if len(sheet_sizes) > limits.max_sheets:
+                raise TooManySheets(f"{len(sheet_sizes)} worksheets")
+
+            return WorkbookProfile(
+                file_bytes=fh.seek(0, 2),
+                uncompressed_bytes=uncompressed,
+                sheets=len(sheet_sizes),
+                sheet_bytes=sum(sheet_sizes),
+                largest_sheet_bytes=max(sheet_sizes),
+                shared_strings_bytes=sum(_part_sizes(parts, content_types, SHARED_STRINGS_TYPE)),
+                has_vba=VBA_PART in parts,
+            )
@@ -0,0 +1,331 @@
+"""Workbook operations behind the HTTP endpoints.
+
+Kept free of Flask so the same functions run inside the request thread and
+in job worker processes (see jobs.py). ``source``/``target`` accept a path or
+a binary file object.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import zipfile
+from contextlib import ExitStack, contextmanager
+from typing import BinaryIO, Callable, Iterator, Optional, Union
+
+from openpyxl import load_workbook
+from openpyxl.styles import Protection
+from openpyxl.xml.constants import ARC_STYLE
+
+from preflight import WorkbookProfile
+
+# The merge engines live next to the CLI in ../excel_merge_tool.
+MERGE_TOOL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "excel_merge_tool")
+if MERGE_TOOL_DIR not in sys.path:
+    sys.path.append(MERGE_TOOL_DIR)
+
+from columnar_export import MIMETYPES as EXPORT_MIMETYPES  # noqa: E402
+from columnar_export import export_rows, parquet_available  # noqa: E402
+from instrumentation import StageTimer, peak_rss_bytes  # noqa: E402
+from merge_engine import backend_names, get_backend, merge  # noqa: E402
+from merge_layout import HEADERS, SKIP_SHEETS  # noqa: E402
+from sheet_cache import SheetCache  # noqa: E402
+from sheet_selection import DEFAULT_SELECTION, SheetSelection  # noqa: E402
+from style_cache import StyleCache  # noqa: E402
+from used_range import DEFAULT_TRAILING_STYLED_ROWS  # noqa: E402
+from xml_unlock import StyleUnlockingZipFile, unlock_package  # noqa: E402
+from zip_output import DEFAULT_ZIP_OPTIONS, OutputZipFile, ZipOptions, write_workbook  # noqa: E402
+
+Source = Union[str, BinaryIO]
+# Called with (sheets processed, rows processed) as an operation advances.
+ProgressCallback = Callable[[int, int], None]
+
+# "openpyxl" rewrites every cell; "styles" loads the workbook with openpyxl too
+# but unlocks the shared cell-style table once while saving; "xml" streams the
+# ZIP package and patches only the protection markup (see xml_unlock.py).
+UNLOCK_ENGINES = ("openpyxl", "styles", "xml")
+
+# Backends registered in merge_engine: "openpyxl" builds both workbooks in
+# memory; "streaming" reads the source in read-only mode and writes the result
+# in write-only mode (bounded memory); "xml" is "streaming" writing raw XML rows.
+MERGE_ENGINES = backend_names()
+
+# "auto" picks the backend and its worker count from the pre-flight profile
+# of the uploads (see auto_merge_plan). Not a backend of its own.
+AUTO_ENGINE = "auto"
+MERGE_ENGINE_CHOICES = MERGE_ENGINES + (AUTO_ENGINE,)
+# Sheet XML below which worker processes cost more to start than they save.
+PARALLEL_MIN_SHEET_BYTES = 32 * 1024 * 1024
+
+# "xlsx" is the styled Kombinovane workbook; the others are data-only exports
+# (see columnar_export.py) and do not use a merge engine.
+MERGE_FORMATS = ("xlsx", "csv", "jsonl", "parquet")
+
+UNLOCK_MIMETYPE = "application/vnd.ms-excel.sheet.macroEnabled.12"
+MERGE_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def unlock_download_name(filename: str) -> str:
+    base = os.path.splitext(filename)[0]
+    return f"{base}-odemceno.xlsm"
+
+
+def merge_download_name(filename: str, output_format: str = "xlsx") -> str:
+    base = os.path.splitext(filename)[0]
+    return f"{base}_combined_final.{output_format}"
+
+
+def merge_mimetype(output_format: str) -> str:
+    return MERGE_MIMETYPE if output_format == "xlsx" else EXPORT_MIMETYPES[output_format]
+
+
+def result_params(
+    operation: str,
+    engine: str,
+    keep_vba: bool = False,
+    output_format: str = "xlsx",
+    selection: SheetSelection = DEFAULT_SELECTION,
+    trailing_styled_rows: Optional[int] = DEFAULT_TRAILING_STYLED_ROWS,
+    zip_options: ZipOptions = DEFAULT_ZIP_OPTIONS,
+) -> dict:
+    """Everything besides the uploaded bytes that shapes an operation's output.
+
+    Used in the result cache key, so changing the merge layout or switching
+    engines never serves a stale result.
+    """
+    if operation == "unlock":
+        return {"engine": engine, "keep_vba": keep_vba, "zip": zip_options.params()}
+    return {
+        "engine": engine,
+        "format": output_format,
+        "skip_sheets": sorted(SKIP_SHEETS),
+        "sheets": selection.params(),
+        "trailing_styled_rows": trailing_styled_rows,
+        "headers": list(HEADERS),
+        # Data exports are not ZIP packages.
+        "zip": zip_options.params() if output_format == "xlsx" else None,
+    }
+
+
+def auto_merge_plan(profiles: list[WorkbookProfile], max_workers: int) -> tuple[str, int]:
+    """(engine, workers) for ``engine=auto``.
+
+    All backends produce the same workbook, so only speed and memory count:
+    ``xml`` is the fastest at every size and keeps memory bounded. Workers
+    only pay off for several sheets with enough XML to parse.
+    """
+    sheets = sum(profile.sheets for profile in profiles)
+    sheet_bytes = sum(profile.sheet_bytes for profile in profiles)
+    if sheets < 2 or sheet_bytes < PARALLEL_MIN_SHEET_BYTES:
+        return "xml", 1
+    return "xml", min(max_workers, sheets)
+
+
+@contextmanager
+def _passthrough_source(source: Source, zip_options: ZipOptions) -> Iterator[Optional[zipfile.ZipFile]]:
+    """The source package whose unchanged parts the output copies, if the options allow."""
+    if not zip_options.passthrough:
+        yield None
+        return
+    with zipfile.ZipFile(source) as package:
+        yield package
+
+
+def _save_workbook(
+    wb,
+    target: Source,
+    source: Source,
+    zip_options: Optional[ZipOptions],
+    timer: StageTimer,
+    archive_class: type[OutputZipFile] = OutputZipFile,
+    **archive_args,
+) -> None:
+    """What ``Workbook.save`` does, copying parts unchanged since ``source`` as they are."""
+    zip_options = zip_options if zip_options is not None else DEFAULT_ZIP_OPTIONS
+    with _passthrough_source(source, zip_options) as original:
+        archive = archive_class(target, options=zip_options, source=original, **archive_args)
+        write_workbook(wb, archive)
+    timer.count("parts_passed_through", archive.parts_passed_through)
+
+
+def unlock_with_openpyxl(
+    source: Source,
+    target: Source,
+    keep_vba: bool,
+    progress: Optional[ProgressCallback] = None,
+    timer: Optional[StageTimer] = None,
+    zip_options: Optional[ZipOptions] = None,
+) -> None:
+    timer = timer if timer is not None else StageTimer()
+    with timer.stage("load"):
+        wb = load_workbook(source, keep_vba=keep_vba)
+
+    rows_done = 0
+    cells_done = 0
+    with timer.stage("unlock"):
+        for sheets_done, sheet in enumerate(wb.worksheets, start=1):
+            # Disable sheet protection
+            sheet.protection.enabled = False
+
+            # Optionally unlock cell styles. This is the behavior you validated in Python/openpyxl.
+            # It can take longer on huge sheets, but preserves file size and formatting reliably.
+            for row in sheet.iter_rows():
+                for cell in row:
+                    cell.protection = Protection(locked=False, hidden=False)
+                cells_done += len(row)
+                rows_done += 1
+
+            if progress is not None:
+                progress(sheets_done, rows_done)
+
+    with timer.stage("save"):
+        _save_workbook(wb, target, source, zip_options, timer)
+    timer.count("sheets", len(wb.worksheets))
+    timer.count("rows", rows_done)
+    timer.count("cells", cells_done)
+
+
+def unlock_with_style_table(
+    source: Source,
+    target: Source,
+    keep_vba: bool,
+    progress: Optional[ProgressCallback] = None,
+    timer: Optional[StageTimer] = None,
+    zip_options: Optional[ZipOptions] = None,
+) -> None:
+    """Same result as ``unlock_with_openpyxl`` without touching a cell.
+
+    Cells, rows and columns only reference entries of the workbook's
+    ``cellXfs`` table, so unlocking every entry (including the default one
+    of cells without a style) unlocks them all. The table is patched as
+    openpyxl writes ``xl/styles.xml``.
+    """
+    timer = timer if timer is not None else StageTimer()
+    with timer.stage("load"):
+        wb = load_workbook(source, keep_vba=keep_vba)
+
+    with timer.stage("unlock"):
+        for sheets_done, sheet in enumerate(wb.worksheets, start=1):
+            sheet.protection.enabled = False
+            if progress is not None:
+                progress(sheets_done, 0)
+
+    with timer.stage("save"):
+        _save_workbook(wb, target, source, zip_options, timer, StyleUnlockingZipFile, styles_part=ARC_STYLE)
+    timer.count("sheets", len(wb.worksheets))
+
+
+def unlock_with_xml(
+    source: Source,
+    target: Source,
+    progress: Optional[ProgressCallback] = None,
+    timer: Optional[StageTimer] = None,
+    zip_options: Optional[ZipOptions] = None,
+) -> None:
+    timer = timer if timer is not None else StageTimer()
+    sheets_done = 0
+
+    def on_sheet(sheets: int, rows: int) -> None:
+        nonlocal sheets_done
+        sheets_done = sheets
+        if progress is not None:
+            progress(sheets, rows)
+
+    # Parts are copied as-is, so macros survive without any keep_vba switch.
+    with ExitStack() as stack, timer.stage("rewrite"):
+        if isinstance(source, str):
+            source = stack.enter_context(open(source, "rb"))
+        if isinstance(target, str):
+            target = stack.enter_context(open(target, "wb"))
+        unlock_package(source, target, progress=on_sheet, zip_options=zip_options)
+    timer.count("sheets", sheets_done)
+
+
+def unlock_workbook(
+    source: Source,
+    target: Source,
+    engine: str,
+    keep_vba: bool,
+    progress: Optional[ProgressCallback] = None,
+    timer: Optional[StageTimer] = None,
+    zip_options: Optional[ZipOptions] = None,
+) -> None:
+    """Run the selected unlock engine. ``zip_options`` set how the output is compressed (see zip_output.py)."""
+    if engine == "xml":
+        unlock_with_xml(source, target, progress, timer, zip_options)
+    elif engine == "styles":
+        unlock_with_style_table(source, target, keep_vba, progress, timer, zip_options)
+    else:
+        # keep_vba preserves macros for .xlsm; for .xlsx it is harmless but unnecessary.
+        unlock_with_openpyxl(source, target, keep_vba, progress, timer, zip_options)
+
+
+def merge_workbook(
+    source: Source,
+    target: Source,
+    engine: str,
+    style_cache: Optional[StyleCache] = None,
+    progress: Optional[ProgressCallback] = None,
+    workers: int = 1,
+    timer: Optional[StageTimer] = None,
+    selection: SheetSelection = DEFAULT_SELECTION,
+    sheet_cache: Optional[SheetCache] = None,
+    trailing_styled_rows: Optional[int] = DEFAULT_TRAILING_STYLED_ROWS,
+    zip_options: Optional[ZipOptions] = None,
+) -> StyleCache:
+    """Run the selected merge engine. Returns the style cache for its hit rate.
+
+    ``workers`` and ``sheet_cache`` are ignored by engines without them
+    (see merge_engine).
+    """
+    styles = style_cache if style_cache is not None else StyleCache()
+    merge(
+        [source],
+        target,
+        engine,
+        style_cache=styles,
+        progress=progress,
+        workers=workers,
+        timer=timer,
+        selection=selection,
+        sheet_cache=sheet_cache,
+        trailing_styled_rows=trailing_styled_rows,
+        zip_options=zip_options,
+    )
+    return styles
+
+
+def merge_workbooks(
+    sources: list[Source],
+    target: Source,
+    source_names: list[str],
+    engine: str = "streaming",
+    style_cache: Optional[StyleCache] = None,
+    progress: Optional[ProgressCallback] = None,
+    workers: int = 1,
+    timer: Optional[StageTimer] = None,
+    selection: SheetSelection = DEFAULT_SELECTION,
+    sheet_cache: Optional[SheetCache] = None,
+    trailing_styled_rows: Optional[int] = DEFAULT_TRAILING_STYLED_ROWS,
+    zip_options: Optional[ZipOptions] = None,
+) -> StyleCache:
+    """Merge several workbooks one after another (engines with ``multi_file``).
+
+    The output starts with a "Soubor" column filled from ``source_names``.
+    """
+    styles = style_cache if style_cache is not None else StyleCache()
+    merge(
+        sources,
+        target,
+        engine,
+        style_cache=styles,
+        progress=progress,
+        workers=workers,
+        timer=timer,
+        source_names=source_names,
+        selection=selection,
+        sheet_cache=sheet_cache,
+        trailing_styled_rows=trailing_styled_rows,
+        zip_options=zip_options,
+    )
+    return styles
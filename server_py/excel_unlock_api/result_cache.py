@@ -0,0 +1,129 @@
+"""On-disk cache of /unlock and /merge results.
+
+Tender files get uploaded again and again (retries, colleagues, the desktop
+app re-syncing). Results are stored under a key derived from the SHA-256 of
+the uploaded bytes plus the operation and everything that shapes its output,
+so a repeat upload is answered from disk without opening the workbook.
+
+Entries are plain files named after their key. The file's mtime is its last
+use: hits touch it, eviction drops entries unused for ``ttl`` seconds and then
+the least recently used ones until the cache fits in ``max_bytes``.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from typing import BinaryIO, Optional
+
+# Bump when an engine change alters the output for the same input.
+CACHE_VERSION = 1
+
+ENTRY_SUFFIX = ".bin"
+
+
+def cache_key(content_hash: str, operation: str, params: dict) -> str:
+    """Key of a result: upload hash + operation + its output-affecting parameters."""
+    payload = json.dumps(
+        {"v": CACHE_VERSION, "sha256": content_hash, "operation": operation, "params": params},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, root: str, max_bytes: int, ttl: float):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._evict_lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key + ENTRY_SUFFIX)
+
+    def get(self, key: str) -> Optional[str]:
+        """Path of the cached result for ``key``, or None on a miss."""
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            if os.path.getmtime(path) + self.ttl < time.time():
+                return None
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def open(self, key: str) -> Optional[BinaryIO]:
+        """The cached result for ``key`` opened for reading, or None on a miss.
+
+        An open entry stays readable when eviction removes it meanwhile.
+        """
+        path = self.get(key)
+        if path is None:
+            return None
+        try:
+            return open(path, "rb")
+        except OSError:  # evicted since get()
+            return None
+
+    def put(self, key: str, result_path: str) -> None:
+        """Store a copy of the file at ``result_path``."""
+        if not self.enabled:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        tmp = os.path.join(self.root, f".{uuid.uuid4().hex}.tmp")
+        try:
+            shutil.copyfile(result_path, tmp)
+            os.replace(tmp, self._path(key))
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        self.evict()
+
+    def evict(self) -> None:
+        """Drop expired entries, then least recently used ones until under ``max_bytes``."""
+        with self._evict_lock:
+            entries = []
+            try:
+                names = os.listdir(self.root)
+            except FileNotFoundError:
+                return
+
+            now = time.time()
+            for name in names:
+                if not name.endswith(ENTRY_SUFFIX):
+                    continue
+                path = os.path.join(self.root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if st.st_mtime + self.ttl < now:
+                    self._remove(path)
+                else:
+                    entries.append((st.st_mtime, st.st_size, path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,73 @@
+"""Production entry point: gunicorn with threaded workers.
+
+``python app.py`` runs the Flask development server, fine for local work but
+not for serving 150 MB merges next to health checks. This starts gunicorn
+with ``gthread`` workers configured from the environment::
+
+    EXCEL_UNLOCK_API_KEY=... python serve.py
+
+Each worker process has its own slots per operation (see admission.py). The
+thread count defaults to the slots plus spare threads, so ``/health`` and
+``/metrics`` always find a free thread while every slot is busy.
+
+One worker process is the default: metrics (see metrics.py) and the slots
+live in each process, and with several processes behind one port every
+``/metrics`` scrape lands on a random one, so counters jump between them.
+Raise ``EXCEL_SERVER_WORKERS`` only where that does not matter.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+
+from gunicorn.app.base import BaseApplication
+
+from app import app, slots
+
+# Threads per worker beyond the processing slots, for /health, /metrics and
+# requests about to be rejected with 429.
+SPARE_THREADS = 4
+
+
+def server_options() -> dict:
+    host = os.environ.get("EXCEL_UNLOCK_HOST", "0.0.0.0")
+    port = int(os.environ.get("EXCEL_UNLOCK_PORT", "5000"))
+    return {
+        "bind": f"{host}:{port}",
+        "worker_class": "gthread",
+        "workers": int(os.environ.get("EXCEL_SERVER_WORKERS", "1")),
+        "threads": int(os.environ.get("EXCEL_SERVER_THREADS", str(slots.total + SPARE_THREADS))),
+        # gthread workers heartbeat from their main thread, so this bounds a
+        # hung worker rather than a long merge.
+        "timeout": int(os.environ.get("EXCEL_SERVER_TIMEOUT", "120")),
+        "graceful_timeout": int(os.environ.get("EXCEL_SERVER_GRACEFUL_TIMEOUT", "300")),
+        # Recycle workers now and then; openpyxl leaves a fragmented heap behind.
+        "max_requests": int(os.environ.get("EXCEL_SERVER_MAX_REQUESTS", "500")),
+        "max_requests_jitter": 50,
+        "accesslog": "-",
+        "errorlog": "-",
+    }
+
+
+class ExcelUnlockServer(BaseApplication):
+    def __init__(self, application, options: dict):
+        self.application = application
+        self.options = options
+        super().__init__()
+
+    def load_config(self) -> None:
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+
+if __name__ == "__main__":
+    options = server_options()
+    if options["workers"] > 1:
+        logging.getLogger(__name__).warning(
+            "%d server workers: /metrics and the slot limits are per worker", options["workers"]
+        )
+    ExcelUnlockServer(app, options).run()
@@ -0,0 +1,12 @@
+import os
+import sys
+
+# The service's modules import each other by plain name (see app.py).
+UNLOCK_API_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+if UNLOCK_API_DIR not in sys.path:
+    sys.path.insert(0, UNLOCK_API_DIR)
+
+# As processing.py does, for modules tested without it (xml_unlock needs zip_output).
+MERGE_TOOL_DIR = os.path.join(UNLOCK_API_DIR, os.pardir, "excel_merge_tool")
+if MERGE_TOOL_DIR not in sys.path:
+    sys.path.append(MERGE_TOOL_DIR)
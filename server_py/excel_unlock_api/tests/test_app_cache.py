@@ -0,0 +1,80 @@
+"""Repeat uploads answered from the result cache, even while it evicts."""
+
+from __future__ import annotations
+
+import io
+import os
+
+import openpyxl
+import pytest
+
+import app as service
+from result_cache import ResultCache
+
+KEY = "test-key"
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(service, "EXCEL_UNLOCK_API_KEY", KEY)
+    monkeypatch.setattr(service, "results", ResultCache(str(tmp_path / "cache"), 10 << 20, 3600))
+    return service.app.test_client()
+
+
+@pytest.fixture(scope="module")
+def workbook() -> bytes:
+    buffer = io.BytesIO()
+    wb = openpyxl.Workbook()
+    wb.active.title = "SO 01"
+    wb.active.append(["1", "HSV", "1", "K", "001", "Položka", "m3", 1.5, 100, 150])
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def _unlock(client, workbook: bytes):
+    response = client.post(
+        "/unlock",
+        data={"file": (io.BytesIO(workbook), "rozpocet.xlsx")},
+        headers={"X-Excel-Unlock-Key": KEY},
+    )
+    with response:  # runs the close callbacks, as the WSGI server does
+        assert response.status_code == 200, response.get_data(as_text=True)
+        return response.headers["X-Cache"], response.get_data()
+
+
+def _entries() -> list[str]:
+    return [os.path.join(service.results.root, name) for name in os.listdir(service.results.root)]
+
+
+def test_repeat_upload_is_a_hit(client, workbook):
+    miss = _unlock(client, workbook)
+    assert miss[0] == "miss"
+    assert _unlock(client, workbook) == ("hit", miss[1])
+
+
+def test_hit_evicted_while_sent_is_still_served(client, workbook, monkeypatch):
+    _, expected = _unlock(client, workbook)
+    send_result = service.send_result
+
+    def evict_then_send(*args, **kwargs):
+        for path in _entries():
+            os.remove(path)
+        return send_result(*args, **kwargs)
+
+    monkeypatch.setattr(service, "send_result", evict_then_send)
+    assert _unlock(client, workbook) == ("hit", expected)
+
+
+def test_hit_evicted_before_it_is_opened_is_processed_again(client, workbook, monkeypatch):
+    _unlock(client, workbook)
+    get = service.results.get
+
+    def get_then_evict(key):
+        path = get(key)
+        os.remove(path)
+        return path
+
+    monkeypatch.setattr(service.results, "get", get_then_evict)
+    status, body = _unlock(client, workbook)
+    assert status == "miss"
+    assert openpyxl.load_workbook(io.BytesIO(body))["SO 01"]["F1"].value == "Položka"
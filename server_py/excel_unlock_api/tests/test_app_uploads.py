@@ -0,0 +1,71 @@
+"""Chunked uploads stay open when a request naming them is refused."""
+
+from __future__ import annotations
+
+import hashlib
+import io
+
+import openpyxl
+import pytest
+
+import app as service
+from uploads import UploadStore
+
+KEY = "test-key"
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(service, "EXCEL_UNLOCK_API_KEY", KEY)
+    monkeypatch.setattr(service, "upload_store", UploadStore(str(tmp_path / "uploads"), 10 << 20, 3600))
+    return service.app.test_client()
+
+
+def _upload(client) -> str:
+    buffer = io.BytesIO()
+    wb = openpyxl.Workbook()
+    wb.active.title = "SO 01"
+    wb.active.append(["1", "HSV", "1", "K", "001", "Položka", "m3", 1.5, 100, 150])
+    wb.save(buffer)
+    data = buffer.getvalue()
+
+    headers = {"X-Excel-Unlock-Key": KEY}
+    created = client.post(
+        "/uploads",
+        data={"filename": "rozpocet.xlsx", "length": len(data), "sha256": hashlib.sha256(data).hexdigest()},
+        headers=headers,
+    )
+    assert created.status_code == 201
+    upload_id = created.get_json()["id"]
+    appended = client.patch(f"/uploads/{upload_id}", data=data, headers={**headers, "Upload-Offset": "0"})
+    assert appended.status_code == 200
+    return upload_id
+
+
+@pytest.mark.parametrize(
+    "path, fields",
+    [
+        ("/unlock", {"engine": "nope"}),
+        ("/merge", {"engine": "nope"}),
+        ("/merge", {"format": "nope"}),
+        ("/merge", {"sheet_regex": "("}),
+        ("/jobs/merge", {"sheet_regex": "("}),
+    ],
+)
+def test_refused_request_leaves_the_upload_open(client, path, fields):
+    upload_id = _upload(client)
+    response = client.post(path, data={"upload": upload_id, **fields}, headers={"X-Excel-Unlock-Key": KEY})
+    assert response.status_code == 400
+    assert client.get(f"/uploads/{upload_id}", headers={"X-Excel-Unlock-Key": KEY}).get_json()["complete"] is False
+
+
+def test_unknown_upload_is_refused(client):
+    response = client.post("/unlock", data={"upload": "0" * 32}, headers={"X-Excel-Unlock-Key": KEY})
+    assert response.status_code == 404
+
+
+def test_processed_upload_is_closed(client):
+    upload_id = _upload(client)
+    response = client.post("/unlock", data={"upload": upload_id}, headers={"X-Excel-Unlock-Key": KEY})
+    assert response.status_code == 200
+    assert client.get(f"/uploads/{upload_id}", headers={"X-Excel-Unlock-Key": KEY}).get_json()["complete"] is True
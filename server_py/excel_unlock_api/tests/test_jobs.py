@@ -0,0 +1,158 @@
+"""Job limits and purging hold across service processes sharing one jobs root."""
+
+from __future__ import annotations
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+import openpyxl
+import pytest
+
+import jobs
+from jobs import (
+    DONE,
+    FAILED,
+    QUEUED,
+    RUN_LOCK,
+    EmptyUpload,
+    JobManager,
+    QueueFull,
+    _locked,
+    _read_state,
+    _write_state,
+)
+from preflight import NotAZipPackage
+from uploads import AssembledUpload
+
+
+@pytest.fixture(scope="module")
+def workbook(tmp_path_factory):
+    path = tmp_path_factory.mktemp("input") / "rozpocet.xlsx"
+    wb = openpyxl.Workbook()
+    wb.active.title = "SO 01"
+    wb.active.append(["1", "HSV", "1", "K", "001", "Položka", "m3", 1.5, 100, 150])
+    wb.save(path)
+    return AssembledUpload(str(path), "rozpocet.xlsx", "")
+
+
+def _submit(manager: JobManager, workbook) -> dict:
+    return manager.submit("unlock", "xml", workbook, ".xlsx", "rozpocet_unlocked.xlsx", "application/octet-stream")
+
+
+def _wait(manager: JobManager, job_id: str) -> dict:
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        state = manager.get(job_id)
+        if state["state"] in (DONE, FAILED):
+            return state
+        time.sleep(0.1)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def _dead_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_queue_limit_is_shared_between_processes(tmp_path, workbook):
+    # Two managers stand for two service processes on the same jobs root.
+    first, second = (JobManager(str(tmp_path), max_workers=1, max_queued=1, result_ttl=60) for _ in range(2))
+    # Holding the only run lock keeps both jobs waiting.
+    with _locked(str(tmp_path / RUN_LOCK.format(n=0))):
+        queued = [_submit(first, workbook), _submit(second, workbook)]
+        with pytest.raises(QueueFull):
+            _submit(first, workbook)
+        time.sleep(1)
+        assert [first.get(job["id"])["state"] for job in queued] == [QUEUED, QUEUED]
+    assert [_wait(first, job["id"])["state"] for job in queued] == [DONE, DONE]
+    _submit(second, workbook)
+
+
+def _job(root, job_id: str, **state) -> str:
+    job_dir = os.path.join(root, job_id)
+    os.makedirs(job_dir)
+    _write_state(job_dir, {"id": job_id, "state": QUEUED, "created_at": 0, **state})
+    return job_dir
+
+
+def test_waiting_job_of_a_live_process_is_kept(tmp_path):
+    manager = JobManager(str(tmp_path), max_workers=1, max_queued=1, result_ttl=0)
+    job_dir = _job(tmp_path, "a" * 32, owner_pid=os.getpid())
+    state = _read_state(job_dir)
+    state["updated_at"] = 0  # waited far longer than the TTL
+    with open(os.path.join(job_dir, "state.json"), "w", encoding="utf-8") as fh:
+        json.dump(state, fh)
+    assert manager.purge_expired() == 1
+    assert _read_state(job_dir)["state"] == QUEUED
+
+
+def test_orphaned_job_fails_then_expires(tmp_path):
+    manager = JobManager(str(tmp_path), max_workers=1, max_queued=1, result_ttl=60)
+    job_dir = _job(tmp_path, "b" * 32, owner_pid=_dead_pid())
+    assert manager.purge_expired() == 0
+    state = manager.get("b" * 32)
+    assert state["state"] == FAILED and state["error"]
+
+    manager.result_ttl = 0
+    time.sleep(0.01)
+    manager.purge_expired()
+    assert not os.path.exists(job_dir)
+
+
+def test_rejected_upload_leaves_no_job(tmp_path):
+    manager = JobManager(str(tmp_path / "jobs"), max_workers=1, max_queued=1, result_ttl=60)
+    empty = tmp_path / "empty.xlsx"
+    empty.write_bytes(b"")
+    with pytest.raises(EmptyUpload):
+        _submit(manager, AssembledUpload(str(empty), "empty.xlsx", ""))
+
+    text = tmp_path / "text.xlsx"
+    text.write_text("name;price\n")
+    with pytest.raises(NotAZipPackage):
+        _submit(manager, AssembledUpload(str(text), "text.xlsx", ""))
+
+    assert [name for name in os.listdir(manager.root) if not name.startswith(".")] == []
+
+
+def test_failing_job_is_reported_and_cleaned_up(tmp_path, workbook):
+    manager = JobManager(str(tmp_path), max_workers=1, max_queued=1, result_ttl=60)
+    # No such merge engine: the job is accepted and fails in the worker.
+    job = manager.submit("merge", "nope", workbook, ".xlsx", "rozpocet_merged.xlsx", "application/octet-stream")
+    state = _wait(manager, job["id"])
+    assert state["state"] == FAILED and state["error"] and state["finished_at"]
+    assert sorted(os.listdir(tmp_path / job["id"])) == ["state.json"]  # input and partial result removed
+    assert manager.public_state(state)["expires_at"] == state["finished_at"] + 60
+
+
+@pytest.mark.parametrize("job_id", ["", "../jobs", "c" * 32])
+def test_unknown_job_is_none(tmp_path, job_id):
+    manager = JobManager(str(tmp_path), max_workers=1, max_queued=1, result_ttl=60)
+    assert manager.get(job_id) is None
+
+
+def test_finished_job_expires_after_its_ttl(tmp_path):
+    manager = JobManager(str(tmp_path), max_workers=1, max_queued=1, result_ttl=60)
+    _job(tmp_path, "d" * 32, state=DONE, finished_at=time.time() - 61)
+    assert manager.get("d" * 32) is None
+    assert manager.purge_expired() == 0
+    assert not os.path.exists(tmp_path / ("d" * 32))
+
+
+def test_lookups_purge_expired_jobs(tmp_path, monkeypatch):
+    manager = JobManager(str(tmp_path), max_workers=1, max_queued=1, result_ttl=60)
+    _job(tmp_path, "e" * 32, state=DONE, finished_at=time.time())
+    _job(tmp_path, "f" * 32, state=DONE, finished_at=time.time() - 61)
+    assert manager.get("e" * 32)["state"] == DONE
+    assert not os.path.exists(tmp_path / ("f" * 32))
+
+    # Throttled: the next expired job waits for the next interval.
+    _job(tmp_path, "1" * 32, state=DONE, finished_at=time.time() - 61)
+    manager.get("e" * 32)
+    assert os.path.exists(tmp_path / ("1" * 32))
+    monkeypatch.setattr(jobs, "PURGE_INTERVAL", 0)
+    manager.get("e" * 32)
+    assert not os.path.exists(tmp_path / ("1" * 32))
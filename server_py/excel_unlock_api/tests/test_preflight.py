@@ -0,0 +1,205 @@
+"""Pre-flight check: every kind of bad upload is told apart before an engine opens it."""
+
+from __future__ import annotations
+
+import struct
+import zipfile
+from typing import Optional
+
+import openpyxl
+import pytest
+
+from preflight import (
+    CFB_MAGIC,
+    RATIO_MIN_BYTES,
+    DamagedPackage,
+    EncryptedWorkbook,
+    LegacyWorkbook,
+    Limits,
+    NoSheets,
+    NotASpreadsheet,
+    NotAZipPackage,
+    PackageTooLarge,
+    SuspiciousCompression,
+    TooManySheets,
+    check_workbook,
+)
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    path = tmp_path / "rozpocet.xlsx"
+    wb = openpyxl.Workbook()
+    wb.active.title = "SO 01"
+    wb.active.append(["1", "HSV", "1", "K", "001", "Položka", "m3", 1.5, 100, 150])
+    wb.create_sheet("SO 02")
+    wb.save(path)
+    return path
+
+
+def _cfb(path, *streams: str, padding: int = 0) -> str:
+    """An OLE compound file whose directory names ``streams`` after ``padding`` other entries.
+
+    Sector 0 holds the FAT. The directory fills sectors 1..n, chained from
+    the last one backwards, so only a reader that follows the FAT finds all
+    of it.
+    """
+    entries = ["Root Entry", *(f"Storage {i}" for i in range(padding)), *streams]
+    sectors = -(-len(entries) // 4)
+    header = bytearray(512)
+    header[:8] = CFB_MAGIC
+    struct.pack_into("<H", header, 30, 9)  # 512-byte sectors
+    struct.pack_into("<I", header, 48, sectors)  # first directory sector
+    struct.pack_into("<I", header, 68, 0xFFFFFFFE)  # no DIFAT sectors
+    struct.pack_into("<109I", header, 76, 0, *[0xFFFFFFFF] * 108)
+    fat = [0xFFFFFFFF] * 128
+    fat[0] = 0xFFFFFFFD  # FAT sector
+    fat[1] = 0xFFFFFFFE  # end of the directory chain
+    for sector in range(2, sectors + 1):
+        fat[sector] = sector - 1
+    directory = bytearray(512 * sectors)
+    for i, name in enumerate(entries):
+        offset = (sectors - 1 - i // 4) * 512 + i % 4 * 128
+        encoded = name.encode("utf-16-le")
+        directory[offset : offset + len(encoded)] = encoded
+        struct.pack_into("<H", directory, offset + 64, len(encoded) + 2)
+    path.write_bytes(bytes(header + struct.pack("<128I", *fat) + directory))
+    return str(path)
+
+
+def _rewrite(source, target, replace: dict[str, Optional[bytes]], extra: Optional[dict[str, bytes]] = None) -> str:
+    """Copy the package at ``source`` with parts replaced (None: removed) or added."""
+    with zipfile.ZipFile(source) as zin, zipfile.ZipFile(target, "w", zipfile.ZIP_DEFLATED) as zout:
+        for info in zin.infolist():
+            if info.filename in replace:
+                if replace[info.filename] is not None:
+                    zout.writestr(info.filename, replace[info.filename])
+            else:
+                zout.writestr(info, zin.read(info))
+        for name, data in (extra or {}).items():
+            zout.writestr(name, data)
+    return str(target)
+
+
+def test_valid_workbook_is_profiled(workbook):
+    profile = check_workbook(str(workbook))
+    assert profile.sheets == 2
+    assert profile.file_bytes == workbook.stat().st_size
+    assert 0 < profile.largest_sheet_bytes <= profile.sheet_bytes < profile.uncompressed_bytes
+    assert not profile.has_vba
+
+
+def test_encrypted_workbook(tmp_path):
+    with pytest.raises(EncryptedWorkbook):
+        check_workbook(_cfb(tmp_path / "encrypted.xlsx", "EncryptionInfo", "EncryptedPackage"))
+
+
+def test_encrypted_workbook_with_padded_directory(tmp_path):
+    # Excel puts the data space storages before EncryptedPackage, well past the first sector.
+    with pytest.raises(EncryptedWorkbook):
+        check_workbook(_cfb(tmp_path / "encrypted.xlsx", "EncryptionInfo", "EncryptedPackage", padding=9))
+    with pytest.raises(LegacyWorkbook):
+        check_workbook(_cfb(tmp_path / "old.xlsx", "Workbook", padding=9))
+
+
+def test_legacy_workbook(tmp_path):
+    with pytest.raises(LegacyWorkbook):
+        check_workbook(_cfb(tmp_path / "old.xlsx", "Workbook", "SummaryInformation"))
+    truncated = tmp_path / "truncated.xlsx"
+    truncated.write_bytes(CFB_MAGIC + b"\0" * 100)
+    with pytest.raises(LegacyWorkbook):
+        check_workbook(str(truncated))
+
+
+@pytest.mark.parametrize("content", [b"", b"name;price\n", b"%PDF-1.7\n" + b"\0" * 600])
+def test_not_a_zip_package(tmp_path, content):
+    path = tmp_path / "not.xlsx"
+    path.write_bytes(content)
+    with pytest.raises(NotAZipPackage):
+        check_workbook(str(path))
+
+
+def test_truncated_package(workbook, tmp_path):
+    path = tmp_path / "truncated.xlsx"
+    path.write_bytes(workbook.read_bytes()[: workbook.stat().st_size // 2])
+    with pytest.raises(DamagedPackage):
+        check_workbook(str(path))
+
+
+def test_corrupt_content_types(workbook, tmp_path):
+    path = _rewrite(workbook, tmp_path / "bad.xlsx", {"[Content_Types].xml": b"<Types"})
+    with pytest.raises(DamagedPackage):
+        check_workbook(path)
+
+
+def test_missing_workbook_part(workbook, tmp_path):
+    path = _rewrite(workbook, tmp_path / "bad.xlsx", {"xl/workbook.xml": None})
+    with pytest.raises(DamagedPackage):
+        check_workbook(path)
+
+
+def test_zip_that_is_no_spreadsheet(workbook, tmp_path):
+    plain = tmp_path / "plain.xlsx"
+    with zipfile.ZipFile(plain, "w") as archive:
+        archive.writestr("readme.txt", "hello")
+    with pytest.raises(NotASpreadsheet):
+        check_workbook(str(plain))
+
+    document = _rewrite(
+        workbook,
+        tmp_path / "document.xlsx",
+        {
+            "[Content_Types].xml": b'<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            b'<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-'
+            b'officedocument.wordprocessingml.document.main+xml"/></Types>'
+        },
+    )
+    with pytest.raises(NotASpreadsheet):
+        check_workbook(document)
+
+
+def test_workbook_without_sheets(workbook, tmp_path):
+    with zipfile.ZipFile(workbook) as archive:
+        sheets = {info.filename: None for info in archive.infolist() if info.filename.startswith("xl/worksheets/")}
+    with pytest.raises(NoSheets):
+        check_workbook(_rewrite(workbook, tmp_path / "empty.xlsx", sheets))
+
+
+def test_too_many_sheets(workbook):
+    check_workbook(str(workbook), Limits(max_sheets=2))
+    with pytest.raises(TooManySheets):
+        check_workbook(str(workbook), Limits(max_sheets=1))
+
+
+def test_too_large_once_unpacked(workbook):
+    profile = check_workbook(str(workbook))
+    check_workbook(str(workbook), Limits(max_uncompressed_bytes=profile.uncompressed_bytes))
+    with pytest.raises(PackageTooLarge):
+        check_workbook(str(workbook), Limits(max_uncompressed_bytes=profile.uncompressed_bytes - 1))
+
+
+def test_part_compressed_beyond_the_ratio(workbook, tmp_path):
+    bomb = _rewrite(workbook, tmp_path / "bomb.xlsx", {}, {"xl/media/padding.bin": b"\0" * (4 * RATIO_MIN_BYTES)})
+    with pytest.raises(SuspiciousCompression):
+        check_workbook(bomb)
+    # Small parts are not checked on their own.
+    small = _rewrite(workbook, tmp_path / "small.xlsx", {}, {"xl/media/padding.bin": b"\0" * (RATIO_MIN_BYTES // 2)})
+    check_workbook(small)
+
+
+def test_package_compressed_beyond_the_ratio(workbook, tmp_path):
+    # Phantom rows spread over many parts, each too small for the per-part check.
+    phantom = b'<row r="1" s="1" customFormat="1"/>' * (RATIO_MIN_BYTES // 40)
+    parts = {f"xl/phantom/part{i}.xml": phantom for i in range(20)}
+    with zipfile.ZipFile(bomb := _rewrite(workbook, tmp_path / "bomb.xlsx", {}, parts)) as archive:
+        assert all(info.file_size < RATIO_MIN_BYTES for info in archive.infolist())
+    with pytest.raises(SuspiciousCompression, match="in total"):
+        check_workbook(bomb)
+
+    # A real workbook of that size stays well below the limit.
+    path = tmp_path / "large.xlsx"
+    wb = openpyxl.Workbook()
+    for row in range(20_000):
+        wb.active.append([row, "HSV", f"{100000 + row}", f"Položka {row}", "m3", row * 1.5, 100 + row % 7])
+    wb.save(path)
+    assert check_workbook(str(path)).uncompressed_bytes >= RATIO_MIN_BYTES
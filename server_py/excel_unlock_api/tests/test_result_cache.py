@@ -0,0 +1,106 @@
+"""Result cache: keys, hits, TTL expiry and LRU eviction."""
+
+from __future__ import annotations
+
+import os
+import time
+
+import pytest
+
+from result_cache import ResultCache, cache_key
+
+
+@pytest.fixture
+def result(tmp_path):
+    def make(name: str, size: int) -> str:
+        path = tmp_path / name
+        path.write_bytes(b"x" * size)
+        return str(path)
+
+    return make
+
+
+def _age(cache: ResultCache, key: str, seconds: float) -> None:
+    """Make ``key`` look last used ``seconds`` ago."""
+    then = time.time() - seconds
+    os.utime(cache._path(key), (then, then))
+
+
+def test_key_covers_content_operation_and_params():
+    key = cache_key("a" * 64, "merge", {"engine": "xml", "sheets": ["SO 01"]})
+    assert key == cache_key("a" * 64, "merge", {"sheets": ["SO 01"], "engine": "xml"})
+    assert key != cache_key("b" * 64, "merge", {"engine": "xml", "sheets": ["SO 01"]})
+    assert key != cache_key("a" * 64, "unlock", {"engine": "xml", "sheets": ["SO 01"]})
+    assert key != cache_key("a" * 64, "merge", {"engine": "streaming", "sheets": ["SO 01"]})
+
+
+def test_hit_returns_a_copy_and_refreshes_its_use(tmp_path, result):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=1000, ttl=3600)
+    assert cache.get("k") is None
+    source = result("out.xlsx", 10)
+    cache.put("k", source)
+    os.remove(source)
+
+    _age(cache, "k", 100)
+    path = cache.get("k")
+    with open(path, "rb") as fh:
+        assert fh.read() == b"x" * 10
+    assert time.time() - os.path.getmtime(path) < 10
+
+
+def test_opened_entry_outlives_its_eviction(tmp_path, result):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=15, ttl=3600)
+    cache.put("a", result("a.xlsx", 10))
+    with cache.open("a") as fh:
+        cache.put("b", result("b.xlsx", 10))  # evicts a
+        assert not os.path.exists(cache._path("a"))
+        assert fh.read() == b"x" * 10
+    assert cache.open("a") is None
+
+
+def test_expired_entry_is_a_miss_and_is_evicted(tmp_path, result):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=1000, ttl=60)
+    cache.put("old", result("old.xlsx", 10))
+    _age(cache, "old", 61)
+    assert cache.get("old") is None
+
+    cache.put("new", result("new.xlsx", 10))  # put() evicts
+    assert not os.path.exists(cache._path("old"))
+    assert cache.get("new") is not None
+
+
+def test_least_recently_used_entries_go_first(tmp_path, result):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=25, ttl=3600)
+    cache.put("a", result("a.xlsx", 10))
+    cache.put("b", result("b.xlsx", 10))
+    _age(cache, "a", 30)
+    _age(cache, "b", 20)
+    cache.get("a")  # a is now the most recently used
+
+    cache.put("c", result("c.xlsx", 10))
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+
+
+def test_entry_larger_than_the_cache_is_not_kept(tmp_path, result):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=25, ttl=3600)
+    cache.put("big", result("big.xlsx", 30))
+    assert cache.get("big") is None
+
+
+def test_disabled_cache_stores_nothing(tmp_path, result):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=0, ttl=3600)
+    cache.put("k", result("out.xlsx", 10))
+    assert cache.get("k") is None
+    assert not os.path.exists(cache.root)
+
+
+def test_eviction_ignores_foreign_files(tmp_path, result):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=5, ttl=3600)
+    os.makedirs(cache.root)
+    foreign = os.path.join(cache.root, "README")
+    with open(foreign, "w") as fh:
+        fh.write("not an entry")
+    cache.put("k", result("out.xlsx", 10))
+    assert os.path.exists(foreign)
+    assert os.listdir(cache.root) == ["README"]  # nor any temporary copy
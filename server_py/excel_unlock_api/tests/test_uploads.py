@@ -0,0 +1,166 @@
+"""Chunked uploads keep only whole, verified chunks and refuse what does not add up."""
+
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import io
+import os
+import time
+
+import pytest
+
+from uploads import (
+    ChunkCorrupt,
+    OffsetMismatch,
+    UploadBusy,
+    UploadClosed,
+    UploadCorrupt,
+    UploadIncomplete,
+    UploadNotFound,
+    UploadStore,
+    UploadTooLarge,
+)
+
+DATA = bytes(range(256)) * 40
+
+
+@pytest.fixture
+def store(tmp_path):
+    return UploadStore(str(tmp_path / "uploads"), max_bytes=len(DATA), ttl=3600)
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _create(store, **kwargs) -> str:
+    return store.create("rozpocet.xlsx", **kwargs)["id"]
+
+
+def _append(store, upload_id: str, offset: int, data: bytes, chunk_sha256=None) -> dict:
+    return store.append(upload_id, offset, io.BytesIO(data), chunk_sha256)
+
+
+def test_chunks_assemble_in_order(store):
+    upload_id = _create(store, length=len(DATA), sha256=_sha256(DATA))
+    assert _append(store, upload_id, 0, DATA[:1000], _sha256(DATA[:1000]))["offset"] == 1000
+    assert _append(store, upload_id, 1000, DATA[1000:])["offset"] == len(DATA)
+
+    assembled = store.finish(upload_id)
+    with open(assembled.path, "rb") as fh:
+        assert fh.read() == DATA
+    assert (assembled.filename, assembled.sha256) == ("rozpocet.xlsx", _sha256(DATA))
+    assert os.path.splitext(assembled.path)[1] == ".xlsx"
+
+
+def test_offset_mismatch_reports_the_current_offset(store):
+    upload_id = _create(store)
+    _append(store, upload_id, 0, DATA[:100])
+    for offset in (0, 50, 200):
+        with pytest.raises(OffsetMismatch) as excinfo:
+            _append(store, upload_id, offset, DATA[offset : offset + 100])
+        assert excinfo.value.offset == 100
+    assert store.get(upload_id)["offset"] == 100
+
+
+def test_chunk_sha_mismatch_discards_the_chunk(store):
+    upload_id = _create(store)
+    _append(store, upload_id, 0, DATA[:100])
+    with pytest.raises(ChunkCorrupt):
+        _append(store, upload_id, 100, DATA[100:200], _sha256(b"something else"))
+    assert store.get(upload_id)["offset"] == 100
+    assert _append(store, upload_id, 100, DATA[100:200], _sha256(DATA[100:200]).upper())["offset"] == 200
+
+
+def test_chunk_past_the_declared_length_is_discarded(store):
+    upload_id = _create(store, length=150)
+    _append(store, upload_id, 0, DATA[:100])
+    with pytest.raises(UploadTooLarge):
+        _append(store, upload_id, 100, DATA[100:200])
+    assert store.get(upload_id)["offset"] == 100
+
+
+def test_upload_over_the_size_limit_is_refused(store):
+    with pytest.raises(UploadTooLarge):
+        _create(store, length=len(DATA) + 1)
+    upload_id = _create(store)
+    with pytest.raises(UploadTooLarge):
+        _append(store, upload_id, 0, DATA + b"x")
+    assert store.get(upload_id)["offset"] == 0
+
+
+def test_finish_checks_length_and_sha256(store):
+    upload_id = _create(store, length=len(DATA))
+    _append(store, upload_id, 0, DATA[:100])
+    with pytest.raises(UploadIncomplete) as excinfo:
+        store.finish(upload_id)
+    assert excinfo.value.offset == 100
+    assert store.get(upload_id)["complete"] is False  # the client can go on
+
+    upload_id = _create(store, sha256=_sha256(b"something else"))
+    _append(store, upload_id, 0, DATA)
+    with pytest.raises(UploadCorrupt):
+        store.finish(upload_id)
+
+
+def test_finished_upload_takes_no_more_chunks(store):
+    upload_id = _create(store)
+    _append(store, upload_id, 0, DATA[:100])
+    first = store.finish(upload_id)
+    with pytest.raises(UploadClosed):
+        _append(store, upload_id, 100, DATA[100:200])
+    assert store.finish(upload_id) == first  # and can be processed again
+
+
+def test_chunk_racing_finish_is_refused(store, monkeypatch):
+    upload_id = _create(store)
+    _append(store, upload_id, 0, DATA[:100])
+    load = store._load
+
+    def finish_after_load(upload_id):
+        loaded = load(upload_id)
+        monkeypatch.setattr(store, "_load", load)
+        store.finish(upload_id)  # another request, between the check and the lock
+        return loaded
+
+    monkeypatch.setattr(store, "_load", finish_after_load)
+    with pytest.raises(UploadClosed):
+        _append(store, upload_id, 100, DATA[100:200])
+    state = store.get(upload_id)
+    assert (state["offset"], state["complete"]) == (100, True)
+    assert store.finish(upload_id).sha256 == _sha256(DATA[:100])
+
+
+def test_locked_upload_is_busy(store):
+    upload_id = _create(store)
+    path = os.path.join(store.root, upload_id, "data.xlsx")
+    with open(path, "rb") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        with pytest.raises(UploadBusy):
+            _append(store, upload_id, 0, DATA[:100])
+        with pytest.raises(UploadBusy):
+            store.finish(upload_id)
+
+
+@pytest.mark.parametrize("upload_id", ["", "../etc", "0" * 32, "A" * 32])
+def test_unknown_upload_is_not_found(store, upload_id):
+    with pytest.raises(UploadNotFound):
+        store.get(upload_id)
+
+
+def test_expired_uploads_are_purged(store, monkeypatch):
+    old = _create(store)
+    leftover = os.path.join(store.root, "f" * 32)  # a create() that died before its state
+    os.makedirs(leftover)
+    keep = os.path.join(store.root, "not-an-upload")
+    os.makedirs(keep)
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + store.ttl + 1)
+    with pytest.raises(UploadNotFound):
+        store.get(old)  # expired uploads are gone before they are purged
+    fresh = _create(store)  # create() purges
+
+    assert sorted(os.listdir(store.root)) == sorted([fresh, "not-an-upload"])
+    assert store.get(fresh)["offset"] == 0
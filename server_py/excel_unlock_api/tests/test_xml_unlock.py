@@ -0,0 +1,101 @@
+"""XML-level unlock: protection is stripped however the XML is chunked, and styles are unlocked."""
+
+from __future__ import annotations
+
+import io
+import zipfile
+
+import openpyxl
+import pytest
+from openpyxl.styles import Protection
+
+from xml_unlock import strip_sheet_protection, strip_workbook_protection, unlock_cell_styles, unlock_package
+
+SHEET = (
+    b'<?xml version="1.0" encoding="UTF-8"?>'
+    b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    b'<sheetPr><tabColor rgb="FF0000"/></sheetPr>'
+    b'<sheetData><row r="1"><c r="A1" t="inlineStr"><is><t>a &lt; b</t></is></c></row></sheetData>'
+    b'<sheetProtection sheet="1" objects="1" scenarios="1" password="CC1A"/>'
+    b'<sheetProtectionExtra keep="1"/>'
+    b"<x:sheetProtection sheet='1'>\n  </x:sheetProtection>"
+    b"<pageMargins left=\"0.7\"/></worksheet>"
+)
+EXPECTED = (
+    SHEET.replace(b'<sheetProtection sheet="1" objects="1" scenarios="1" password="CC1A"/>', b"")
+    .replace(b"<x:sheetProtection sheet='1'>\n  </x:sheetProtection>", b"")
+)
+
+
+def _chunks(data: bytes, size: int) -> list[bytes]:
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+def test_protection_is_stripped_in_one_chunk():
+    assert b"".join(strip_sheet_protection([SHEET])) == EXPECTED
+    assert b"sheetProtectionExtra" in EXPECTED  # a longer tag name is not protection
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 16, 31, 64])
+def test_protection_is_stripped_across_chunk_boundaries(size):
+    assert b"".join(strip_sheet_protection(_chunks(SHEET, size))) == EXPECTED
+
+
+def test_every_split_point_of_a_protection_tag():
+    for cut in range(1, len(SHEET)):
+        out = b"".join(strip_sheet_protection([SHEET[:cut], SHEET[cut:]]))
+        assert out == EXPECTED, cut
+
+
+def test_unprotected_sheet_passes_unchanged():
+    xml = SHEET.split(b"<sheetProtection ")[0] + b"</worksheet>"
+    assert b"".join(strip_sheet_protection(_chunks(xml, 10))) == xml
+    assert list(strip_sheet_protection([])) == []
+
+
+def test_workbook_protection_is_stripped():
+    xml = b'<workbook><workbookPr/><workbookProtection lockStructure="1"/><sheets/></workbook>'
+    assert strip_workbook_protection(xml) == b"<workbook><workbookPr/><sheets/></workbook>"
+
+
+def test_cell_styles_are_unlocked():
+    xml = (
+        b'<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        b'<cellStyleXfs count="1"><xf numFmtId="0"/></cellStyleXfs>'
+        b'<cellXfs count="3">'
+        b'<xf numFmtId="0" applyProtection="0"/>'
+        b'<xf numFmtId="1"><alignment wrapText="1"/><protection locked="1" hidden="1"/></xf>'
+        b'<xf numFmtId="2"><extLst><ext uri="x"/></extLst></xf>'
+        b"</cellXfs></styleSheet>"
+    )
+    out = unlock_cell_styles(xml)
+    assert b'<cellStyleXfs count="1"><xf numFmtId="0"/></cellStyleXfs>' in out  # only cellXfs
+    assert out.count(b'<protection locked="0" hidden="0"/>') == 3
+    assert out.count(b'applyProtection="1"') == 3 and b'applyProtection="0"' not in out
+    assert b'<alignment wrapText="1"/><protection locked="0" hidden="0"/></xf>' in out
+    assert b'<protection locked="0" hidden="0"/><extLst>' in out  # protection goes before extLst
+
+
+def test_unlocked_package_opens_unprotected(tmp_path):
+    path = tmp_path / "locked.xlsx"
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws["A1"] = "zamčeno"
+    ws["A1"].protection = Protection(locked=True, hidden=True)
+    ws.protection.sheet = True
+    ws.protection.password = "heslo"
+    wb.security.lockStructure = True
+    wb.save(path)
+
+    out = io.BytesIO()
+    with open(path, "rb") as source:
+        unlock_package(source, out)
+    out.seek(0)
+    with zipfile.ZipFile(out) as archive:
+        assert archive.testzip() is None
+    unlocked = openpyxl.load_workbook(out)
+    ws = unlocked.active
+    assert ws["A1"].value == "zamčeno"
+    assert not ws.protection.sheet
+    assert ws["A1"].protection.locked is False and ws["A1"].protection.hidden is False
+    assert unlocked.security is None or not unlocked.security.lockStructure
@@ -0,0 +1,288 @@
+"""Chunked, resumable uploads for workbooks too large for one request.
+
+A client creates an upload, then appends the file chunk by chunk. Each
+chunk names the offset it starts at; a chunk that does not start where the
+data ends is refused with the current offset, so after a dropped
+connection the client asks for the offset and continues from there instead
+of starting over. Every upload has its own directory::
+
+    <root>/<upload id>/data.xlsx   the bytes received so far (named after the upload's extension)
+    <root>/<upload id>/state.json  name, declared length and hashes, replaced atomically
+
+The offset is the size of the data file, so it cannot disagree with what is on
+disk. A chunk is appended under an exclusive lock on that file and cut off
+again if it fails half way or does not match its SHA-256, so any server
+worker can take the next chunk and the data only ever grows by whole
+chunks.
+
+``finish()`` closes an upload for writing, checks the declared length and
+SHA-256 of the whole file and hands out the assembled file. /unlock, /merge
+and /jobs process it in place, so the bytes are never copied into memory
+again. Uploads are deleted ``ttl`` seconds after their last use.
+"""
+
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import BinaryIO, Iterator, Optional
+
+UPLOAD_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+STATE_FILE = "state.json"
+# openpyxl tells workbooks from macro workbooks by the file extension.
+DATA_FILE = "data{ext}"
+CHUNK_SIZE = 1024 * 1024
+
+# Fields of state.json that are safe to hand out to clients.
+PUBLIC_FIELDS = ("id", "filename", "length", "complete", "created_at", "updated_at")
+
+
+class UploadNotFound(Exception):
+    pass
+
+
+class UploadBusy(Exception):
+    """Another request is appending to or finishing the same upload."""
+
+
+class UploadClosed(Exception):
+    """The upload was finished; it takes no more chunks."""
+
+
+class OffsetMismatch(Exception):
+    def __init__(self, offset: int):
+        super().__init__(offset)
+        self.offset = offset
+
+
+class ChunkCorrupt(Exception):
+    """The chunk does not match the SHA-256 sent with it; it was not kept."""
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UploadIncomplete(Exception):
+    def __init__(self, offset: int):
+        super().__init__(offset)
+        self.offset = offset
+
+
+class UploadCorrupt(Exception):
+    """The assembled file does not match the SHA-256 declared for it."""
+
+
+@dataclass(frozen=True)
+class AssembledUpload:
+    """A finished upload, read in place from the upload store."""
+
+    path: str
+    filename: str
+    sha256: str
+
+    def save(self, dst: str) -> None:
+        """Put the file at ``dst`` (the ``FileStorage.save`` of a form upload)."""
+        try:
+            os.link(self.path, dst)
+        except OSError:
+            shutil.copyfile(self.path, dst)
+
+
+def _write_state(upload_dir: str, state: dict) -> None:
+    state["updated_at"] = time.time()
+    tmp = os.path.join(upload_dir, STATE_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(state, fh)
+    os.replace(tmp, os.path.join(upload_dir, STATE_FILE))
+
+
+def _read_state(upload_dir: str) -> Optional[dict]:
+    try:
+        with open(os.path.join(upload_dir, STATE_FILE), encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+class UploadStore:
+    def __init__(self, root: str, max_bytes: int, ttl: float):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+    def _upload_dir(self, upload_id: str) -> Optional[str]:
+        if not UPLOAD_ID_RE.match(upload_id or ""):
+            return None
+        return os.path.join(self.root, upload_id)
+
+    def _load(self, upload_id: str) -> tuple[str, dict]:
+        upload_dir = self._upload_dir(upload_id)
+        state = _read_state(upload_dir) if upload_dir is not None else None
+        if state is None or self._is_expired(state):
+            raise UploadNotFound()
+        return upload_dir, state
+
+    @staticmethod
+    def _reload(upload_dir: str) -> dict:
+        """The state as it is now, read under the data file's lock."""
+        state = _read_state(upload_dir)
+        if state is None:
+            raise UploadNotFound()
+        return state
+
+    @staticmethod
+    def _data_path(upload_dir: str, state: dict) -> str:
+        return os.path.join(upload_dir, DATA_FILE.format(ext=state["ext"]))
+
+    @contextmanager
+    def _locked_data(self, upload_dir: str, state: dict, mode: str) -> Iterator[BinaryIO]:
+        try:
+            fh = open(self._data_path(upload_dir, state), mode)
+        except FileNotFoundError:
+            raise UploadNotFound() from None
+        with fh:
+            try:
+                fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise UploadBusy() from None
+            yield fh
+
+    def create(self, filename: str, length: Optional[int] = None, sha256: Optional[str] = None) -> dict:
+        """Start an upload of ``filename``; ``length`` and ``sha256`` of the whole file are optional."""
+        if length is not None and length > self.max_bytes:
+            raise UploadTooLarge()
+        self.purge_expired()
+
+        upload_id = uuid.uuid4().hex
+        upload_dir = os.path.join(self.root, upload_id)
+        os.makedirs(upload_dir)
+        try:
+            state = {
+                "id": upload_id,
+                "filename": filename,
+                "ext": os.path.splitext(filename)[1].lower(),
+                "length": length,
+                "sha256": sha256.lower() if sha256 else None,
+                "content_sha256": None,
+                "complete": False,
+                "created_at": time.time(),
+            }
+            open(self._data_path(upload_dir, state), "wb").close()
+            _write_state(upload_dir, state)
+        except BaseException:
+            shutil.rmtree(upload_dir, ignore_errors=True)
+            raise
+        return self.public_state(state, 0)
+
+    def get(self, upload_id: str) -> dict:
+        """Public state of an upload, with the current ``offset``."""
+        upload_dir, state = self._load(upload_id)
+        return self.public_state(state, os.path.getsize(self._data_path(upload_dir, state)))
+
+    def append(self, upload_id: str, offset: int, stream: BinaryIO, chunk_sha256: Optional[str] = None) -> dict:
+        """Append the chunk read from ``stream`` at ``offset``. Returns the public state.
+
+        The chunk is kept whole or not at all: a read error, an oversized
+        upload or a ``chunk_sha256`` mismatch cuts the data back to ``offset``.
+        """
+        upload_dir, state = self._load(upload_id)
+        if state["complete"]:
+            raise UploadClosed()
+        limit = self.max_bytes if state["length"] is None else min(state["length"], self.max_bytes)
+
+        with self._locked_data(upload_dir, state, "r+b") as fh:
+            # A finish() may have closed the upload since it was loaded; it is
+            # then being processed in place and must not change.
+            state = self._reload(upload_dir)
+            if state["complete"]:
+                raise UploadClosed()
+            size = os.fstat(fh.fileno()).st_size
+            if offset != size:
+                raise OffsetMismatch(size)
+            fh.seek(size)
+            digest = hashlib.sha256()
+            written = 0
+            try:
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+                    written += len(chunk)
+                    if size + written > limit:
+                        raise UploadTooLarge()
+                    digest.update(chunk)
+                    fh.write(chunk)
+                if chunk_sha256 is not None and digest.hexdigest() != chunk_sha256.lower():
+                    raise ChunkCorrupt()
+                fh.flush()
+            except BaseException:
+                fh.truncate(size)
+                raise
+            # Under the lock, so a concurrent finish() sees this chunk's state.
+            _write_state(upload_dir, state)
+        return self.public_state(state, size + written)
+
+    def finish(self, upload_id: str) -> AssembledUpload:
+        """Close an upload for writing and return the assembled file.
+
+        Raises ``UploadIncomplete`` while fewer than the declared ``length``
+        bytes arrived and ``UploadCorrupt`` when the file does not match the
+        declared SHA-256. An upload can be finished (and processed) again.
+        """
+        upload_dir, state = self._load(upload_id)
+        path = self._data_path(upload_dir, state)
+        with self._locked_data(upload_dir, state, "rb") as fh:
+            state = self._reload(upload_dir)
+            size = os.fstat(fh.fileno()).st_size
+            if state["length"] is not None and size != state["length"]:
+                raise UploadIncomplete(size)
+            if state["content_sha256"] is None:
+                digest = hashlib.sha256()
+                for chunk in iter(lambda: fh.read(CHUNK_SIZE), b""):
+                    digest.update(chunk)
+                if state["sha256"] is not None and digest.hexdigest() != state["sha256"]:
+                    raise UploadCorrupt()
+                state["content_sha256"] = digest.hexdigest()
+            state["complete"] = True
+            _write_state(upload_dir, state)
+        return AssembledUpload(path, state["filename"], state["content_sha256"])
+
+    def delete(self, upload_id: str) -> None:
+        upload_dir, _ = self._load(upload_id)
+        shutil.rmtree(upload_dir, ignore_errors=True)
+
+    def public_state(self, state: dict, offset: int) -> dict:
+        public = {key: state.get(key) for key in PUBLIC_FIELDS}
+        public["offset"] = offset
+        public["expires_at"] = state["updated_at"] + self.ttl
+        return public
+
+    def _is_expired(self, state: dict) -> bool:
+        return state.get("updated_at", 0) + self.ttl < time.time()
+
+    def purge_expired(self) -> None:
+        """Delete uploads unused for ``ttl`` seconds, and leftovers without a state."""
+        try:
+            entries = os.listdir(self.root)
+        except FileNotFoundError:
+            return
+
+        now = time.time()
+        for upload_id in entries:
+            upload_dir = self._upload_dir(upload_id)
+            if upload_dir is None:
+                continue
+            state = _read_state(upload_dir)
+            if state is None:
+                stale = os.path.getmtime(upload_dir) + self.ttl < now
+            else:
+                stale = self._is_expired(state)
+            if stale:
+                shutil.rmtree(upload_dir, ignore_errors=True)
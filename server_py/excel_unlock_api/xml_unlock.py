@@ -0,0 +1,213 @@
+"""Streaming unlock of .xlsx/.xlsm packages at the ZIP/XML level.
+
+The workbook is never loaded into openpyxl. Worksheet parts are streamed
+through a filter that drops ``<sheetProtection>``, ``xl/workbook.xml`` loses
+``<workbookProtection>`` and the ``cellXfs`` table in ``xl/styles.xml`` is
+patched to ``locked="0" hidden="0"``. Every other part (including
+``vbaProject.bin``) is copied as raw compressed bytes without inflating it,
+unless ``ZipOptions.passthrough`` is off.
+
+``StyleUnlockingZipFile`` applies the same ``cellXfs`` patch to a package
+that openpyxl is writing.
+
+Needs ../excel_merge_tool on ``sys.path`` for zip_output (see processing.py).
+"""
+
+from __future__ import annotations
+
+import re
+import zipfile
+from typing import BinaryIO, Callable, Iterable, Iterator, Optional
+from xml.etree import ElementTree
+
+from zip_output import OutputZipFile, ZipOptions, copy_member_raw
+
+CHUNK_SIZE = 1024 * 1024
+
+CONTENT_TYPES_PART = "[Content_Types].xml"
+CT_NS = "{http://schemas.openxmlformats.org/package/2006/content-types}"
+
+WORKSHEET_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"
+STYLES_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"
+WORKBOOK_CONTENT_TYPES = {
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml",
+    "application/vnd.ms-excel.sheet.macroEnabled.main+xml",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.template.main+xml",
+    "application/vnd.ms-excel.template.macroEnabled.main+xml",
+}
+
+_PREFIX = rb"(?:[A-Za-z_][\w.-]*:)?"
+
+_SHEET_PROTECTION = re.compile(
+    rb"<" + _PREFIX + rb"sheetProtection\b[^>]*?(?:/>|>\s*</" + _PREFIX + rb"sheetProtection\s*>)"
+)
+_SHEET_PROTECTION_START = re.compile(rb"<" + _PREFIX + rb"sheetProtection\b")
+
+_WORKBOOK_PROTECTION = re.compile(
+    rb"<" + _PREFIX + rb"workbookProtection\b[^>]*?(?:/>|>\s*</" + _PREFIX + rb"workbookProtection\s*>)"
+)
+
+_CELL_XFS = re.compile(
+    rb"(<(" + _PREFIX + rb")cellXfs\b[^>]*>)(.*?)(</\2cellXfs\s*>)",
+    re.DOTALL,
+)
+_XF = re.compile(
+    rb"<(" + _PREFIX + rb")xf\b([^>]*?)(/>|>(.*?)</\1xf\s*>)",
+    re.DOTALL,
+)
+_APPLY_PROTECTION = re.compile(rb"""\sapplyProtection\s*=\s*(["'])[^"']*\1""")
+_PROTECTION = re.compile(
+    rb"<" + _PREFIX + rb"protection\b[^>]*?(?:/>|>\s*</" + _PREFIX + rb"protection\s*>)"
+)
+_EXT_LST_START = re.compile(rb"<" + _PREFIX + rb"extLst\b")
+
+
+def _part_name(name: str) -> str:
+    return name.lstrip("/")
+
+
+def classify_parts(archive: zipfile.ZipFile) -> tuple[set[str], set[str], set[str]]:
+    """Return (worksheet, workbook, styles) part names from [Content_Types].xml."""
+    worksheets: set[str] = set()
+    workbooks: set[str] = set()
+    styles: set[str] = set()
+
+    with archive.open(CONTENT_TYPES_PART) as fh:
+        root = ElementTree.parse(fh).getroot()
+
+    for override in root.iter(f"{CT_NS}Override"):
+        name = _part_name(override.get("PartName", ""))
+        content_type = override.get("ContentType", "")
+        if content_type == WORKSHEET_CONTENT_TYPE:
+            worksheets.add(name)
+        elif content_type in WORKBOOK_CONTENT_TYPES:
+            workbooks.add(name)
+        elif content_type == STYLES_CONTENT_TYPE:
+            styles.add(name)
+
+    return worksheets, workbooks, styles
+
+
+def strip_sheet_protection(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Remove ``<sheetProtection>`` from a stream of worksheet XML chunks.
+
+    Everything from the last ``<`` of a chunk is held back so a tag is never
+    split across two chunks when the pattern is applied.
+    """
+    pending = b""
+    for chunk in chunks:
+        buf = _SHEET_PROTECTION.sub(b"", pending + chunk)
+        cut = buf.rfind(b"<")
+        unfinished = _SHEET_PROTECTION_START.search(buf)
+        if unfinished is not None:
+            cut = unfinished.start() if cut == -1 else min(cut, unfinished.start())
+        if cut == -1:
+            pending = b""
+            if buf:
+                yield buf
+            continue
+        pending = buf[cut:]
+        if cut:
+            yield buf[:cut]
+
+    if pending:
+        yield _SHEET_PROTECTION.sub(b"", pending)
+
+
+def strip_workbook_protection(xml: bytes) -> bytes:
+    return _WORKBOOK_PROTECTION.sub(b"", xml)
+
+
+def _unlock_xf(match: re.Match) -> bytes:
+    prefix, attrs, _, body = match.group(1), match.group(2), match.group(3), match.group(4)
+    attrs = _APPLY_PROTECTION.sub(b"", attrs).rstrip() + b' applyProtection="1"'
+    protection = b"<" + prefix + b'protection locked="0" hidden="0"/>'
+
+    body = _PROTECTION.sub(b"", body or b"")
+    ext = _EXT_LST_START.search(body)
+    if ext is None:
+        body = body + protection
+    else:
+        body = body[: ext.start()] + protection + body[ext.start():]
+
+    return b"<" + prefix + b"xf" + attrs + b">" + body + b"</" + prefix + b"xf>"
+
+
+def unlock_cell_styles(xml: bytes) -> bytes:
+    """Mark every ``cellXfs`` entry as unlocked and visible."""
+
+    def _patch_table(match: re.Match) -> bytes:
+        return match.group(1) + _XF.sub(_unlock_xf, match.group(3)) + match.group(4)
+
+    return _CELL_XFS.sub(_patch_table, xml, count=1)
+
+
+class StyleUnlockingZipFile(OutputZipFile):
+    """``OutputZipFile`` that unlocks ``cellXfs`` in ``styles_part`` as it is written.
+
+    For writers that emit whole parts with ``writestr`` (openpyxl's
+    ``ExcelWriter``): every cell, row and column style of the package ends
+    up unlocked without a single cell being touched.
+    """
+
+    def __init__(self, file, styles_part: str, **kwargs):
+        super().__init__(file, **kwargs)
+        self.styles_part = styles_part
+
+    def writestr(self, zinfo_or_arcname, data, *args, **kwargs) -> None:
+        name = zinfo_or_arcname.filename if isinstance(zinfo_or_arcname, zipfile.ZipInfo) else zinfo_or_arcname
+        if name == self.styles_part:
+            data = unlock_cell_styles(data.encode("utf-8") if isinstance(data, str) else data)
+        super().writestr(zinfo_or_arcname, data, *args, **kwargs)
+
+
+def _read_chunks(archive: zipfile.ZipFile, info: zipfile.ZipInfo) -> Iterator[bytes]:
+    with archive.open(info) as fh:
+        while True:
+            block = fh.read(CHUNK_SIZE)
+            if not block:
+                return
+            yield block
+
+
+def _new_entry(archive: OutputZipFile, info: zipfile.ZipInfo) -> zipfile.ZipInfo:
+    zinfo = archive.entry(info.filename, info.date_time)
+    zinfo.external_attr = info.external_attr
+    return zinfo
+
+
+def unlock_package(
+    source: BinaryIO,
+    target: BinaryIO,
+    progress: Optional[Callable[[int, int], None]] = None,
+    zip_options: Optional[ZipOptions] = None,
+) -> None:
+    """Write an unlocked copy of the workbook package ``source`` into ``target``.
+
+    ``progress`` is called with (worksheets done, 0) after each worksheet
+    part; rows are never parsed here. Rewritten parts are compressed as
+    ``zip_options`` say.
+    """
+    with zipfile.ZipFile(source) as zin, OutputZipFile(target, zip_options) as zout:
+        worksheets, workbooks, styles = classify_parts(zin)
+        sheets_done = 0
+
+        for info in zin.infolist():
+            name = info.filename
+            if name in worksheets:
+                force_zip64 = info.file_size > zipfile.ZIP64_LIMIT
+                with zout.open(_new_entry(zout, info), "w", force_zip64=force_zip64) as out:
+                    for block in strip_sheet_protection(_read_chunks(zin, info)):
+                        out.write(block)
+                sheets_done += 1
+                if progress is not None:
+                    progress(sheets_done, 0)
+            elif name in workbooks:
+                zout.writestr(_new_entry(zout, info), strip_workbook_protection(zin.read(info)))
+            elif name in styles:
+                zout.writestr(_new_entry(zout, info), unlock_cell_styles(zin.read(info)))
+            elif zout.options.passthrough:
+                copy_member_raw(zin, zout, info)
+            else:
+                zout.writestr(_new_entry(zout, info), zin.read(info))
+